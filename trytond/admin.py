@@ -17,6 +17,10 @@ logger = logging.getLogger(__name__)
 
 
 def run(options):
+    if options.cache_stats:
+        for db_name in options.database_names:
+            print_cache_stats(db_name)
+        return
     Database = backend.get('Database')
     init = {}
     for db_name in options.database_names:
@@ -102,3 +106,26 @@ def run(options):
                 User.write([admin], {
                         'password': password,
                         })
+
+
+def print_cache_stats(db_name):
+    from trytond import iwc
+    columns = ['hit', 'miss', 'set', 'eviction', 'clear', 'size', 'memory']
+    stats = {}
+    processes = iwc.collect_cache_stats(db_name)
+    for process_stats in processes.itervalues():
+        for name, values in process_stats.iteritems():
+            total = stats.setdefault(name, dict.fromkeys(columns, 0))
+            for column in columns:
+                value = values.get(column) or 0
+                if column == 'size':
+                    # size_limit applies per process
+                    total[column] = max(total[column], value)
+                else:
+                    total[column] += value
+    sys.stdout.write('%s: %s processes\n' % (db_name, len(processes)))
+    sys.stdout.write('%-40s' % 'name'
+        + ''.join('%12s' % c for c in columns) + '\n')
+    for name in sorted(stats):
+        sys.stdout.write('%-40s' % name
+            + ''.join('%12s' % stats[name][c] for c in columns) + '\n')
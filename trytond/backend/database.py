@@ -25,11 +25,12 @@ class DatabaseInterface(object):
         '''
         raise NotImplementedError
 
-    def get_connection(self, autocommit, readonly=False):
+    def get_connection(self, autocommit, readonly=False, replica=False):
         '''Retrieve a connection on the database
 
         :param autocommit: a boolean to activate autocommit
         :param readonly: a boolean to specify if the transaction is readonly
+        :param replica: a boolean to allow a readonly connection on a replica
         '''
         raise NotImplementedError
 
@@ -40,6 +41,10 @@ class DatabaseInterface(object):
         '''
         raise NotImplementedError
 
+    def is_replica(self, connection):
+        'Return True if the connection is on a replica'
+        return False
+
     def close(self):
         '''
         Close all connection
@@ -139,6 +144,30 @@ class DatabaseInterface(object):
         '''
         raise NotImplementedError
 
+    def nextids(self, connection, table, count):
+        '''
+        Return a list of count next sequenced ids for a table or None if it
+        is not supported.
+
+        :param connection: a connection on the database
+        :param table: the table name
+        :param count: the number of ids
+        '''
+        return None
+
+    def copy_from(self, connection, table, columns, rows):
+        '''
+        Insert the rows into the table.
+
+        :param connection: a connection on the database
+        :param table: a python-sql Table
+        :param columns: a list of python-sql Column
+        :param rows: a list of lists of values in the order of the columns
+        '''
+        cursor = connection.cursor()
+        query, _ = tuple(table.insert(columns, [[None] * len(columns)]))
+        cursor.executemany(query, rows)
+
     def has_returning(self):
         '''
         Return True if database implements RETURNING clause in INSERT or UPDATE
@@ -151,3 +180,21 @@ class DatabaseInterface(object):
     def has_multirow_insert(self):
         'Return True if database supports multirow insert'
         return False
+
+    def has_update_from(self):
+        'Return True if database supports UPDATE with FROM of VALUES'
+        return False
+
+    def cache_generation(self):
+        '''
+        Return a value which changes each time the caches are reset by any
+        process or None if it is not supported.
+        '''
+        return None
+
+    def notify_cache(self):
+        '''
+        Notify at the commit of the current transaction that the caches have
+        been reset.
+        '''
+        pass
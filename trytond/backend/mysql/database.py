@@ -1,5 +1,6 @@
 # This file is part of Tryton.  The COPYRIGHT file at the top level of
 # this repository contains the full copyright notices and license terms.
+from trytond import timing
 from trytond.backend.database import DatabaseInterface
 from trytond.config import config, parse_uri
 import MySQLdb
@@ -17,6 +18,13 @@ from sql.functions import Extract, Overlay, CharLength
 __all__ = ['Database', 'DatabaseIntegrityError', 'DatabaseOperationalError']
 
 
+class MySQLCursor(MySQLdb.cursors.Cursor):
+
+    @timing.query
+    def execute(self, query, args=None):
+        return super(MySQLCursor, self).execute(query, args)
+
+
 class MySQLExtract(Extract):
 
     def is_epoch(self):
@@ -80,7 +88,7 @@ class Database(DatabaseInterface):
     def connect(self):
         return self
 
-    def get_connection(self, autocommit=False, readonly=False):
+    def get_connection(self, autocommit=False, readonly=False, replica=False):
         conv = MySQLdb.converters.conversions.copy()
         conv[float] = lambda value, _: repr(value)
         conv[MySQLdb.constants.FIELD_TYPE.TIME] = MySQLdb.times.Time_or_None
@@ -90,6 +98,7 @@ class Database(DatabaseInterface):
             'use_unicode': True,
             'charset': 'utf8',
             'conv': conv,
+            'cursorclass': MySQLCursor,
         }
         uri = parse_uri(config.get('database', 'uri'))
         assert uri.scheme == 'mysql'
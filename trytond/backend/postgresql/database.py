@@ -1,11 +1,18 @@
 # This file is part of Tryton.  The COPYRIGHT file at the top level of
 # this repository contains the full copyright notices and license terms.
 import time
+import itertools
 import logging
 import re
 import os
 import urllib
+import select
+import threading
+import binascii
+import datetime
+from collections import deque
 from decimal import Decimal
+from io import BytesIO
 
 try:
     from psycopg2cffi import compat
@@ -13,12 +20,14 @@ try:
 except ImportError:
     pass
 from psycopg2 import connect
-from psycopg2.pool import ThreadedConnectionPool, PoolError
+from psycopg2.pool import PoolError
 from psycopg2.extensions import ISOLATION_LEVEL_REPEATABLE_READ
 from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE
+from psycopg2.extensions import TRANSACTION_STATUS_UNKNOWN
 from psycopg2.extensions import register_type, register_adapter
 from psycopg2.extensions import UNICODE, AsIs
-from psycopg2.extensions import cursor
+from psycopg2.extensions import cursor, connection, Binary
 try:
     from psycopg2.extensions import PYDATE, PYDATETIME, PYTIME, PYINTERVAL
 except ImportError:
@@ -28,12 +37,15 @@ from psycopg2 import OperationalError as DatabaseOperationalError
 
 from sql import Flavor
 
+from trytond import timing
 from trytond.backend.database import DatabaseInterface
 from trytond.config import config, parse_uri
-from trytond.perf_analyzer import analyze_before, analyze_after
+from trytond.transaction import Transaction
+from trytond.perf_analyzer import analyze_before, analyze_after, get_broker
 from trytond.perf_analyzer import logger as perf_logger
 
-__all__ = ['Database', 'DatabaseIntegrityError', 'DatabaseOperationalError']
+__all__ = ['Database', 'DatabaseIntegrityError', 'DatabaseOperationalError',
+    'ConnectionPool']
 
 logger = logging.getLogger(__name__)
 
@@ -54,7 +66,52 @@ def replace_special_values(s, **mapping):
     return s
 
 
-class PerfCursor(cursor):
+_COPY_ESCAPES = [
+    ('\\', '\\\\'),
+    ('\n', '\\n'),
+    ('\r', '\\r'),
+    ('\t', '\\t'),
+    ]
+
+
+def copy_format(value):
+    "Return the value in the text format of COPY"
+    if value is None:
+        return '\\N'
+    elif isinstance(value, bool):
+        return 't' if value else 'f'
+    elif isinstance(value, (int, long, Decimal)):
+        return str(value)
+    elif isinstance(value, float):
+        return repr(value)
+    elif isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    elif isinstance(value, datetime.timedelta):
+        return '%s days %s seconds %s microseconds' % (
+            value.days, value.seconds, value.microseconds)
+    elif isinstance(value, Binary):
+        # The adapted value may be a str which must not be written raw
+        return '\\\\x' + binascii.hexlify(value.adapted)
+    elif isinstance(value, (bytearray, buffer)):
+        return '\\\\x' + binascii.hexlify(value)
+    if isinstance(value, unicode):
+        value = value.encode('utf-8')
+    for char, escape in _COPY_ESCAPES:
+        value = value.replace(char, escape)
+    return value
+
+
+class TimingCursor(cursor):
+    @timing.query
+    def execute(self, query, vars=None):
+        return super(TimingCursor, self).execute(query, vars)
+
+    @timing.query
+    def callproc(self, procname, vars=None):
+        return super(TimingCursor, self).callproc(procname, vars)
+
+
+class PerfCursor(TimingCursor):
     def execute(self, query, vars=None):
         try:
             context = analyze_before(self)
@@ -84,13 +141,247 @@ class PerfCursor(cursor):
         return ret
 
 
+class Connection(connection):
+    "Connection which remembers the characteristics of its session"
+
+    def __init__(self, *args, **kwargs):
+        super(Connection, self).__init__(*args, **kwargs)
+        # (autocommit, readonly) or None if unknown
+        self.characteristics = None
+        # The perf analyzer inspects each query so use it only if configured
+        if get_broker() is not None:
+            self.cursor_factory = PerfCursor
+        else:
+            self.cursor_factory = TimingCursor
+
+
+def connect_dsn(dsn):
+    return connect(dsn, connection_factory=Connection)
+
+
+class _Waiter(object):
+    "A thread waiting for a connection"
+    __slots__ = ('event', 'entry')
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.entry = None
+
+
+# The entry handed over to create a new connection
+_NEW = object()
+
+
+class ConnectionPool(object):
+    """
+    Pool of connections which serves the waiting threads in order.
+
+    :param timeout: the seconds to wait for a connection
+    :param lifetime: the seconds after which a connection is replaced
+    :param idle: the seconds after which an idle connection above minconn
+        is closed
+    :param check: the seconds of idleness after which a connection is checked
+        before its checkout
+    """
+
+    def __init__(self, minconn, maxconn, dsn, timeout=None, lifetime=None,
+            idle=None, check=None, connect=connect_dsn):
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.dsn = dsn
+        self.timeout = timeout
+        self.lifetime = lifetime
+        self.idle = idle
+        self.check = check
+        self._connect = connect
+        self.closed = False
+        self._lock = threading.Lock()
+        # (connection, creation time, release time) the last released on the
+        # right
+        self._idle = deque()
+        # id(connection) -> (connection, creation time)
+        self._used = {}
+        self._waiters = deque()
+        # The connections open, being opened and handed over
+        self._size = 0
+        self.waits = 0
+        self.wait_time = 0.
+        self.timeouts = 0
+        for _ in range(minconn):
+            self._size += 1
+            self._idle.append((self._new(), time.time(), time.time()))
+
+    def _new(self):
+        try:
+            return self._connect(self.dsn)
+        except Exception:
+            with self._lock:
+                self._release(_NEW)
+            raise
+
+    def stats(self):
+        "Return the counters of the pool"
+        with self._lock:
+            return {
+                'size': self._size,
+                'idle': len(self._idle),
+                'in_use': len(self._used),
+                'waiters': len(self._waiters),
+                'waits': self.waits,
+                'wait_time': self.wait_time,
+                'timeouts': self.timeouts,
+                }
+
+    def getconn(self, timeout=None):
+        "Return a connection waiting at most timeout seconds"
+        if timeout is None:
+            timeout = self.timeout
+        waiter = entry = None
+        with self._lock:
+            if self.closed:
+                raise PoolError('connection pool is closed')
+            # Do not jump the queue
+            if not self._waiters:
+                if self._idle:
+                    entry = self._idle.pop()
+                elif self._size < self.maxconn:
+                    self._size += 1
+                    entry = _NEW
+            if entry is None:
+                waiter = _Waiter()
+                self._waiters.append(waiter)
+        if waiter is not None:
+            start = time.time()
+            with timing.phase('pool'):
+                waiter.event.wait(timeout)
+            with self._lock:
+                entry = waiter.entry
+                if entry is None:
+                    if waiter in self._waiters:
+                        self._waiters.remove(waiter)
+                        self.timeouts += 1
+                        raise PoolError('timeout waiting a connection')
+                    raise PoolError('connection pool is closed')
+                self.waits += 1
+                self.wait_time += time.time() - start
+        return self._checkout(entry)
+
+    def _checkout(self, entry):
+        now = time.time()
+        if entry is not _NEW:
+            conn, created, released = entry
+            if conn.closed or (self.lifetime
+                    and now - created >= self.lifetime):
+                self._close(conn)
+                entry = _NEW
+            elif self.check is not None and now - released >= self.check:
+                try:
+                    cursor = conn.cursor()
+                    cursor.execute('SELECT 1')
+                    conn.rollback()
+                except Exception:
+                    logger.info('discard broken connection', exc_info=True)
+                    self._close(conn)
+                    entry = _NEW
+        if entry is _NEW:
+            conn, created = self._new(), now
+        with self._lock:
+            self._used[id(conn)] = (conn, created)
+        return conn
+
+    def putconn(self, conn, close=False):
+        "Release the connection"
+        with self._lock:
+            try:
+                conn, created = self._used.pop(id(conn))
+            except KeyError:
+                raise PoolError('trying to put unkeyed connection')
+        now = time.time()
+        if not close and not conn.closed:
+            status = conn.get_transaction_status()
+            if status == TRANSACTION_STATUS_UNKNOWN:
+                close = True
+            elif status != TRANSACTION_STATUS_IDLE:
+                try:
+                    conn.rollback()
+                except DatabaseOperationalError:
+                    close = True
+        if close or conn.closed or (
+                self.lifetime and now - created >= self.lifetime):
+            self._close(conn)
+            entry = _NEW
+        else:
+            entry = (conn, created, now)
+        with self._lock:
+            if self.closed and entry is not _NEW:
+                self._close(conn)
+                entry = _NEW
+            self._release(entry)
+            reaped = self._reap(now)
+        for conn in reaped:
+            self._close(conn)
+
+    def _release(self, entry):
+        "Hand over the entry to the first waiter or keep it"
+        if self._waiters and not self.closed:
+            waiter = self._waiters.popleft()
+            waiter.entry = entry
+            waiter.event.set()
+        elif entry is _NEW:
+            self._size -= 1
+        else:
+            self._idle.append(entry)
+
+    def _reap(self, now):
+        "Remove the idle connections above minconn which are too old"
+        reaped = []
+        if self.idle is None:
+            return reaped
+        while (self._idle and self._size > self.minconn
+                and now - self._idle[0][2] >= self.idle):
+            conn, _, _ = self._idle.popleft()
+            self._size -= 1
+            reaped.append(conn)
+        return reaped
+
+    def _close(self, conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def closeall(self):
+        "Close the idle connections and the used ones when they are released"
+        with self._lock:
+            self.closed = True
+            idle, self._idle = self._idle, deque()
+            self._size -= len(idle)
+            waiters, self._waiters = self._waiters, deque()
+        for conn, _, _ in idle:
+            self._close(conn)
+        for waiter in waiters:
+            waiter.event.set()
+
+
 class Database(DatabaseInterface):
 
     _databases = {}
     _connpool = None
+    _replica_pools = []
+    _replica_lock = threading.Lock()
+    # The time in seconds during which a failing replica is not used
+    replica_retry = 60
     _list_cache = None
     _list_cache_timestamp = None
     _version_cache = {}
+    _cache_listener = None
+    _cache_listener_lock = threading.Lock()
+    _cache_listener_retry = 0
+    _cache_poll_lock = threading.Lock()
+    _cache_generation = 0
+    # The time in seconds after which ir_cache is queried even without
+    # notification
+    cache_check_interval = 10
     flavor = Flavor(ilike=True)
 
     def __new__(cls, name='template1'):
@@ -106,8 +397,8 @@ class Database(DatabaseInterface):
         self._has_returning = None
 
     @classmethod
-    def dsn(cls, name):
-        uri = parse_uri(config.get('database', 'uri'))
+    def dsn(cls, name, uri=None):
+        uri = parse_uri(uri or config.get('database', 'uri'))
         assert uri.scheme == 'postgresql'
         host = uri.hostname and "host=%s" % uri.hostname or ''
         port = uri.port and "port=%s" % uri.port or ''
@@ -117,47 +408,115 @@ class Database(DatabaseInterface):
             if uri.password else '')
         return '%s %s %s %s %s' % (host, port, name, user, password)
 
+    @classmethod
+    def replica_uris(cls):
+        uris = config.get('database', 'replica_uri') or ''
+        return [u.strip() for u in uris.split(',') if u.strip()]
+
+    @classmethod
+    def _pool(cls, dsn):
+        def getint(name):
+            # 0 disables the option
+            return config.getint('database', name) or None
+        return ConnectionPool(
+            config.getint('database', 'minconn', default=1),
+            config.getint('database', 'maxconn', default=64),
+            dsn,
+            timeout=getint('pool_timeout'),
+            lifetime=getint('pool_lifetime'),
+            idle=getint('pool_idle'),
+            check=config.getint('database', 'pool_check'))
+
     def connect(self):
         if self._connpool is not None:
             return self
         logger.info('connect to "%s"', self.name)
-        minconn = config.getint('database', 'minconn', default=1)
-        maxconn = config.getint('database', 'maxconn', default=64)
-        self._connpool = ThreadedConnectionPool(
-            minconn, maxconn, self.dsn(self.name))
+        self._connpool = self._pool(self.dsn(self.name))
+        # The pools of the replicas are created on demand so an unavailable
+        # replica does not prevent to use the database
+        self._replica_pools = [None] * len(self.replica_uris())
+        self._replica_count = itertools.count()
+        self._replica_failures = {}
+        self._replica_connections = {}
         return self
 
-    def get_connection(self, autocommit=False, readonly=False):
+    def _get_replica_connection(self):
+        index = next(self._replica_count) % len(self._replica_pools)
+        if (time.time() - self._replica_failures.get(index, 0)
+                < self.replica_retry):
+            return
+        try:
+            with self._replica_lock:
+                pool = self._replica_pools[index]
+                if pool is None:
+                    logger.info('connect to replica %s of "%s"',
+                        index, self.name)
+                    pool = self._replica_pools[index] = self._pool(
+                        self.dsn(self.name, self.replica_uris()[index]))
+            conn = pool.getconn(timeout=0)
+        except PoolError:
+            # The replica is busy so fall back to the primary
+            return
+        except DatabaseOperationalError:
+            logger.warning('fail to connect to replica %s of "%s"',
+                index, self.name, exc_info=True)
+            self._replica_failures[index] = time.time()
+            return
+        self._replica_connections[id(conn)] = pool
+        return conn
+
+    def get_connection(self, autocommit=False, readonly=False, replica=False):
         if self._connpool is None:
             self.connect()
-        for count in range(config.getint('database', 'retry'), -1, -1):
+        conn = None
+        if readonly and replica and self._replica_pools:
+            conn = self._get_replica_connection()
+        if conn is None:
+            conn = self._connpool.getconn()
+        # The characteristics are sent with the BEGIN of the transactions so
+        # they are changed only when they differ from the previous use
+        characteristics = (autocommit, readonly and not autocommit)
+        if conn.characteristics != characteristics:
             try:
-                conn = self._connpool.getconn()
-                break
-            except PoolError:
-                if count and not self._connpool.closed:
-                    logger.info('waiting a connection')
-                    time.sleep(1)
-                    continue
+                conn.set_session(
+                    isolation_level=ISOLATION_LEVEL_REPEATABLE_READ,
+                    readonly=characteristics[1], autocommit=autocommit)
+            except Exception:
+                self.put_connection(conn, close=True)
                 raise
-        if autocommit:
-            conn.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
-        else:
-            conn.set_isolation_level(ISOLATION_LEVEL_REPEATABLE_READ)
-        if readonly:
-            cursor = conn.cursor()
-            cursor.execute('SET TRANSACTION READ ONLY')
-        conn.cursor_factory = PerfCursor
+            conn.characteristics = characteristics
         return conn
 
+    def stats(self):
+        "Return the counters of the connection pools"
+        stats = {}
+        if self._connpool is not None:
+            stats['primary'] = self._connpool.stats()
+        for index, pool in enumerate(self._replica_pools):
+            if pool is not None:
+                stats['replica %s' % index] = pool.stats()
+        return stats
+
+    def is_replica(self, connection):
+        return id(connection) in self._replica_connections
+
     def put_connection(self, connection, close=False):
-        self._connpool.putconn(connection, close=close)
+        pool = self._replica_connections.pop(id(connection), self._connpool)
+        pool.putconn(connection, close=close)
 
     def close(self):
         if self._connpool is None:
             return
         self._connpool.closeall()
         self._connpool = None
+        for pool in filter(None, self._replica_pools):
+            pool.closeall()
+        self._replica_pools = []
+        self._replica_connections = {}
+        with self._cache_listener_lock:
+            if self._cache_listener is not None:
+                self._cache_listener.connection.close()
+                self._cache_listener = None
 
     @classmethod
     def create(cls, connection, database_name):
@@ -259,6 +618,22 @@ class Database(DatabaseInterface):
         cursor.execute("SELECT NEXTVAL('" + table + "_id_seq')")
         return cursor.fetchone()[0]
 
+    def nextids(self, connection, table, count):
+        cursor = connection.cursor()
+        cursor.execute("SELECT NEXTVAL('" + table + "_id_seq') "
+            "FROM generate_series(1, %s)", (count,))
+        return sorted(i for i, in cursor.fetchall())
+
+    def copy_from(self, connection, table, columns, rows):
+        cursor = connection.cursor()
+        data = BytesIO()
+        for row in rows:
+            data.write('\t'.join(map(copy_format, row)))
+            data.write('\n')
+        data.seek(0)
+        cursor.copy_expert('COPY "%s" (%s) FROM STDIN' % (table._name,
+                ', '.join('"%s"' % c.name for c in columns)), data)
+
     def setnextid(self, connection, table, value):
         cursor = connection.cursor()
         cursor.execute("SELECT SETVAL('" + table + "_id_seq', %d)" % value)
@@ -278,6 +653,9 @@ class Database(DatabaseInterface):
     def has_multirow_insert(self):
         return True
 
+    def has_update_from(self):
+        return True
+
     def get_table_schema(self, connection, table_name):
         cursor = connection.cursor()
         for schema in self.search_path:
@@ -329,6 +707,74 @@ class Database(DatabaseInterface):
                 self.put_connection(connection)
         return self._has_returning
 
+    def cache_generation(self):
+        listener = self._cache_listener
+        if listener is None or not listener.is_alive():
+            with self._cache_listener_lock:
+                listener = self._cache_listener
+                if listener is None or not listener.is_alive():
+                    listener = self._start_cache_listener()
+                    if listener is None:
+                        return None
+        # Process the notifications already received but not yet handled by
+        # the listener, as the one of a commit which has just returned
+        try:
+            self._poll_cache(listener.connection)
+        except Exception:
+            return None
+        # A notification still in transit is seen at the latest after the
+        # interval
+        return (self._cache_generation,
+            int(time.time() // self.cache_check_interval))
+
+    def _poll_cache(self, conn):
+        with self._cache_poll_lock:
+            conn.poll()
+            if conn.notifies:
+                del conn.notifies[:]
+                self._cache_generation += 1
+
+    def _start_cache_listener(self):
+        now = time.time()
+        if now < self._cache_listener_retry:
+            return
+        try:
+            conn = connect(self.dsn(self.name))
+            conn.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
+            conn.cursor().execute('LISTEN "ir_cache"')
+        except DatabaseOperationalError:
+            logger.warning('fail to listen cache on "%s"', self.name,
+                exc_info=True)
+            self._cache_listener_retry = now + 60
+            return
+        # Notifications may have been missed while not listening
+        self._cache_generation += 1
+        listener = threading.Thread(target=self._listen_cache, args=(conn,),
+            name='trytond.cache.%s' % self.name)
+        listener.daemon = True
+        listener.connection = conn
+        listener.start()
+        self._cache_listener = listener
+        return listener
+
+    def _listen_cache(self, conn):
+        try:
+            while not conn.closed:
+                if select.select([conn], [], [], 60) == ([], [], []):
+                    continue
+                self._poll_cache(conn)
+        except Exception:
+            if not conn.closed:
+                logger.error('cache listener on "%s" failed', self.name,
+                    exc_info=True)
+        finally:
+            if not conn.closed:
+                conn.close()
+
+    def notify_cache(self):
+        cursor = Transaction().connection.cursor()
+        cursor.execute('NOTIFY "ir_cache"')
+
 register_type(UNICODE)
 if PYDATE:
     register_type(PYDATE)
@@ -1,8 +1,11 @@
 # This file is part of Tryton.  The COPYRIGHT file at the top level of
 # this repository contains the full copyright notices and license terms.
+from trytond import timing
 from trytond.backend.database import DatabaseInterface
 from trytond.config import config
+from trytond.transaction import Transaction
 import os
+import binascii
 from decimal import Decimal
 import datetime
 import time
@@ -201,6 +204,10 @@ MAPPING = {
 
 class SQLiteCursor(sqlite.Cursor):
 
+    @timing.query
+    def execute(self, sql, parameters=()):
+        return super(SQLiteCursor, self).execute(sql, parameters)
+
     def __enter__(self):
         return self
 
@@ -214,9 +221,41 @@ class SQLiteConnection(sqlite.Connection):
         return super(SQLiteConnection, self).cursor(SQLiteCursor)
 
 
+class CacheNotifier(object):
+    '''
+    Data manager which bumps the cache generation after the commit
+    '''
+
+    def __init__(self, database):
+        self.database = database
+
+    def __eq__(self, other):
+        return (isinstance(other, CacheNotifier)
+            and self.database.name == other.database.name)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def tpc_begin(self, trans):
+        pass
+
+    def commit(self, trans):
+        pass
+
+    def tpc_vote(self, trans):
+        pass
+
+    def tpc_finish(self, trans):
+        self.database.bump_cache_generation()
+
+    def tpc_abort(self, trans):
+        pass
+
+
 class Database(DatabaseInterface):
 
     _local = threading.local()
+    _cache_generations = {}
     _conn = None
     flavor = Flavor(paramstyle='qmark', function_mapping=MAPPING)
     IN_MAX = 200
@@ -260,7 +299,7 @@ class Database(DatabaseInterface):
         self._conn.execute('PRAGMA foreign_keys = ON')
         return self
 
-    def get_connection(self, autocommit=False, readonly=False):
+    def get_connection(self, autocommit=False, readonly=False, replica=False):
         if self._conn is None:
             self.connect()
         if autocommit:
@@ -300,6 +339,42 @@ class Database(DatabaseInterface):
             return
         os.remove(os.path.join(config.get('database', 'path'),
             database_name + '.sqlite'))
+        cache_path = os.path.join(config.get('database', 'path'),
+            database_name + '.cache')
+        if os.path.isfile(cache_path):
+            os.remove(cache_path)
+
+    def _cache_path(self):
+        if self.name == ':memory:':
+            return
+        return os.path.join(config.get('database', 'path'),
+            self.name + '.cache')
+
+    def cache_generation(self):
+        # The content of the file is used as generation for the other
+        # processes
+        path = self._cache_path()
+        if path is None:
+            return self._cache_generations.get(self.name, 0)
+        try:
+            with open(path, 'rb') as fp:
+                return fp.read()
+        except (IOError, OSError):
+            return 0
+
+    def bump_cache_generation(self):
+        path = self._cache_path()
+        if path is None:
+            self._cache_generations[self.name] = (
+                self._cache_generations.get(self.name, 0) + 1)
+        else:
+            # A random token instead of a counter ensures that concurrent
+            # bumps can not write the same generation
+            with open(path, 'wb') as fp:
+                fp.write(binascii.hexlify(os.urandom(8)))
+
+    def notify_cache(self):
+        Transaction().join(CacheNotifier(self))
 
     def list(self):
         res = []
@@ -382,6 +457,21 @@ class Database(DatabaseInterface):
                 return False
             return len(cursor.fetchall()) != 0
 
+    def nextids(self, connection, table, count):
+        # The ids follow the largest ever used like AUTOINCREMENT
+        cursor = connection.cursor()
+        # The no-op write begins the IMMEDIATE transaction if needed so the
+        # write lock is held until the commit and no other connection can
+        # insert the same ids
+        cursor.execute('UPDATE "%s" SET id = id WHERE 0 = 1' % table)
+        cursor.execute('SELECT MAX(id) FROM "%s"' % table)
+        maxid, = cursor.fetchone()
+        cursor.execute('SELECT seq FROM sqlite_sequence WHERE name = ?',
+            (table,))
+        seq = cursor.fetchone()
+        start = max(maxid or 0, seq[0] if seq else 0) + 1
+        return range(start, start + count)
+
     def lastid(self, cursor):
         # This call is not thread safe
         return cursor.lastrowid
@@ -1,7 +1,11 @@
 # This file is part of Tryton.  The COPYRIGHT file at the top level of
 # this repository contains the full copyright notices and license terms.
+import datetime
+import sys
+from hashlib import md5
 from threading import Lock
 from collections import OrderedDict
+from decimal import Decimal
 
 from sql import Table
 from sql.functions import CurrentTimestamp
@@ -9,9 +13,10 @@ from sql.functions import CurrentTimestamp
 from trytond.config import config
 from trytond.transaction import Transaction
 from trytond.cache_serializer import pack, unpack
-from trytond.tools import resolve
+from trytond.tools import resolve, grouped_slice
 
-__all__ = ['BaseCache', 'Cache', 'LRUDict']
+__all__ = ['BaseCache', 'Cache', 'LRUDict', 'SizedLRUDict', 'ImmutableDict',
+    'deep_freeze', 'sizeof', 'key_digest', 'key_tag']
 
 
 def freeze(o):
@@ -23,34 +28,276 @@ def freeze(o):
         return o
 
 
+class ImmutableDict(dict):
+    """
+    A read-only dictionary.
+    copy() returns a mutable dictionary.
+    """
+    __slots__ = ()
+
+    def _immutable(self, *args, **kwargs):
+        raise TypeError('%s is immutable' % self.__class__.__name__)
+
+    __setitem__ = __delitem__ = _immutable
+    clear = pop = popitem = setdefault = update = _immutable
+
+    def copy(self):
+        return dict(self)
+
+    def __reduce__(self):
+        return (dict, (dict(self),))
+
+
+_immutable_types = (type(None), bool, int, long, float, Decimal, basestring,
+    datetime.date, datetime.time, datetime.timedelta)
+
+
+def deep_freeze(o):
+    """
+    Return an immutable copy of o.
+    list and tuple are converted to tuple, set to frozenset and dict to
+    ImmutableDict. A TypeError is raised for other mutable types.
+    """
+    if isinstance(o, _immutable_types):
+        return o
+    elif isinstance(o, (list, tuple)):
+        return tuple(deep_freeze(x) for x in o)
+    elif isinstance(o, (set, frozenset)):
+        return frozenset(deep_freeze(x) for x in o)
+    elif isinstance(o, dict):
+        return ImmutableDict((k, deep_freeze(v)) for k, v in o.iteritems())
+    elif isinstance(o, bytearray):
+        return bytes(o)
+    raise TypeError('Can not freeze %r' % type(o))
+
+
+def sizeof(o, _seen=None):
+    "Return an estimation of the memory used by o in bytes"
+    if _seen is None:
+        _seen = set()
+    if id(o) in _seen:
+        return 0
+    _seen.add(id(o))
+    size = sys.getsizeof(o)
+    if isinstance(o, dict):
+        for k, v in o.iteritems():
+            size += sizeof(k, _seen) + sizeof(v, _seen)
+    elif isinstance(o, (list, tuple, set, frozenset)):
+        for x in o:
+            size += sizeof(x, _seen)
+    return size
+
+
+def lru_set(cache, key, value):
+    "Set key in the LRU cache and return the number of evicted entries"
+    size = len(cache) + (key not in cache)
+    cache[key] = value
+    return size - len(cache)
+
+
+def stable_repr(o):
+    """
+    Return a representation of o which does not depend on the process.
+    The items of sets and dictionaries are sorted and unicode is encoded.
+    """
+    if isinstance(o, unicode):
+        return repr(o.encode('utf-8'))
+    elif isinstance(o, (list, tuple)):
+        return '(%s)' % ','.join(stable_repr(x) for x in o)
+    elif isinstance(o, (set, frozenset)):
+        return '{%s}' % ','.join(sorted(stable_repr(x) for x in o))
+    elif isinstance(o, dict):
+        return '{%s}' % ','.join(sorted(
+                '%s:%s' % (stable_repr(k), stable_repr(v))
+                for k, v in o.iteritems()))
+    elif isinstance(o, (bool, int, long)):
+        return repr(int(o))
+    return repr(o)
+
+
+def key_digest(key):
+    "Return a digest of key which is the same in every process"
+    return md5(stable_repr(key)).hexdigest()
+
+
+def key_tag(key):
+    "Return the tag used to invalidate key"
+    return '#' + key_digest(key)
+
+
 class BaseCache(object):
     _cache_instance = []
-
-    def __init__(self, name, size_limit=1024, context=True):
+    _tag_separator = '|'
+    _clean_generations = {}
+    # dbname -> timestamps of ir_cache read on the primary by clean
+    _clean_timestamps = {}
+    _process_memory_lock = Lock()
+
+    def __init__(self, name, size_limit=1024, context=True,
+            memory_limit=None, snapshot=True):
         assert name not in set([i._name for i in self._cache_instance]), \
             '%s is already used' % name
         self._name = name
         self.size_limit = size_limit
-        self.context = context
+        if memory_limit is None:
+            memory_limit = config.getint('cache', 'memory_limit')
+        self.memory_limit = memory_limit or None
+        self.snapshot = snapshot
+        if isinstance(context, bool):
+            self.context = context
+            self.context_keys = None
+        else:
+            self.context = True
+            self.context_keys = frozenset(context)
+        self._stats = dict.fromkeys(
+            ['hit', 'miss', 'set', 'eviction', 'clear'], 0)
         self._cache_instance.append(self)
 
     def _key(self, key):
         if self.context:
-            return (key, Transaction().user, freeze(Transaction().context))
+            transaction = Transaction()
+            return (key, transaction.user,
+                transaction.context_key(self.context_keys))
         return key
 
+    def _raw_key(self, key):
+        "Return the key given to _key"
+        if self.context:
+            return key[0]
+        return key
+
+    def _skip_set(self):
+        "Return if the values may be stale and must not be stored"
+        transaction = Transaction()
+        if not transaction.replica:
+            return False
+        # The values read on a replica are as fresh as the cache if the
+        # replica has replayed every reset of the cache seen on the primary
+        primary = self._clean_timestamps.get(transaction.database.name)
+        if primary is None:
+            return True
+        if transaction.replica_cache_timestamps is None:
+            table = Table('ir_cache')
+            cursor = transaction.connection.cursor()
+            cursor.execute(*table.select(table.timestamp, table.name))
+            transaction.replica_cache_timestamps = dict(
+                (n, t) for t, n in cursor.fetchall())
+        replica = transaction.replica_cache_timestamps
+        prefix = self._name + self._tag_separator
+        for name, timestamp in primary.iteritems():
+            if name != self._name and not name.startswith(prefix):
+                continue
+            if name not in replica or replica[name] < timestamp:
+                return True
+        return False
+
     def get(self, key, default=None):
         raise NotImplemented
 
-    def set(self, key, value):
+    def set(self, key, value, tags=None):
         raise NotImplemented
 
+    def get_many(self, keys):
+        "Return a dictionary with the cached values of keys"
+        result = {}
+        for key in keys:
+            value = self.get(key, _default_cache_value)
+            if value is not _default_cache_value:
+                result[key] = value
+        return result
+
+    def set_many(self, mapping, tags=None):
+        '''
+        Set the values of the mapping.
+        tags is a function which returns the tags of a key.
+        '''
+        for key, value in mapping.iteritems():
+            self.set(key, value, tags=tags(key) if tags else None)
+
     def clear(self):
         raise NotImplemented
 
+    def delete(self, key):
+        "Invalidate the key for every user and context"
+        self.clear_tags([key_tag(key)])
+
+    def clear_tags(self, tags):
+        raise NotImplemented
+
     def drop_inst(self, dbname):
         raise NotImplemented
 
+    def memory_usage(self):
+        "Return the bytes used in the process or None if unknown"
+        return None
+
+    def dump(self, dbname):
+        "Return the (key, value, tags) entries stored in the process"
+        return []
+
+    def load(self, dbname, entries, snapshot_timestamps, timestamps):
+        '''
+        Load the entries dumped when ir_cache had the snapshot_timestamps.
+        The entries reset since, according to timestamps, are skipped.
+        '''
+        pass
+
+    def size(self, dbname):
+        "Return the number of entries for dbname or None if unknown"
+        return None
+
+    def _count(self, name, value=1):
+        self._stats[name] += value
+
+    def stats(self, dbname):
+        "Return the counters of the process and the size for dbname"
+        result = dict(self._stats)
+        result['size'] = self.size(dbname)
+        result['memory'] = self.memory_usage()
+        return result
+
+    @staticmethod
+    def all_stats(dbname):
+        "Return the stats per cache name"
+        return dict((i._name, i.stats(dbname))
+            for i in BaseCache._cache_instance)
+
+    @staticmethod
+    def reset_stats():
+        for inst in BaseCache._cache_instance:
+            for name in inst._stats:
+                inst._stats[name] = 0
+
+    def _shrink(self):
+        "Evict the least recently used entry and return the bytes freed"
+        return 0
+
+    @staticmethod
+    def memory_usages():
+        "Return the bytes used in the process per cache name"
+        return dict((i._name, i.memory_usage())
+            for i in BaseCache._cache_instance)
+
+    @staticmethod
+    def check_process_memory():
+        "Evict entries of the biggest caches to fit the process budget"
+        limit = config.getint('cache', 'process_memory_limit')
+        if not limit or not BaseCache._process_memory_lock.acquire(False):
+            return
+        try:
+            usages = dict((i, i.memory_usage() or 0)
+                for i in BaseCache._cache_instance)
+            total = sum(usages.itervalues())
+            while total > limit:
+                inst = max(usages, key=usages.get)
+                freed = inst._shrink()
+                if not freed:
+                    break
+                usages[inst] -= freed
+                total -= freed
+        finally:
+            BaseCache._process_memory_lock.release()
+
     @staticmethod
     def drop(dbname):
         for inst in BaseCache._cache_instance:
@@ -61,6 +308,13 @@ class BaseCache(object):
 
     @staticmethod
     def clean(dbname):
+        if config.getboolean('cache', 'notify', default=True):
+            generation = Transaction().database.cache_generation()
+        else:
+            generation = None
+        if (generation is not None
+                and BaseCache._clean_generations.get(dbname) == generation):
+            return
         with Transaction().new_transaction() as transaction,\
                 transaction.connection.cursor() as cursor:
             table = Table('ir_cache')
@@ -70,6 +324,12 @@ class BaseCache(object):
                 timestamps[name] = timestamp
         for inst in BaseCache._cache_instance:
             inst.clean_inst(dbname, timestamps)
+        BaseCache._clean_timestamps[dbname] = timestamps
+        BaseCache._clean_generations[dbname] = generation
+
+    @classmethod
+    def has_resets(cls, dbname):
+        return True
 
     @classmethod
     def resets_cls(cls, dbname, cursor, table):
@@ -78,12 +338,16 @@ class BaseCache(object):
     @staticmethod
     def resets(dbname):
         table = Table('ir_cache')
+        klasses = set(i.__class__ for i in BaseCache._cache_instance)
+        klasses = [k for k in klasses if k.has_resets(dbname)]
+        if not klasses:
+            return
         with Transaction().new_transaction() as transaction,\
                 transaction.connection.cursor() as cursor:
-            klasses = [i.__class__ for i in BaseCache._cache_instance]
-            klasses = list(set(klasses))
             for klass in klasses:
                 klass.resets_cls(dbname, cursor, table)
+            if config.getboolean('cache', 'notify', default=True):
+                transaction.database.notify_cache()
 
 
 class MemoryCache(BaseCache):
@@ -92,72 +356,241 @@ class MemoryCache(BaseCache):
     """
     _resets = {}
     _resets_lock = Lock()
-
-    def __init__(self, name, size_limit=1024, context=True):
-        super(MemoryCache, self).__init__(name, size_limit, context)
+    # The number of tags reset in ir_cache above which they are replaced by a
+    # reset of the whole cache
+    tag_resets_limit = 1000
+
+    def __init__(self, name, size_limit=1024, context=True,
+            memory_limit=None, snapshot=True):
+        super(MemoryCache, self).__init__(name, size_limit, context,
+            memory_limit, snapshot)
         self._cache = {}
         self._timestamp = None
+        self._tag_timestamps = {}
         self._lock = Lock()
 
+    def _new_lru(self):
+        return TaggedLRUDict(self.size_limit, self.memory_limit)
+
+    def _entry_tags(self, key, tags):
+        "Return the tags of the entry including the tag of its raw key"
+        tags = set(tags or [])
+        tags.add(key_tag(self._raw_key(key)))
+        return frozenset(tags)
+
     def get(self, key, default=None):
         dbname = Transaction().database.name
         key = self._key(key)
         with self._lock:
-            cache = self._cache.setdefault(dbname, LRUDict(self.size_limit))
+            cache = self._cache.setdefault(dbname, self._new_lru())
             try:
-                result = cache[key] = cache.pop(key)
-                return result
+                result = cache.touch(key)
             # JCA: Properly crash on type error
             except KeyError:
+                self._count('miss')
                 return default
+            self._count('hit')
+            return result[0]
 
-    def set(self, key, value):
+    def set(self, key, value, tags=None):
+        if self._skip_set():
+            return value
         dbname = Transaction().database.name
         key = self._key(key)
+        tags = self._entry_tags(key, tags)
         with self._lock:
-            cache = self._cache.setdefault(dbname, LRUDict(self.size_limit))
+            cache = self._cache.setdefault(dbname, self._new_lru())
             # JCA: Properly crash on type error
-            cache[key] = value
+            self._count('eviction', lru_set(cache, key, (value, tags)))
+            self._count('set')
+        self.check_process_memory()
         return value
 
+    def get_many(self, keys):
+        dbname = Transaction().database.name
+        keys = [(key, self._key(key)) for key in keys]
+        result = {}
+        with self._lock:
+            cache = self._cache.setdefault(dbname, self._new_lru())
+            for key, cache_key in keys:
+                try:
+                    value = cache.touch(cache_key)
+                except KeyError:
+                    continue
+                result[key] = value[0]
+            self._count('hit', len(result))
+            self._count('miss', len(keys) - len(result))
+        return result
+
+    def set_many(self, mapping, tags=None):
+        if self._skip_set():
+            return
+        dbname = Transaction().database.name
+        items = []
+        for key, value in mapping.iteritems():
+            cache_key = self._key(key)
+            items.append((cache_key, (value,
+                        self._entry_tags(cache_key, tags and tags(key)))))
+        with self._lock:
+            cache = self._cache.setdefault(dbname, self._new_lru())
+            for key, value in items:
+                self._count('eviction', lru_set(cache, key, value))
+            self._count('set', len(items))
+        self.check_process_memory()
+
     def clear(self):
         dbname = Transaction().database.name
         with self._resets_lock:
             self._resets.setdefault(dbname, set())
             self._resets[dbname].add(self._name)
         with self._lock:
-            self._cache[dbname] = LRUDict(self.size_limit)
+            self._cache[dbname] = self._new_lru()
+            self._count('clear')
+
+    def clear_tags(self, tags):
+        dbname = Transaction().database.name
+        tags = frozenset(tags)
+        with self._resets_lock:
+            self._resets.setdefault(dbname, set())
+            self._resets[dbname].update(
+                self._name + self._tag_separator + t for t in tags)
+        with self._lock:
+            self._evict_tags(dbname, tags)
+            self._count('clear')
+
+    def _evict_tags(self, dbname, tags):
+        cache = self._cache.get(dbname)
+        if not cache:
+            return
+        for key in cache.tagged(tags):
+            del cache[key]
+
+    def dump(self, dbname):
+        with self._lock:
+            cache = self._cache.get(dbname)
+            if not cache:
+                return []
+            return [(k, v, t) for k, (v, t) in cache.iteritems()]
+
+    def load(self, dbname, entries, snapshot_timestamps, timestamps):
+        name_timestamp = timestamps.get(self._name)
+        if name_timestamp != snapshot_timestamps.get(self._name):
+            return
+        prefix = self._name + self._tag_separator
+        tag_timestamps, reset_tags = {}, set()
+        for name, timestamp in timestamps.iteritems():
+            if name.startswith(prefix):
+                tag = name[len(prefix):]
+                tag_timestamps[tag] = timestamp
+                if timestamp != snapshot_timestamps.get(name):
+                    reset_tags.add(tag)
+        with self._lock:
+            cache = self._cache.setdefault(dbname, self._new_lru())
+            for key, value, tags in entries:
+                tags = self._entry_tags(key, tags)
+                if not tags.isdisjoint(reset_tags):
+                    continue
+                cache[key] = (self._load_value(value), tags)
+            # Mark the resets as processed by clean_inst
+            if name_timestamp and (not self._timestamp
+                    or name_timestamp > self._timestamp):
+                self._timestamp = name_timestamp
+            for tag, timestamp in tag_timestamps.iteritems():
+                tag_timestamp = self._tag_timestamps.get(tag)
+                if not tag_timestamp or timestamp > tag_timestamp:
+                    self._tag_timestamps[tag] = timestamp
+
+    def _load_value(self, value):
+        return value
 
     def drop_inst(self, dbname):
         with self._lock:
             self._cache.pop(dbname, None)
 
+    def memory_usage(self):
+        with self._lock:
+            return sum(c.memory for c in self._cache.itervalues())
+
+    def size(self, dbname):
+        with self._lock:
+            return len(self._cache.get(dbname, ()))
+
+    def _shrink(self):
+        with self._lock:
+            freed = _shrink_lru(self._cache.values())
+            if freed:
+                self._count('eviction')
+            return freed
+
     def clean_inst(self, dbname, timestamps):
+        prefix = self._name + self._tag_separator
         if self._name in timestamps:
             with self._lock:
                 if (not self._timestamp
                         or timestamps[self._name] > self._timestamp):
                     self._timestamp = timestamps[self._name]
-                    self._cache[dbname] = LRUDict(self.size_limit)
+                    self._cache[dbname] = self._new_lru()
+                    # Forget the tags collapsed into the reset of the cache
+                    self._tag_timestamps = dict(
+                        (t, s) for t, s in self._tag_timestamps.iteritems()
+                        if prefix + t in timestamps)
+        tags = set()
+        for name, timestamp in timestamps.iteritems():
+            if name.startswith(prefix):
+                tag = name[len(prefix):]
+                tag_timestamp = self._tag_timestamps.get(tag)
+                if not tag_timestamp or timestamp > tag_timestamp:
+                    self._tag_timestamps[tag] = timestamp
+                    tags.add(tag)
+        if tags:
+            with self._lock:
+                self._evict_tags(dbname, tags)
+
+    @classmethod
+    def has_resets(cls, dbname):
+        return bool(cls._resets.get(dbname))
 
     @classmethod
     def resets_cls(cls, dbname, cursor, table):
         with cls._resets_lock:
             cls._resets.setdefault(dbname, set())
+            names = set()
             for name in cls._resets[dbname]:
-                cursor.execute(*table.select(table.name,
-                        where=table.name == name))
-                if cursor.fetchone():
-                    # It would be better to insert only
-                    cursor.execute(*table.update([table.timestamp],
-                            [CurrentTimestamp()],
-                            where=table.name == name))
-                else:
-                    cursor.execute(*table.insert(
-                            [table.timestamp, table.name],
-                            [[CurrentTimestamp(), name]]))
+                cls._reset_name(cursor, table, name)
+                if cls._tag_separator in name:
+                    names.add(name.split(cls._tag_separator, 1)[0])
+            for name in names:
+                cls._collapse_tag_resets(cursor, table, name)
             cls._resets[dbname].clear()
 
+    @classmethod
+    def _reset_name(cls, cursor, table, name):
+        cursor.execute(*table.select(table.name,
+                where=table.name == name))
+        if cursor.fetchone():
+            # It would be better to insert only
+            cursor.execute(*table.update([table.timestamp],
+                    [CurrentTimestamp()],
+                    where=table.name == name))
+        else:
+            cursor.execute(*table.insert(
+                    [table.timestamp, table.name],
+                    [[CurrentTimestamp(), name]]))
+
+    @classmethod
+    def _collapse_tag_resets(cls, cursor, table, name):
+        "Replace the tag resets of name by a reset of the cache above limit"
+        prefix = name + cls._tag_separator
+        cursor.execute(*table.select(table.name,
+                where=table.name.like(prefix + '%')))
+        tag_names = [n for n, in cursor.fetchall() if n.startswith(prefix)]
+        if len(tag_names) <= cls.tag_resets_limit:
+            return
+        for sub_names in grouped_slice(tag_names):
+            cursor.execute(*table.delete(
+                    where=table.name.in_(list(sub_names))))
+        cls._reset_name(cursor, table, name)
+
 
 class DefaultCacheValue:
     pass
@@ -172,15 +605,35 @@ class SerializableMemoryCache(MemoryCache):
             _default_cache_value)
         return default if result == _default_cache_value else unpack(result)
 
-    def set(self, key, value):
-        super(SerializableMemoryCache, self).set(key, pack(value))
+    def set(self, key, value, tags=None):
+        super(SerializableMemoryCache, self).set(key, pack(value), tags=tags)
 
+    def get_many(self, keys):
+        result = super(SerializableMemoryCache, self).get_many(keys)
+        return dict((k, unpack(v)) for k, v in result.iteritems())
 
-if config.get('cache', 'class'):
-    Cache = resolve(config.get('cache', 'class'))
-else:
-    # JCA : Use serializable memory cache by default to avoid cache corruption
-    Cache = SerializableMemoryCache
+    def set_many(self, mapping, tags=None):
+        super(SerializableMemoryCache, self).set_many(
+            dict((k, pack(v)) for k, v in mapping.iteritems()), tags=tags)
+
+
+class FrozenMemoryCache(MemoryCache):
+    """
+    A MemoryCache which stores deep frozen values.
+    Values are returned without copy so callers must not try to modify them.
+    """
+
+    def set(self, key, value, tags=None):
+        return super(FrozenMemoryCache, self).set(key, deep_freeze(value),
+            tags=tags)
+
+    def set_many(self, mapping, tags=None):
+        super(FrozenMemoryCache, self).set_many(
+            dict((k, deep_freeze(v)) for k, v in mapping.iteritems()),
+            tags=tags)
+
+    def _load_value(self, value):
+        return deep_freeze(value)
 
 
 class LRUDict(OrderedDict):
@@ -209,11 +662,103 @@ class LRUDict(OrderedDict):
         self._check_size_limit()
         return default
 
+    def touch(self, key):
+        "Mark key as the most recently used and return its value"
+        value = self[key]
+        OrderedDict.__delitem__(self, key)
+        OrderedDict.__setitem__(self, key, value)
+        return value
+
     def _check_size_limit(self):
         while len(self) > self.size_limit:
             self.popitem(last=False)
 
 
+class SizedLRUDict(LRUDict):
+    """
+    Dictionary with a size limit and a memory limit in bytes. (see LRUDict)
+    The memory used by the entries is estimated with sizeof.
+    """
+    __slots__ = ('memory_limit', 'memory', '_sizes')
+
+    def __init__(self, size_limit, memory_limit=None):
+        self.memory_limit = memory_limit
+        self.memory = 0
+        self._sizes = {}
+        super(SizedLRUDict, self).__init__(size_limit)
+
+    def __setitem__(self, key, value):
+        if key in self:
+            del self[key]
+        size = sizeof(key) + sizeof(value)
+        self._sizes[key] = size
+        self.memory += size
+        super(SizedLRUDict, self).__setitem__(key, value)
+
+    def __delitem__(self, key):
+        super(SizedLRUDict, self).__delitem__(key)
+        self.memory -= self._sizes.pop(key)
+
+    def clear(self):
+        super(SizedLRUDict, self).clear()
+        self._sizes.clear()
+        self.memory = 0
+
+    def _check_size_limit(self):
+        super(SizedLRUDict, self)._check_size_limit()
+        if self.memory_limit:
+            while self and self.memory > self.memory_limit:
+                self.popitem(last=False)
+
+
+class TaggedLRUDict(SizedLRUDict):
+    """
+    A SizedLRUDict of (value, tags) entries with an index of the keys per tag.
+    """
+    __slots__ = ('_tag_keys',)
+
+    def __init__(self, size_limit, memory_limit=None):
+        self._tag_keys = {}
+        super(TaggedLRUDict, self).__init__(size_limit, memory_limit)
+
+    def __setitem__(self, key, value):
+        if key in self:
+            del self[key]
+        for tag in value[1] or ():
+            self._tag_keys.setdefault(tag, set()).add(key)
+        super(TaggedLRUDict, self).__setitem__(key, value)
+
+    def __delitem__(self, key):
+        for tag in self[key][1] or ():
+            keys = self._tag_keys[tag]
+            keys.discard(key)
+            if not keys:
+                del self._tag_keys[tag]
+        super(TaggedLRUDict, self).__delitem__(key)
+
+    def clear(self):
+        super(TaggedLRUDict, self).clear()
+        self._tag_keys.clear()
+
+    def tagged(self, tags):
+        "Return the keys of the entries with any of the tags"
+        keys = set()
+        for tag in tags:
+            keys.update(self._tag_keys.get(tag, ()))
+        return keys
+
+
+def _shrink_lru(caches):
+    "Evict the oldest entry of the biggest cache and return the bytes freed"
+    caches = [c for c in caches if c]
+    if not caches:
+        return 0
+    cache = max(caches, key=lambda c: c.memory)
+    memory = cache.memory
+    cache.popitem(last=False)
+    return memory - cache.memory
+
+
 class LRUDictTransaction(LRUDict):
     """
     Dictionary with a size limit. (see LRUDict)
@@ -233,3 +778,10 @@ class LRUDictTransaction(LRUDict):
     def refresh(self):
         if self.counter != self.transaction.counter:
             self.clear()
+
+
+if config.get('cache', 'class'):
+    Cache = resolve(config.get('cache', 'class'))
+else:
+    # JCA : Use serializable memory cache by default to avoid cache corruption
+    Cache = SerializableMemoryCache
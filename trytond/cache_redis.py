@@ -1,16 +1,200 @@
 # This file is part of Coog. The COPYRIGHT file at the top level of
 # this repository contains the full copyright notices and license terms.
+import time
+from collections import OrderedDict
 from threading import Lock
 from urlparse import urlparse
 import redis
 
 from trytond.config import config
 from trytond.transaction import Transaction
-from trytond.cache import BaseCache
+from trytond.cache import (BaseCache, SizedLRUDict, key_digest, lru_set,
+    _shrink_lru)
 from trytond.cache_serializer import pack, unpack
 
 
+# The scripts access the sets of the tags and of the entries which are not
+# passed in KEYS because they are only known by reading the index. All the keys
+# of a namespace share a hash tag but only a single Redis node is supported.
+
+# Remove the entries from the lru and from the sets of their tags by slices
+# to stay below the limit of unpack. Each entry keeps its tags in the set
+# named entry + '|' and the tags without entry are removed from the index.
+_EVICT_FUNCTION = """
+local function evict(lru, index, entries)
+    for i = 1, #entries, 1000 do
+        local slice, keys = {}, {}
+        for j = i, math.min(i + 999, #entries) do
+            local entry = entries[j]
+            local entry_tags = entry .. '|'
+            for _, tag in ipairs(redis.call('SMEMBERS', entry_tags)) do
+                redis.call('SREM', index .. tag, entry)
+                if redis.call('EXISTS', index .. tag) == 0 then
+                    redis.call('SREM', index, tag)
+                end
+            end
+            table.insert(slice, entry)
+            table.insert(keys, entry)
+            table.insert(keys, entry_tags)
+        end
+        redis.call('ZREM', lru, unpack(slice))
+        redis.call('DEL', unpack(keys))
+    end
+end
+"""
+
+# Store the entry with its tags and evict the least recently used above the
+# size limit unless the namespace has been cleared since the generation was
+# read
+# KEYS: lru, entry, index, generation
+# ARGV: value, ttl, timestamp, size_limit, generation, tags...
+_SET_SCRIPT = _EVICT_FUNCTION + """
+if (redis.call('GET', KEYS[4]) or '') ~= ARGV[5] then
+    return 0
+end
+local ttl = tonumber(ARGV[2])
+if ttl > 0 then
+    redis.call('SET', KEYS[2], ARGV[1], 'EX', ttl)
+else
+    redis.call('SET', KEYS[2], ARGV[1])
+end
+redis.call('ZADD', KEYS[1], ARGV[3], KEYS[2])
+local entry_tags = KEYS[2] .. '|'
+for i = 6, #ARGV do
+    redis.call('SADD', KEYS[3], ARGV[i])
+    redis.call('SADD', KEYS[3] .. ARGV[i], KEYS[2])
+    redis.call('SADD', entry_tags, ARGV[i])
+    if ttl > 0 then
+        redis.call('EXPIRE', KEYS[3] .. ARGV[i], ttl)
+    end
+end
+if ttl > 0 and #ARGV > 5 then
+    redis.call('EXPIRE', entry_tags, ttl)
+end
+local over = redis.call('ZCARD', KEYS[1]) - tonumber(ARGV[4])
+if over > 0 then
+    evict(KEYS[1], KEYS[3], redis.call('ZRANGE', KEYS[1], 0, over - 1))
+end
+return over
+"""
+
+# Delete the entries and increment the generation of the namespace
+# KEYS: lru, index, generation - ARGV: entries...
+_DELETE_SCRIPT = _EVICT_FUNCTION + """
+redis.call('INCR', KEYS[3])
+evict(KEYS[1], KEYS[2], ARGV)
+"""
+
+
+class RedisPipeline(object):
+    '''
+    Data manager which sends the writes of the RedisCache of a transaction
+    in one pipeline after the commit.
+    The writes of a read-only transaction are also sent on rollback.
+    The writes are skipped for the namespaces cleared since their generation
+    was first read by the transaction.
+    The local LRU of the RedisNearCache are filled only once the writes are
+    sent.
+    '''
+
+    def __init__(self, client):
+        self.client = client
+        self.writes = OrderedDict()
+        self.touches = {}
+        # namespace -> generation
+        self.generations = {}
+        # namespace -> (cache, dbname, near generation)
+        self.nears = {}
+
+    def __eq__(self, other):
+        return (isinstance(other, RedisPipeline)
+            and self.client is other.client)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def get(self, entry):
+        write = self.writes.get(entry)
+        if write is not None:
+            return write[2]
+
+    def set(self, cache, namespace, entry, value, tags):
+        self.writes.pop(entry, None)
+        self.writes[entry] = (cache, namespace, value, tags)
+
+    def near(self, cache, namespace, dbname, generation):
+        self.nears.setdefault(namespace, (cache, dbname, generation))
+
+    def touch(self, lru, entry):
+        self.touches.setdefault(lru, set()).add(entry)
+
+    def discard(self, namespace, entries=None, tags=None):
+        "Discard the pending writes of namespace matching entries or tags"
+        for entry, (_, entry_namespace, _, entry_tags) in (
+                self.writes.items()):
+            if entry_namespace != namespace:
+                continue
+            if ((entries is None and tags is None)
+                    or (entries and entry in entries)
+                    or (tags and not tags.isdisjoint(entry_tags))):
+                del self.writes[entry]
+
+    def execute(self):
+        if not self.writes and not self.touches:
+            return
+        timestamp = time.time()
+        pipe = self.client.pipeline(transaction=False)
+        for entry, (cache, namespace, value, tags) in self.writes.iteritems():
+            cache._write(pipe, namespace, entry, value, tags, timestamp,
+                self.generations[namespace])
+        for lru, entries in self.touches.iteritems():
+            pipe.zadd(lru, dict.fromkeys(entries, timestamp), xx=True)
+        nears = [(cache, dbname, generation,
+                    [(e, v) for e, (_, n, v, _) in self.writes.iteritems()
+                        if n == namespace])
+            for namespace, (cache, dbname, generation)
+            in self.nears.iteritems()]
+        self.clear()
+        pipe.execute()
+        for cache, dbname, generation, items in nears:
+            cache._fill_near(dbname, generation, items)
+
+    def clear(self):
+        self.writes.clear()
+        self.touches.clear()
+        self.generations.clear()
+        self.nears.clear()
+
+    def tpc_begin(self, trans):
+        pass
+
+    def commit(self, trans):
+        pass
+
+    def tpc_vote(self, trans):
+        pass
+
+    def tpc_finish(self, trans):
+        self.execute()
+
+    def tpc_abort(self, trans):
+        if trans.readonly:
+            self.execute()
+        else:
+            self.clear()
+
+
 class RedisCache(BaseCache):
+    """
+    A cache stored in redis.
+
+    Each entry is stored in its own key named by a stable digest, so every
+    process shares the same entries. The keys of a cache share a hash tag and
+    a sorted set keeps the least recently used above size_limit evicted. The
+    writes are sent in one pipeline at the end of the transaction.
+    The entries of a context cache can be deleted only if they are set with
+    the key_tag of their key in their tags.
+    """
     _client = None
     _client_check_lock = Lock()
 
@@ -27,46 +211,337 @@ class RedisCache(BaseCache):
                 db = url.path.strip('/')
                 cls._client = redis.StrictRedis(host=host, port=port, db=db)
 
-    def __init__(self, name, size_limit=1024, context=True):
-        super(RedisCache, self).__init__(name, size_limit, context)
+    def __init__(self, name, size_limit=1024, context=True,
+            memory_limit=None, snapshot=True):
+        super(RedisCache, self).__init__(name, size_limit, context,
+            memory_limit, snapshot)
         self.ensure_client()
+        self.ttl = config.getint('cache', 'ttl', default=0)
+        self._set_script = self._client.register_script(_SET_SCRIPT)
+        self._delete_script = self._client.register_script(_DELETE_SCRIPT)
 
     def _namespace(self, dbname=None):
         if dbname is None:
             dbname = Transaction().database.name
-        return '%s:%s' % (dbname, self._name)
+        # The hash tag keeps the keys of the namespace on the same node
+        return '{%s:%s}' % (dbname, self._name)
 
     def _key(self, key):
-        k = super(RedisCache, self)._key(key)
-        return '%x' % hash(k)
+        return key_digest(super(RedisCache, self)._key(key))
+
+    def _entry(self, namespace, key):
+        return namespace + ':' + key
+
+    def _lru_key(self, namespace):
+        return namespace + ':'
+
+    def _tags_key(self, namespace, tag=''):
+        return namespace + self._tag_separator + tag
+
+    def _generation_key(self, namespace):
+        return namespace + '#'
+
+    def _pipeline(self):
+        return Transaction().join(RedisPipeline(self._client))
+
+    def _fetch(self, namespace, entries):
+        "Return the packed values of the entries"
+        pipeline = self._pipeline()
+        values = [pipeline.get(e) for e in entries]
+        missing = [e for e, v in zip(entries, values) if v is None]
+        # The generation is read with the first values of the namespace
+        generation = namespace not in pipeline.generations
+        if missing or generation:
+            keys = list(missing)
+            if generation:
+                keys.append(self._generation_key(namespace))
+            fetched = self._client.mget(keys)
+            if generation:
+                pipeline.generations[namespace] = fetched.pop() or ''
+            fetched = dict(zip(missing, fetched))
+            values = [v if v is not None else fetched[e]
+                for e, v in zip(entries, values)]
+        lru = self._lru_key(namespace)
+        for entry, value in zip(entries, values):
+            if value is not None:
+                pipeline.touch(lru, entry)
+        return values
+
+    def _store(self, namespace, items, tags):
+        "Add the writes of the (raw_key, entry, packed value) items"
+        pipeline = self._pipeline()
+        if namespace not in pipeline.generations:
+            pipeline.generations[namespace] = self._client.get(
+                self._generation_key(namespace)) or ''
+        for raw_key, entry, value in items:
+            entry_tags = set((tags and tags(raw_key)) or [])
+            pipeline.set(self, namespace, entry, value, entry_tags)
+        self._count('set', len(items))
+
+    def _write(self, pipe, namespace, entry, value, tags, timestamp,
+            generation):
+        self._set_script(
+            keys=[self._lru_key(namespace), entry, self._tags_key(namespace),
+                self._generation_key(namespace)],
+            args=[value, self.ttl, timestamp, self.size_limit, generation]
+            + list(tags),
+            client=pipe)
+
+    def _delete(self, namespace, entries, client=None):
+        "Delete the entries and remove them from their tags"
+        self._delete_script(
+            keys=[self._lru_key(namespace), self._tags_key(namespace),
+                self._generation_key(namespace)],
+            args=list(entries), client=client)
 
     def get(self, key, default=None):
         namespace = self._namespace()
-        key = self._key(key)
-        result = self._client.hget(namespace, key)
+        result, = self._fetch(namespace,
+            [self._entry(namespace, self._key(key))])
         if result is None:
+            self._count('miss')
             return default
         else:
+            self._count('hit')
             return unpack(result)
 
-    def set(self, key, value):
+    def set(self, key, value, tags=None):
+        if self._skip_set():
+            return
+        namespace = self._namespace()
+        self._store(namespace,
+            [(key, self._entry(namespace, self._key(key)), pack(value))],
+            lambda k: tags)
+
+    def get_many(self, keys):
+        keys = list(keys)
+        if not keys:
+            return {}
+        namespace = self._namespace()
+        values = self._fetch(namespace,
+            [self._entry(namespace, self._key(k)) for k in keys])
+        result = dict((k, unpack(v)) for k, v in zip(keys, values)
+            if v is not None)
+        self._count('hit', len(result))
+        self._count('miss', len(keys) - len(result))
+        return result
+
+    def set_many(self, mapping, tags=None):
+        if self._skip_set():
+            return
         namespace = self._namespace()
-        key = self._key(key)
-        value = pack(value)
-        self._client.hset(namespace, key, value)
+        self._store(namespace,
+            [(k, self._entry(namespace, self._key(k)), pack(v))
+                for k, v in mapping.iteritems()], tags)
+
+    def _delete_namespace(self, namespace):
+        lru = self._lru_key(namespace)
+        pipe = self._client.pipeline(transaction=False)
+        pipe.zrange(lru, 0, -1)
+        pipe.smembers(self._tags_key(namespace))
+        entries, tags = pipe.execute()
+        pipe = self._client.pipeline(transaction=False)
+        pipe.incr(self._generation_key(namespace))
+        pipe.delete(lru, self._tags_key(namespace),
+            *(list(entries) + [e + self._tag_separator for e in entries]
+                + [self._tags_key(namespace, t) for t in tags]))
+        pipe.execute()
 
     def clear(self):
         namespace = self._namespace()
-        self._client.delete(namespace)
+        self._pipeline().discard(namespace)
+        self._delete_namespace(namespace)
+        self._count('clear')
 
-    def drop_inst(self, dbname):
+    def delete(self, key):
+        if self.context:
+            super(RedisCache, self).delete(key)
+        else:
+            namespace = self._namespace()
+            entry = self._entry(namespace, self._key(key))
+            self._pipeline().discard(namespace, entries={entry})
+            self._delete(namespace, [entry])
+            self._count('clear')
+
+    def clear_tags(self, tags):
         namespace = self._namespace()
-        self._client.delete(namespace)
+        tags = set(tags)
+        self._pipeline().discard(namespace, tags=tags)
+        tags_keys = [self._tags_key(namespace, t) for t in tags]
+        pipe = self._client.pipeline(transaction=False)
+        for tags_key in tags_keys:
+            pipe.smembers(tags_key)
+        entries = set()
+        for members in pipe.execute():
+            entries.update(members)
+        pipe = self._client.pipeline(transaction=False)
+        self._delete(namespace, entries, client=pipe)
+        pipe.delete(*tags_keys)
+        pipe.srem(self._tags_key(namespace), *tags)
+        pipe.execute()
+        self._count('clear')
+
+    def drop_inst(self, dbname):
+        self._delete_namespace(self._namespace(dbname))
+
+    def size(self, dbname):
+        return self._client.zcard(self._lru_key(self._namespace(dbname)))
 
     @classmethod
     def clean_inst(self, dbname, timestamps):
         pass
 
+    @classmethod
+    def has_resets(cls, dbname):
+        return False
+
     @classmethod
     def resets_cls(cls, dbname, cursor, table):
         pass
+
+
+class RedisNearCache(RedisCache):
+    """
+    A RedisCache with a per-process LRU in front of redis.
+
+    Entries are kept packed in the local LRU so a hit skips the network round
+    trip. Clears are broadcasted on the inter-workers channel to drop the
+    local entries of the other processes. When the listener is not running,
+    the local LRU is bypassed to stay coherent.
+    """
+
+    def __init__(self, name, size_limit=1024, context=True,
+            memory_limit=None, snapshot=True):
+        super(RedisNearCache, self).__init__(name, size_limit, context,
+            memory_limit, snapshot)
+        self._near = {}
+        self._near_generation = {}
+        self._near_lock = Lock()
+        self._stats['near_hit'] = 0
+
+    def _near_cache(self, dbname):
+        cache = self._near.get(dbname)
+        if cache is None:
+            cache = self._near[dbname] = SizedLRUDict(self.size_limit,
+                self.memory_limit)
+        return cache
+
+    def get(self, key, default=None):
+        from trytond import iwc
+        if not iwc.is_started():
+            self.clear_near()
+            return super(RedisNearCache, self).get(key, default)
+        result = self.get_many([key])
+        return result[key] if key in result else default
+
+    def set(self, key, value, tags=None):
+        self.set_many({key: value}, lambda k: tags)
+
+    def get_many(self, keys):
+        from trytond import iwc
+        if not iwc.is_started():
+            self.clear_near()
+            return super(RedisNearCache, self).get_many(keys)
+        dbname = Transaction().database.name
+        namespace = self._namespace(dbname)
+        keys = [(k, self._entry(namespace, self._key(k))) for k in keys]
+        result, missing = {}, []
+        with self._near_lock:
+            cache = self._near_cache(dbname)
+            for raw_key, entry in keys:
+                if entry in cache:
+                    result[raw_key] = cache.touch(entry)
+                else:
+                    missing.append((raw_key, entry))
+            generation = self._near_generation.get(dbname, 0)
+        self._count('near_hit', len(result))
+        if missing:
+            values = self._fetch(namespace, [e for _, e in missing])
+            fetched = [(raw_key, entry, value)
+                for (raw_key, entry), value in zip(missing, values)
+                if value is not None]
+            with self._near_lock:
+                # Do not store values fetched before a concurrent clear
+                if generation == self._near_generation.get(dbname, 0):
+                    cache = self._near_cache(dbname)
+                    for _, entry, value in fetched:
+                        self._count('eviction', lru_set(cache, entry, value))
+            self.check_process_memory()
+            for raw_key, _, value in fetched:
+                result[raw_key] = value
+        self._count('hit', len(result))
+        self._count('miss', len(keys) - len(result))
+        return dict((k, unpack(v)) for k, v in result.iteritems())
+
+    def set_many(self, mapping, tags=None):
+        if self._skip_set():
+            return
+        dbname = Transaction().database.name
+        namespace = self._namespace(dbname)
+        items = [(k, self._entry(namespace, self._key(k)), pack(v))
+            for k, v in mapping.iteritems()]
+        with self._near_lock:
+            generation = self._near_generation.get(dbname, 0)
+        # The local LRU is filled when the transaction sends the writes
+        self._pipeline().near(self, namespace, dbname, generation)
+        self._store(namespace, items, tags)
+
+    def _fill_near(self, dbname, generation, items):
+        "Store the (entry, packed value) items unless cleared since generation"
+        from trytond import iwc
+        if not iwc.is_started():
+            return
+        with self._near_lock:
+            if generation != self._near_generation.get(dbname, 0):
+                return
+            cache = self._near_cache(dbname)
+            for entry, value in items:
+                self._count('eviction', lru_set(cache, entry, value))
+        self.check_process_memory()
+
+    def _broadcast_clear(self):
+        from trytond import iwc
+        dbname = Transaction().database.name
+        self.clear_near(dbname)
+        iwc.broadcast_clear_cache(dbname, self._name)
+
+    def clear(self):
+        super(RedisNearCache, self).clear()
+        self._broadcast_clear()
+
+    def delete(self, key):
+        super(RedisNearCache, self).delete(key)
+        if not self.context:
+            # clear_tags already broadcasted
+            self._broadcast_clear()
+
+    def clear_tags(self, tags):
+        super(RedisNearCache, self).clear_tags(tags)
+        self._broadcast_clear()
+
+    def drop_inst(self, dbname):
+        super(RedisNearCache, self).drop_inst(dbname)
+        self.clear_near(dbname)
+
+    def memory_usage(self):
+        with self._near_lock:
+            return sum(c.memory for c in self._near.itervalues())
+
+    def _shrink(self):
+        with self._near_lock:
+            freed = _shrink_lru(self._near.values())
+            if freed:
+                self._count('eviction')
+            return freed
+
+    def clear_near(self, dbname=None):
+        "Drop the local entries for dbname or for all databases"
+        with self._near_lock:
+            if dbname is None:
+                dbnames = self._near.keys()
+            else:
+                dbnames = [dbname]
+            for dbname in dbnames:
+                self._near.pop(dbname, None)
+                self._near_generation[dbname] = (
+                    self._near_generation.get(dbname, 0) + 1)
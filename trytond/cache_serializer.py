@@ -38,6 +38,11 @@ def encode_hook(o):
             '__set__': True,
             'data': tuple(o)
         }
+    if isinstance(o, frozenset):
+        return {
+            '__frozenset__': True,
+            'data': tuple(o)
+        }
     return o
 
 
@@ -54,6 +59,8 @@ def decode_hook(o):
         return datetime.timedelta(o['data'])
     elif '__set__' in o:
         return set(o['data'])
+    elif '__frozenset__' in o:
+        return frozenset(o['data'])
     return o
 
 
@@ -61,5 +68,6 @@ def pack(value):
     return msgpack.packb(value, use_bin_type=True, default=encode_hook)
 
 
-def unpack(bundle):
-    return msgpack.unpackb(bundle, encoding='utf-8', object_hook=decode_hook)
+def unpack(bundle, use_list=True):
+    return msgpack.unpackb(bundle, encoding='utf-8', object_hook=decode_hook,
+        use_list=use_list)
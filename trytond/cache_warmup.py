@@ -0,0 +1,208 @@
+# This file is part of Tryton.  The COPYRIGHT file at the top level of
+# this repository contains the full copyright notices and license terms.
+"""
+Warm-up of the caches after the pool initialisation.
+
+The caches are loaded from the snapshot written periodically by the other
+processes and then filled for the models and users of the configuration.
+The requests on the database wait for the warm-up to finish.
+"""
+import os
+import logging
+import threading
+import time
+
+from sql import Table
+
+from trytond.config import config
+from trytond.transaction import Transaction
+from trytond.cache import BaseCache, FrozenMemoryCache
+from trytond.cache_serializer import pack, unpack
+
+__all__ = ['start', 'wait', 'warmup', 'snapshot', 'write_snapshot',
+    'load_snapshot']
+
+logger = logging.getLogger(__name__)
+_lock = threading.Lock()
+_ready = {}
+_snapshot_times = {}
+# The keys and the values are packed separately since version 2
+_SNAPSHOT_VERSION = 2
+
+
+def _config_list(option):
+    value = config.get('cache', option, default='') or ''
+    return [v.strip() for v in value.split(',') if v.strip()]
+
+
+def _snapshot_path(dbname):
+    path = config.get('cache', 'snapshot_path')
+    if path:
+        return os.path.join(path, '%s.snapshot' % dbname)
+
+
+def _instances():
+    names = set(_config_list('snapshot_caches'))
+    return [i for i in BaseCache._cache_instance
+        if i.snapshot and (not names or i._name in names)]
+
+
+def _timestamps():
+    "Return the timestamps of ir_cache per name"
+    table = Table('ir_cache')
+    cursor = Transaction().connection.cursor()
+    cursor.execute(*table.select(table.name, table.timestamp))
+    return dict(cursor.fetchall())
+
+
+def write_snapshot(dbname):
+    "Write the cache entries of the process for dbname to the snapshot"
+    path = _snapshot_path(dbname)
+    if not path:
+        return
+    with Transaction().start(dbname, 0, readonly=True):
+        timestamps = _timestamps()
+    caches = {}
+    for inst in _instances():
+        # Evict the entries reset before the timestamps
+        inst.clean_inst(dbname, timestamps)
+        entries = inst.dump(dbname)
+        if entries:
+            # The keys must be unpacked as tuples to be hashable
+            caches[inst._name] = [(pack(k), pack(v), t)
+                for k, v, t in entries]
+    data = pack({
+            'version': _SNAPSHOT_VERSION,
+            'timestamps': timestamps,
+            'caches': caches,
+            })
+    tmp_path = '%s.%s' % (path, os.getpid())
+    with open(tmp_path, 'wb') as fp:
+        fp.write(data)
+    os.rename(tmp_path, path)
+    logger.info('cache snapshot of "%s" written: %s entries', dbname,
+        sum(len(e) for e in caches.itervalues()))
+
+
+def load_snapshot(dbname):
+    "Load the snapshot into the caches and return if it existed"
+    path = _snapshot_path(dbname)
+    if not path or not os.path.exists(path):
+        return False
+    with open(path, 'rb') as fp:
+        data = unpack(fp.read())
+    if not isinstance(data, dict) or data.get('version') != _SNAPSHOT_VERSION:
+        logger.info('cache snapshot of "%s" ignored: unknown version', dbname)
+        return False
+    with Transaction().start(dbname, 0, readonly=True):
+        timestamps = _timestamps()
+    for inst in _instances():
+        entries = data['caches'].get(inst._name)
+        if entries:
+            # The values have the same types as when the cache is filled
+            # except for the frozen caches which freeze them
+            use_list = not isinstance(inst, FrozenMemoryCache)
+            entries = [(unpack(k, use_list=False), unpack(v, use_list), t)
+                for k, v, t in entries]
+            inst.load(dbname, entries, data['timestamps'], timestamps)
+    logger.info('cache snapshot of "%s" loaded', dbname)
+    return True
+
+
+def warmup_models(dbname):
+    "Fill the caches of the configured models for the configured users"
+    from trytond.pool import Pool
+    models = _config_list('warmup_models')
+    logins = _config_list('warmup_users')
+    if not models or not logins:
+        return
+    pool = Pool(dbname)
+    User = pool.get('res.user')
+    ModelAccess = pool.get('ir.model.access')
+    FieldAccess = pool.get('ir.model.field.access')
+    Rule = pool.get('ir.rule')
+    with Transaction().start(dbname, 0, readonly=True):
+        user_ids = [u.id for u in User.search([('login', 'in', logins)])]
+    for user_id in user_ids:
+        with Transaction().start(dbname, user_id,
+                readonly=True) as transaction:
+            preferences = User.get_preferences(context_only=True)
+            for model in models:
+                Model = pool.get(model)
+                # The context is converted as the one of the requests of a
+                # client to fill the same keys of the caches
+                _, _, context, _ = Model.__rpc__['fields_view_get'].convert(
+                    Model, dict(preferences))
+                with transaction.set_context(context):
+                    ModelAccess.get_access([model])
+                    FieldAccess.get_access([model])
+                    Rule.domain_get(model)
+                    for view_type in ('tree', 'form'):
+                        Model.fields_view_get(view_type=view_type)
+
+
+def warmup(dbname):
+    "Load the snapshot and fill the caches of the configured models"
+    start_time = time.time()
+    try:
+        load_snapshot(dbname)
+    except Exception:
+        logger.error('fail to load cache snapshot of "%s"', dbname,
+            exc_info=True)
+    try:
+        warmup_models(dbname)
+    except Exception:
+        logger.error('fail to warm up the cache of "%s"', dbname,
+            exc_info=True)
+    logger.info('cache of "%s" warmed up in %.3fs', dbname,
+        time.time() - start_time)
+
+
+def _run(dbname, event):
+    try:
+        warmup(dbname)
+    finally:
+        event.set()
+
+
+def start(dbname):
+    "Start the warm-up of dbname in the background if it is configured"
+    if not (_snapshot_path(dbname)
+            or (_config_list('warmup_models')
+                and _config_list('warmup_users'))):
+        return
+    event = threading.Event()
+    with _lock:
+        _ready[dbname] = event
+    thread = threading.Thread(target=_run, args=(dbname, event))
+    thread.daemon = True
+    thread.start()
+
+
+def wait(dbname):
+    "Wait for the warm-up of dbname to finish"
+    event = _ready.get(dbname)
+    if event is not None and not event.is_set():
+        event.wait(config.getint('cache', 'warmup_timeout'))
+
+
+def snapshot(dbname):
+    "Write the snapshot in the background if the interval is elapsed"
+    if not _snapshot_path(dbname):
+        return
+    now = time.time()
+    with _lock:
+        last = _snapshot_times.setdefault(dbname, now)
+        if now - last < config.getint('cache', 'snapshot_interval'):
+            return
+        _snapshot_times[dbname] = now
+
+    def target():
+        try:
+            write_snapshot(dbname)
+        except Exception:
+            logger.error('fail to write cache snapshot of "%s"', dbname,
+                exc_info=True)
+    thread = threading.Thread(target=target)
+    thread.daemon = True
+    thread.start()
@@ -57,6 +57,9 @@ def get_parser_admin():
         dest="update_modules_list", help="Update list of tryton modules")
     parser.add_argument("-l", "--language", dest="languages", nargs='+',
         default=[], metavar='CODE', help="Load language translations")
+    parser.add_argument("--cache-stats", action="store_true",
+        dest="cache_stats", help="Print the cache statistics of the "
+        "running processes")
 
     parser.epilog = ('The first time a database is initialized '
         'or when the password is set, the admin password is read '
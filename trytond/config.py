@@ -47,6 +47,11 @@ class TrytonConfigParser(ConfigParser.RawConfigParser):
         self.set('web', 'root', os.environ.get('TRYTOND_WEB_ROOT',
                 os.path.join(os.path.expanduser('~'), 'www')))
         self.set('web', 'bench', os.environ.get('TRYTOND_WEB_BENCH', None))
+        self.set('web', 'batch_limit', 100)
+        self.set('web', 'compression_level', 6)
+        self.set('web', 'compression_threshold', 1024)
+        self.set('web', 'server_timing', 'False')
+        self.set('web', 'timing_log', 'False')
         self.add_section('database')
         self.set('database', 'uri',
             os.environ.get('TRYTOND_DATABASE_URI', 'sqlite://'))
@@ -55,6 +60,11 @@ class TrytonConfigParser(ConfigParser.RawConfigParser):
         self.set('database', 'list', 'True')
         self.set('database', 'retry', 5)
         self.set('database', 'language', 'en')
+        self.set('database', 'replica_delay', 10)
+        self.set('database', 'pool_timeout', 30)
+        self.set('database', 'pool_lifetime', 3600)
+        self.set('database', 'pool_idle', 600)
+        self.set('database', 'pool_check', 30)
         self.add_section('cache')
         self.set('cache', 'model', 200)
         self.set('cache', 'record', 2000)
@@ -63,12 +73,20 @@ class TrytonConfigParser(ConfigParser.RawConfigParser):
         self.set('cache', 'class', os.environ.get('TRYTOND_CACHE_CLASS', None))
         self.set('cache', 'uri', os.environ.get('TRYTOND_CACHE_URI', None))
         self.set('cache', 'coog_cache_size', 1024)
+        self.set('cache', 'memory_limit', 0)
+        self.set('cache', 'process_memory_limit', 0)
+        self.set('cache', 'snapshot_interval', 300)
+        self.set('cache', 'warmup_timeout', 60)
         self.add_section('ssl')
         self.add_section('email')
         self.set('email', 'uri', 'smtp://localhost:25')
         self.add_section('session')
         self.set('session', 'authentications', 'password')
         self.set('session', 'timeout', 600)
+        self.set('session', 'store', None)
+        self.set('session', 'refresh', 60)
+        self.set('session', 'sweep_interval', 300)
+        self.set('session', 'credential_cache', 60)
         self.add_section('report')
         self.set('report', 'unoconv',
             'pipe,name=trytond;urp;StarOffice.ComponentContext')
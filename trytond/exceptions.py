@@ -40,6 +40,16 @@ class LoginException(TrytonException):
         self.code = 3
 
 
+class RateLimitException(TrytonException):
+    """Reject the login until retry_after seconds are elapsed."""
+
+    def __init__(self, retry_after):
+        super(RateLimitException, self).__init__(
+            'RateLimitException', retry_after)
+        self.retry_after = retry_after
+        self.code = 5
+
+
 class ConcurrencyException(TrytonException):
 
     def __init__(self, message):
@@ -456,14 +456,11 @@ class ModelAccess(ModelSQL, ModelView):
         ir_model = Model.__table__()
         user_group = UserGroup.__table__()
 
-        access = {}
-        for model in models:
-            maccess = cls._get_access_cache.get((user, model), default=-1)
-            if maccess == -1:
-                break
-            access[model] = maccess
-        else:
-            return access
+        cached = cls._get_access_cache.get_many(
+            [(user, model) for model in models])
+        if len(cached) == len(set(models)):
+            return dict((model, maccess)
+                for (_, model), maccess in cached.iteritems())
 
         default = {'read': True, 'write': True, 'create': True, 'delete': True}
         access = dict((m, default) for m in models)
@@ -483,8 +480,9 @@ class ModelAccess(ModelSQL, ModelView):
         access.update(dict(
                 (m, {'read': r, 'write': w, 'create': c, 'delete': d})
                 for m, r, w, c, d in cursor.fetchall()))
-        for model, maccess in access.iteritems():
-            cls._get_access_cache.set((user, model), maccess)
+        cls._get_access_cache.set_many(
+            dict(((user, m), a) for m, a in access.iteritems()),
+            tags=lambda key: [key[1]])
         return access
 
     @classmethod
@@ -542,27 +540,37 @@ class ModelAccess(ModelSQL, ModelView):
         else:
             return True
 
+    @staticmethod
+    def _cache_tags(accesses):
+        return set(a.model.model for a in accesses)
+
+    @classmethod
+    def _clear_cache(cls, tags):
+        cls._get_access_cache.clear_tags(tags)
+        ModelView._fields_view_get_cache.clear_tags(tags)
+
     @classmethod
     def write(cls, accesses, values, *args):
+        all_accesses = sum(args[::2], accesses)
+        tags = cls._cache_tags(all_accesses)
         super(ModelAccess, cls).write(accesses, values, *args)
         # Restart the cache
-        cls._get_access_cache.clear()
-        ModelView._fields_view_get_cache.clear()
+        tags |= cls._cache_tags(cls.browse(all_accesses))
+        cls._clear_cache(tags)
 
     @classmethod
     def create(cls, vlist):
         res = super(ModelAccess, cls).create(vlist)
         # Restart the cache
-        cls._get_access_cache.clear()
-        ModelView._fields_view_get_cache.clear()
+        cls._clear_cache(cls._cache_tags(res))
         return res
 
     @classmethod
     def delete(cls, accesses):
+        tags = cls._cache_tags(accesses)
         super(ModelAccess, cls).delete(accesses)
         # Restart the cache
-        cls._get_access_cache.clear()
-        ModelView._fields_view_get_cache.clear()
+        cls._clear_cache(tags)
 
 
 class ModelFieldAccess(ModelSQL, ModelView):
@@ -636,14 +644,11 @@ class ModelFieldAccess(ModelSQL, ModelView):
         model_field = ModelField.__table__()
         user_group = UserGroup.__table__()
 
-        accesses = {}
-        for model in models:
-            maccesses = cls._get_access_cache.get((user, model))
-            if maccesses is None:
-                break
-            accesses[model] = maccesses
-        else:
-            return accesses
+        cached = cls._get_access_cache.get_many(
+            [(user, model) for model in models])
+        if len(cached) == len(set(models)):
+            return dict((model, maccesses)
+                for (_, model), maccesses in cached.iteritems())
 
         default = {}
         accesses = dict((m, default) for m in models)
@@ -666,8 +671,9 @@ class ModelFieldAccess(ModelSQL, ModelView):
                 group_by=[ir_model.model, model_field.name]))
         for m, f, r, w, c, d in cursor.fetchall():
             accesses[m][f] = {'read': r, 'write': w, 'create': c, 'delete': d}
-        for model, maccesses in accesses.iteritems():
-            cls._get_access_cache.set((user, model), maccesses)
+        cls._get_access_cache.set_many(
+            dict(((user, m), a) for m, a in accesses.iteritems()),
+            tags=lambda key: [key[1]])
         return accesses
 
     @classmethod
@@ -697,27 +703,37 @@ class ModelFieldAccess(ModelSQL, ModelView):
                     return False
         return True
 
+    @staticmethod
+    def _cache_tags(field_accesses):
+        return set(a.field.model.model for a in field_accesses)
+
+    @classmethod
+    def _clear_cache(cls, tags):
+        cls._get_access_cache.clear_tags(tags)
+        ModelView._fields_view_get_cache.clear_tags(tags)
+
     @classmethod
     def write(cls, field_accesses, values, *args):
+        all_accesses = sum(args[::2], field_accesses)
+        tags = cls._cache_tags(all_accesses)
         super(ModelFieldAccess, cls).write(field_accesses, values, *args)
         # Restart the cache
-        cls._get_access_cache.clear()
-        ModelView._fields_view_get_cache.clear()
+        tags |= cls._cache_tags(cls.browse(all_accesses))
+        cls._clear_cache(tags)
 
     @classmethod
     def create(cls, vlist):
         res = super(ModelFieldAccess, cls).create(vlist)
         # Restart the cache
-        cls._get_access_cache.clear()
-        ModelView._fields_view_get_cache.clear()
+        cls._clear_cache(cls._cache_tags(res))
         return res
 
     @classmethod
     def delete(cls, field_accesses):
+        tags = cls._cache_tags(field_accesses)
         super(ModelFieldAccess, cls).delete(field_accesses)
         # Restart the cache
-        cls._get_access_cache.clear()
-        ModelView._fields_view_get_cache.clear()
+        cls._clear_cache(tags)
 
 
 class ModelButton(ModelSQL, ModelView):
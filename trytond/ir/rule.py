@@ -72,24 +72,33 @@ class RuleGroup(ModelSQL, ModelView):
     def default_perm_delete():
         return True
 
+    @staticmethod
+    def _cache_tags(groups):
+        return set(g.model.model for g in groups)
+
     @classmethod
     def delete(cls, groups):
+        tags = cls._cache_tags(groups)
         super(RuleGroup, cls).delete(groups)
         # Restart the cache on the domain_get method of ir.rule
-        Pool().get('ir.rule')._domain_get_cache.clear()
+        Pool().get('ir.rule')._domain_get_cache.clear_tags(tags)
 
     @classmethod
     def create(cls, vlist):
         res = super(RuleGroup, cls).create(vlist)
         # Restart the cache on the domain_get method of ir.rule
-        Pool().get('ir.rule')._domain_get_cache.clear()
+        Pool().get('ir.rule')._domain_get_cache.clear_tags(
+            cls._cache_tags(res))
         return res
 
     @classmethod
     def write(cls, groups, vals, *args):
+        all_groups = sum(args[::2], groups)
+        tags = cls._cache_tags(all_groups)
         super(RuleGroup, cls).write(groups, vals, *args)
         # Restart the cache on the domain_get method of ir.rule
-        Pool().get('ir.rule')._domain_get_cache.clear()
+        tags |= cls._cache_tags(cls.browse(all_groups))
+        Pool().get('ir.rule')._domain_get_cache.clear_tags(tags)
 
 
 class Rule(ModelSQL, ModelView):
@@ -211,7 +220,7 @@ class Rule(ModelSQL, ModelView):
                     )))
         ids = [x[0] for x in cursor.fetchall()]
         if not ids:
-            cls._domain_get_cache.set(key, None)
+            cls._domain_get_cache.set(key, None, tags=[model_name])
             return
         clause = {}
         clause_global = {}
@@ -261,7 +270,7 @@ class Rule(ModelSQL, ModelView):
         elif clause_global:
             clause = clause_global
 
-        cls._domain_get_cache.set(key, clause)
+        cls._domain_get_cache.set(key, clause, tags=[model_name])
         return clause
 
     @classmethod
@@ -276,21 +285,29 @@ class Rule(ModelSQL, ModelView):
                 Transaction().set_context(active_test=False, user=0):
             return Model.search(domain, order=[], query=True)
 
+    @staticmethod
+    def _cache_tags(rules):
+        return set(r.rule_group.model.model for r in rules)
+
     @classmethod
     def delete(cls, rules):
+        tags = cls._cache_tags(rules)
         super(Rule, cls).delete(rules)
         # Restart the cache on the domain_get method of ir.rule
-        cls._domain_get_cache.clear()
+        cls._domain_get_cache.clear_tags(tags)
 
     @classmethod
     def create(cls, vlist):
         res = super(Rule, cls).create(vlist)
         # Restart the cache on the domain_get method of ir.rule
-        cls._domain_get_cache.clear()
+        cls._domain_get_cache.clear_tags(cls._cache_tags(res))
         return res
 
     @classmethod
     def write(cls, rules, vals, *args):
+        all_rules = sum(args[::2], rules)
+        tags = cls._cache_tags(all_rules)
         super(Rule, cls).write(rules, vals, *args)
         # Restart the cache on the domain_get method
-        cls._domain_get_cache.clear()
+        tags |= cls._cache_tags(cls.browse(all_rules))
+        cls._domain_get_cache.clear_tags(tags)
@@ -4,8 +4,13 @@ import json
 import uuid
 import datetime
 
+from sql.aggregate import Count
+from sql.conditionals import Coalesce
+
 from trytond.model import ModelSQL, fields
 from trytond.config import config
+from trytond.tools import grouped_slice, reduce_ids
+from trytond.transaction import Transaction
 from .. import backend
 
 __all__ = [
@@ -37,24 +42,46 @@ class Session(ModelSQL):
     def default_key():
         return uuid.uuid4().hex
 
+    @staticmethod
+    def _expired():
+        "Return the oldest timestamp of a valid session"
+        return datetime.datetime.now() - datetime.timedelta(
+            seconds=config.getint('session', 'timeout'))
+
     @classmethod
     def check(cls, user, key):
-        "Check user key and delete old one"
-        now = datetime.datetime.now()
-        timeout = datetime.timedelta(
-            seconds=config.getint('session', 'timeout'))
+        "Check user key"
         sessions = cls.search([
                 ('create_uid', '=', user),
+                ('key', '=', key),
                 ])
-        find = False
-        for session in sessions:
-            timestamp = session.write_date or session.create_date
-            if abs(timestamp - now) < timeout:
-                if session.key == key:
-                    find = True
-            else:
-                cls.delete([session])
-        return find
+        expired = cls._expired()
+        return any((s.write_date or s.create_date) > expired
+            for s in sessions)
+
+    @classmethod
+    def count(cls, users):
+        "Return the number of valid sessions per user id"
+        table = cls.__table__()
+        cursor = Transaction().connection.cursor()
+        result = dict((u, 0) for u in users)
+        for sub_ids in grouped_slice(users):
+            cursor.execute(*table.select(table.create_uid, Count(table.id),
+                    where=reduce_ids(table.create_uid, sub_ids)
+                    & (Coalesce(table.write_date, table.create_date)
+                        > cls._expired()),
+                    group_by=table.create_uid))
+            result.update(cursor.fetchall())
+        return result
+
+    @classmethod
+    def clean(cls):
+        "Delete the expired sessions"
+        table = cls.__table__()
+        cursor = Transaction().connection.cursor()
+        cursor.execute(*table.delete(
+                where=Coalesce(table.write_date, table.create_date)
+                <= cls._expired()))
 
     @classmethod
     def reset(cls, session):
@@ -79,7 +79,7 @@ class Translation(ModelSQL, ModelView):
     overriding_module = fields.Char('Overriding Module', readonly=True)
     _translation_cache = Cache('ir.translation', size_limit=10240,
         context=False)
-    _get_language_cache = Cache('ir.translation.lang')
+    _get_language_cache = Cache('ir.translation.lang', context=('language',))
 
     @classmethod
     def __setup__(cls):
@@ -435,11 +435,12 @@ class Translation(ModelSQL, ModelView):
         # Don't use cache for fuzzy translation
         if not Transaction().context.get(
                 'fuzzy_translation', False):
+            cached = cls._translation_cache.get_many(
+                [(name, ttype, lang, obj_id) for obj_id in ids])
             for obj_id in ids:
-                trans = cls._translation_cache.get((name, ttype, lang, obj_id),
-                    -1)
-                if trans != -1:
-                    translations[obj_id] = trans
+                key = (name, ttype, lang, obj_id)
+                if key in cached:
+                    translations[obj_id] = cached[key]
                 else:
                     to_fetch.append(obj_id)
         else:
@@ -474,10 +475,14 @@ class Translation(ModelSQL, ModelView):
                         where=where))
                 translations.update(cursor)
         for res_id in ids:
-            value = translations.setdefault(res_id)
-            # Don't store fuzzy translation in cache
-            if not Transaction().context.get('fuzzy_translation', False):
-                cls._translation_cache.set((name, ttype, lang, res_id), value)
+            translations.setdefault(res_id)
+        # Don't store fuzzy translation in cache
+        if not Transaction().context.get('fuzzy_translation', False):
+            tags = [cls._cache_tag(name)]
+            cls._translation_cache.set_many(
+                dict(((name, ttype, lang, res_id), translations[res_id])
+                    for res_id in to_fetch),
+                tags=lambda key: tags)
         return translations
 
     @classmethod
@@ -633,16 +638,18 @@ class Translation(ModelSQL, ModelView):
                 res.update(cls.get_sources(list(sub_args)))
             return res
 
-        update_cache = False
+        keys = []
         for name, ttype, lang, source in args:
-            name = unicode(name)
-            ttype = unicode(ttype)
-            lang = unicode(lang)
             if source is not None:
                 source = unicode(source)
-            trans = cls._translation_cache.get((name, ttype, lang, source), -1)
-            if trans != -1:
-                res[(name, ttype, lang, source)] = trans
+            keys.append((unicode(name), unicode(ttype), unicode(lang), source))
+        cached = cls._translation_cache.get_many(keys)
+
+        update_cache = False
+        for key in keys:
+            name, ttype, lang, source = key
+            if key in cached:
+                res[key] = cached[key]
             else:
                 update_cache = True
                 parent_lang = get_parent(lang)
@@ -682,20 +689,31 @@ class Translation(ModelSQL, ModelView):
                         source = None
                     res[(name, ttype, lang, source)] = value
         if update_cache:
-            for key, value in res.iteritems():
-                cls._translation_cache.set(key, value)
+            cls._translation_cache.set_many(
+                dict((k, v) for k, v in res.iteritems() if k not in cached),
+                tags=lambda key: [cls._cache_tag(key[0])])
         return res
 
+    @staticmethod
+    def _cache_tag(name):
+        "Return the cache tag of the translation name"
+        return name.split(',')[0]
+
+    @classmethod
+    def _clear_cache(cls, names):
+        tags = set(cls._cache_tag(n) for n in names if n)
+        if tags:
+            cls._translation_cache.clear_tags(tags)
+            ModelView._fields_view_get_cache.clear_tags(tags)
+
     @classmethod
     def delete(cls, translations):
-        cls._translation_cache.clear()
-        ModelView._fields_view_get_cache.clear()
+        cls._clear_cache(t.name for t in translations)
         return super(Translation, cls).delete(translations)
 
     @classmethod
     def create(cls, vlist):
-        cls._translation_cache.clear()
-        ModelView._fields_view_get_cache.clear()
+        cls._clear_cache(v.get('name') for v in vlist)
         vlist = [x.copy() for x in vlist]
 
         cursor = Transaction().connection.cursor()
@@ -730,11 +748,11 @@ class Translation(ModelSQL, ModelView):
 
     @classmethod
     def write(cls, translations, values, *args):
-        cls._translation_cache.clear()
-        ModelView._fields_view_get_cache.clear()
         actions = iter((translations, values) + args)
         args = []
         for translations, values in zip(actions, actions):
+            cls._clear_cache(t.name for t in translations)
+            cls._clear_cache([values.get('name')])
             if 'src' in values:
                 values = values.copy()
                 values['src_md5'] = cls.get_src_md5(values.get('src'))
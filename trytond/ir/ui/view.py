@@ -213,24 +213,32 @@ class View(ModelSQL, ModelView):
     def set_arch(cls, views, name, value):
         cls.write(views, {'data': value})
 
+    @staticmethod
+    def _clear_cache(models):
+        ModelView._fields_view_get_cache.clear_tags(filter(None, models))
+
     @classmethod
     def delete(cls, views):
+        models = set(v.model for v in views)
         super(View, cls).delete(views)
         # Restart the cache
-        ModelView._fields_view_get_cache.clear()
+        cls._clear_cache(models)
 
     @classmethod
     def create(cls, vlist):
         views = super(View, cls).create(vlist)
         # Restart the cache
-        ModelView._fields_view_get_cache.clear()
+        cls._clear_cache(set(v.model for v in views))
         return views
 
     @classmethod
     def write(cls, views, values, *args):
+        all_views = sum(args[::2], views)
+        models = set(v.model for v in all_views)
         super(View, cls).write(views, values, *args)
         # Restart the cache
-        ModelView._fields_view_get_cache.clear()
+        models.update(v.model for v in cls.browse(all_views))
+        cls._clear_cache(models)
 
 
 class ShowViewStart(ModelView):
@@ -281,19 +289,23 @@ class ViewTreeWidth(ModelSQL, ModelView):
 
     @classmethod
     def delete(cls, records):
-        ModelView._fields_view_get_cache.clear()
+        ModelView._fields_view_get_cache.clear_tags(
+            set(r.model for r in records))
         super(ViewTreeWidth, cls).delete(records)
 
     @classmethod
     def create(cls, vlist):
         res = super(ViewTreeWidth, cls).create(vlist)
-        ModelView._fields_view_get_cache.clear()
+        ModelView._fields_view_get_cache.clear_tags(set(r.model for r in res))
         return res
 
     @classmethod
     def write(cls, records, values, *args):
+        all_records = sum(args[::2], records)
+        models = set(r.model for r in all_records)
         super(ViewTreeWidth, cls).write(records, values, *args)
-        ModelView._fields_view_get_cache.clear()
+        models.update(r.model for r in cls.browse(all_records))
+        ModelView._fields_view_get_cache.clear_tags(models)
 
     @classmethod
     def set_width(cls, model, fields):
@@ -3,6 +3,8 @@
 import os
 import threading
 import json
+import time
+import uuid
 from urlparse import urlparse
 import logging
 import redis
@@ -57,6 +59,58 @@ def broadcast_init_pool():
         logger.info('init pool(%s): %s =>>>', dbname, pid)
 
 
+def clear_cache_cb(data):
+    from trytond.cache import BaseCache
+    data = json.loads(data)
+    dbname = data['dbname']
+    name = data['name']
+    logger.debug('clear_cache(%s): %s <= %s', dbname, name, data['pid'])
+    for inst in BaseCache._cache_instance:
+        if inst._name == name and hasattr(inst, 'clear_near'):
+            inst.clear_near(dbname)
+
+
+def broadcast_clear_cache(dbname, name):
+    if is_started():
+        pid = os.getpid()
+        broker.publish('clear_cache', json.dumps(
+                {'pid': pid, 'dbname': dbname, 'name': name}))
+
+
+def cache_stats_cb(data):
+    from trytond.cache import BaseCache
+    data = json.loads(data)
+    stats = BaseCache.all_stats(data['dbname'])
+    pipe = broker.pipeline(transaction=False)
+    pipe.hset(data['key'], os.getpid(), json.dumps(stats))
+    pipe.expire(data['key'], 60)
+    pipe.execute()
+
+
+def collect_cache_stats(dbname, timeout=1):
+    "Return the cache stats of the running processes per pid"
+    client = _client()
+    key = 'cache_stats:%s' % uuid.uuid4().hex
+    client.publish('cache_stats', json.dumps(
+            {'dbname': dbname, 'key': key}))
+    time.sleep(timeout)
+    result = client.hgetall(key)
+    client.delete(key)
+    return dict((int(pid), json.loads(stats))
+        for pid, stats in result.iteritems())
+
+
+def _client():
+    redis_url = config.get('cache', 'uri')
+    assert redis_url, 'redis uri not set'
+    url = urlparse(redis_url)
+    assert url.scheme == 'redis', 'invalid redis url'
+    host = url.hostname
+    port = url.port
+    db = url.path.strip('/')
+    return redis.StrictRedis(host=host, port=port, db=db)
+
+
 def is_started():
     global listener
     return listener is not None and listener.started
@@ -70,15 +124,13 @@ def start():
         if broker:
             logger.warning('init_pool: already started on %s', os.getpid())
             return
-        redis_url = config.get('cache', 'uri')
-        if redis_url:
-            url = urlparse(redis_url)
-            assert url.scheme == 'redis', 'invalid redis url'
-            host = url.hostname
-            port = url.port
-            db = url.path.strip('/')
-            broker = redis.StrictRedis(host=host, port=port, db=db)
-            listener = Listener(broker, {'init_pool': init_pool_cb})
+        if config.get('cache', 'uri'):
+            broker = _client()
+            listener = Listener(broker, {
+                    'init_pool': init_pool_cb,
+                    'clear_cache': clear_cache_cb,
+                    'cache_stats': cache_stats_cb,
+                    })
             listener.start()
 
 
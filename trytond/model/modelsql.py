@@ -4,9 +4,10 @@ import datetime
 from itertools import islice, izip, chain, ifilter
 from collections import OrderedDict
 
-from sql import Table, Column, Literal, Desc, Asc, Expression, Null
+from sql import Table, Column, Literal, Desc, Asc, Expression, Null, Select, \
+    Values, Cast
 from sql.functions import CurrentTimestamp, Extract
-from sql.conditionals import Coalesce
+from sql.conditionals import Coalesce, Case
 from sql.operators import Or, And, Operator
 from sql.aggregate import Count, Max
 
@@ -487,7 +488,6 @@ class ModelSQL(ModelStorage):
         cursor = transaction.connection.cursor()
         pool = Pool()
         Translation = pool.get('ir.translation')
-        Rule = pool.get('ir.rule')
 
         super(ModelSQL, cls).create(vlist)
 
@@ -499,6 +499,9 @@ class ModelSQL(ModelStorage):
         defaults_cache = {}  # Store already computed default values
         new_ids = []
         vlist = [v.copy() for v in vlist]
+        # The consecutive records with the same columns are inserted together
+        # as (columns, vlist, rows)
+        batches = []
         for values in vlist:
             # Clean values
             for key in ('create_uid', 'create_date',
@@ -524,56 +527,56 @@ class ModelSQL(ModelStorage):
                 values.update(defaults)
                 defaults_cache.update(defaults)
 
-            insert_columns = [table.create_uid, table.create_date]
+            fnames = tuple(sorted(fname for fname in values
+                    if not hasattr(cls._fields[fname], 'set')))
             insert_values = [transaction.user, CurrentTimestamp()]
+            insert_values.extend(
+                cls._fields[fname].sql_format(values[fname])
+                for fname in fnames)
+            if batches and batches[-1][0] == fnames:
+                batches[-1][1].append(values)
+                batches[-1][2].append(insert_values)
+            else:
+                batches.append((fnames, [values], [insert_values]))
 
-            # Insert record
-            for fname, value in values.iteritems():
-                field = cls._fields[fname]
-                if not hasattr(field, 'set'):
-                    insert_columns.append(Column(table, fname))
-                    insert_values.append(field.sql_format(value))
-
-            try:
-                if transaction.database.has_returning():
-                    cursor.execute(*table.insert(insert_columns,
-                            [insert_values], [table.id]))
-                    id_new, = cursor.fetchone()
-                else:
-                    id_new = transaction.database.nextid(
-                        transaction.connection, cls._table)
-                    if id_new:
-                        insert_columns.append(table.id)
-                        insert_values.append(id_new)
+        if transaction.database.has_returning():
+            in_max = transaction.database.IN_MAX
+        else:
+            in_max = 1
+        for fnames, batch_vlist, rows in batches:
+            insert_columns = [table.create_uid, table.create_date]
+            insert_columns.extend(Column(table, fname) for fname in fnames)
+            for i in xrange(0, len(rows), in_max):
+                sub_rows = rows[i:i + in_max]
+                try:
+                    if transaction.database.has_returning():
                         cursor.execute(*table.insert(insert_columns,
-                                [insert_values]))
+                                sub_rows, [table.id]))
+                        # The sequence gives the ids in the order of the rows
+                        new_ids.extend(sorted(r for r, in cursor.fetchall()))
                     else:
-                        cursor.execute(*table.insert(insert_columns,
-                                [insert_values]))
-                        id_new = transaction.database.lastid(cursor)
-                new_ids.append(id_new)
-            except DatabaseIntegrityError, exception:
-                transaction = Transaction()
-                with Transaction().new_transaction(), \
-                        Transaction().set_context(_check_access=False):
-                    cls.__raise_integrity_error(
-                        exception, values, transaction=transaction)
-                raise
-
-        domain = Rule.domain_get(cls.__name__, mode='create')
-        if domain:
-            tables = {None: (table, None)}
-            tables, expression = cls.search_domain(
-                domain, active_test=False, tables=tables)
-            from_ = convert_from(None, tables)
-            for sub_ids in grouped_slice(new_ids):
-                sub_ids = list(sub_ids)
-                red_sql = reduce_ids(table.id, sub_ids)
+                        insert_values, = sub_rows
+                        id_new = transaction.database.nextid(
+                            transaction.connection, cls._table)
+                        if id_new:
+                            cursor.execute(*table.insert(
+                                    insert_columns + [table.id],
+                                    [insert_values + [id_new]]))
+                        else:
+                            cursor.execute(*table.insert(insert_columns,
+                                    [insert_values]))
+                            id_new = transaction.database.lastid(cursor)
+                        new_ids.append(id_new)
+                except DatabaseIntegrityError, exception:
+                    transaction = Transaction()
+                    with Transaction().new_transaction(), \
+                            Transaction().set_context(_check_access=False):
+                        for values in batch_vlist[i:i + in_max]:
+                            cls.__raise_integrity_error(
+                                exception, values, transaction=transaction)
+                    raise
 
-                cursor.execute(*from_.select(table.id,
-                        where=red_sql & expression))
-                if len(cursor.fetchall()) != len(sub_ids):
-                    cls.raise_user_error('access_error', cls.__name__)
+        cls.__check_create_rule(new_ids)
 
         transaction.create_records.setdefault(cls.__name__,
             set()).update(new_ids)
@@ -618,6 +621,140 @@ class ModelSQL(ModelStorage):
         cls.trigger_create(records)
         return records
 
+    @classmethod
+    def __check_create_rule(cls, ids):
+        "Check the created ids against the create rules"
+        Rule = Pool().get('ir.rule')
+        cursor = Transaction().connection.cursor()
+        table = cls.__table__()
+        domain = Rule.domain_get(cls.__name__, mode='create')
+        if domain:
+            tables = {None: (table, None)}
+            tables, expression = cls.search_domain(
+                domain, active_test=False, tables=tables)
+            from_ = convert_from(None, tables)
+            for sub_ids in grouped_slice(ids):
+                sub_ids = list(sub_ids)
+                red_sql = reduce_ids(table.id, sub_ids)
+
+                cursor.execute(*from_.select(table.id,
+                        where=red_sql & expression))
+                if len(cursor.fetchall()) != len(sub_ids):
+                    cls.raise_user_error('access_error', cls.__name__)
+
+    @classmethod
+    def bulk_load(cls, rows, fields_names):
+        """
+        Create records from the rows of values of fields_names and return
+        the number of records created.
+        The rows are copied by chunks into the table and then the chunks are
+        validated and triggered like by create.
+        Only the fields stored in the table can be loaded.
+        The ids are reserved with the table locked until the end of the
+        transaction on SQLite and without locking from the sequence on
+        PostgreSQL. The other backends fall back to create.
+        """
+        DatabaseIntegrityError = backend.get('DatabaseIntegrityError')
+        pool = Pool()
+        ModelAccess = pool.get('ir.model.access')
+        ModelFieldAccess = pool.get('ir.model.field.access')
+        Translation = pool.get('ir.translation')
+        transaction = Transaction()
+        database = transaction.database
+        cursor = transaction.connection.cursor()
+
+        if cls.table_query():
+            raise NotImplementedError('Can not create model with table_query')
+        ModelAccess.check(cls.__name__, 'create')
+        ModelFieldAccess.check(cls.__name__, fields_names, 'write')
+        magic_fields = {'id', 'create_uid', 'create_date', 'write_uid',
+            'write_date'}
+        for fname in fields_names:
+            field = cls._fields[fname]
+            if (fname in magic_fields
+                    or hasattr(field, 'set')
+                    or not field.sql_type()):
+                raise NotImplementedError(
+                    'Can not bulk load field "%s"' % fname)
+        transaction.counter += 1
+
+        defaults = cls.default_get(
+            [f for f in cls._fields
+                if f not in fields_names and f not in magic_fields],
+            with_rec_name=False)
+        defaults = cls._clean_defaults(defaults)
+        to_set = [(f, v) for f, v in defaults.iteritems()
+            if hasattr(cls._fields[f], 'set')]
+        default_names = sorted(f for f in defaults
+            if not hasattr(cls._fields[f], 'set'))
+        default_values = [cls._fields[f].sql_format(defaults[f])
+            for f in default_names]
+        formats = [cls._fields[f].sql_format for f in fields_names]
+        translated = [(i, f) for i, f in enumerate(fields_names)
+            if getattr(cls._fields[f], 'translate', False)]
+        translated_defaults = [(f, defaults[f]) for f in default_names
+            if getattr(cls._fields[f], 'translate', False)]
+
+        table = cls.__table__()
+        columns = [table.id, table.create_uid, table.create_date]
+        columns.extend(Column(table, f)
+            for f in chain(fields_names, default_names))
+        cursor.execute(*Select([CurrentTimestamp()]))
+        now, = cursor.fetchone()
+
+        count = 0
+        rows = iter(rows)
+        while True:
+            chunk = list(islice(rows, cache_size()))
+            if not chunk:
+                break
+            ids = database.nextids(
+                transaction.connection, cls._table, len(chunk))
+            if ids is None:
+                count += len(cls.create(
+                        [dict(izip(fields_names, r)) for r in chunk]))
+                continue
+            values = []
+            for id_, row in izip(ids, chunk):
+                row_values = [id_, transaction.user, now]
+                row_values.extend(f(v) for f, v in izip(formats, row))
+                row_values.extend(default_values)
+                values.append(row_values)
+            try:
+                database.copy_from(
+                    transaction.connection, table, columns, values)
+            except DatabaseIntegrityError, exception:
+                transaction = Transaction()
+                with Transaction().new_transaction(), \
+                        Transaction().set_context(_check_access=False):
+                    for row in chunk:
+                        row_values = defaults.copy()
+                        row_values.update(izip(fields_names, row))
+                        cls.__raise_integrity_error(
+                            exception, row_values, transaction=transaction)
+                raise
+
+            cls.__check_create_rule(ids)
+            transaction.create_records.setdefault(cls.__name__,
+                set()).update(ids)
+            for i, fname in translated:
+                Translation.set_ids('%s,%s' % (cls.__name__, fname), 'model',
+                    transaction.language, ids, [r[i] for r in chunk])
+            for fname, value in translated_defaults:
+                Translation.set_ids('%s,%s' % (cls.__name__, fname), 'model',
+                    transaction.language, ids, [value] * len(ids))
+            for fname, value in to_set:
+                cls._fields[fname].set(cls, fname, ids, value)
+            cls._insert_history(ids)
+
+            records = cls.browse(ids)
+            cls._validate(records)
+            field_names = cls._fields.keys()
+            cls._update_mptt(field_names, [ids] * len(field_names))
+            cls.trigger_create(records)
+            count += len(ids)
+        return count
+
     @classmethod
     def read(cls, ids, fields_names=None):
         pool = Pool()
@@ -860,15 +997,91 @@ class ModelSQL(ModelStorage):
 
         return result
 
+    @classmethod
+    def __check_write_rule(cls, ids):
+        "Check the ids exist and are allowed by the write rules"
+        Rule = Pool().get('ir.rule')
+        cursor = Transaction().connection.cursor()
+        table = cls.__table__()
+        domain = Rule.domain_get(cls.__name__, mode='write')
+        tables = {None: (table, None)}
+        if domain:
+            tables, dom_exp = cls.search_domain(
+                domain, active_test=False, tables=tables)
+        from_ = convert_from(None, tables)
+        for sub_ids in grouped_slice(ids):
+            sub_ids = list(sub_ids)
+            red_sql = reduce_ids(table.id, sub_ids)
+            where = red_sql
+            if domain:
+                where &= dom_exp
+            cursor.execute(*from_.select(table.id, where=where))
+            rowcount = cursor.rowcount
+            if rowcount == -1 or rowcount is None:
+                rowcount = len(cursor.fetchall())
+            if not rowcount == len({}.fromkeys(sub_ids)):
+                if domain:
+                    cursor.execute(*table.select(table.id, where=red_sql))
+                    rowcount = cursor.rowcount
+                    if rowcount == -1 or rowcount is None:
+                        rowcount = len(cursor.fetchall())
+                    if rowcount == len({}.fromkeys(sub_ids)):
+                        cls.raise_user_error('access_error', cls.__name__)
+                cls.raise_user_error('write_error', cls.__name__)
+
+    @classmethod
+    def __update(cls, fnames, rows):
+        """
+        Update the columns of fnames with the rows of (ids, values).
+        The rows must have distinct ids.
+        """
+        transaction = Transaction()
+        database = transaction.database
+        cursor = transaction.connection.cursor()
+        table = cls.__table__()
+
+        columns = [table.write_uid, table.write_date]
+        columns.extend(Column(table, fname) for fname in fnames)
+        update_values = [transaction.user, CurrentTimestamp()]
+        if len(rows) == 1 or not fnames:
+            ids = list(chain.from_iterable(r[0] for r in rows))
+            if len(rows) == 1:
+                update_values.extend(rows[0][1])
+            for sub_ids in grouped_slice(ids):
+                cursor.execute(*table.update(columns, update_values,
+                        where=reduce_ids(table.id, list(sub_ids))))
+            return
+
+        records = [[id_] + values for ids, values in rows for id_ in ids]
+        if database.has_update_from():
+            in_max = max(database.IN_MAX // (len(fnames) + 1), 1)
+            for i in xrange(0, len(records), in_max):
+                # The columns of VALUES are named column1, column2, ...
+                sub_records = Values(records[i:i + in_max])
+                cursor.execute(*table.update(columns, update_values + [
+                            Cast(Column(sub_records, 'column%s' % (j + 1)),
+                                cls._fields[fname].sql_type().base)
+                            for j, fname in enumerate(fnames, 1)],
+                        from_=[sub_records],
+                        where=table.id == Column(sub_records, 'column1')))
+        else:
+            in_max = max(database.IN_MAX // (2 * len(fnames) + 1), 1)
+            for i in xrange(0, len(records), in_max):
+                sub_records = records[i:i + in_max]
+                cursor.execute(*table.update(columns, update_values + [
+                            Case(*((table.id == r[0], r[j])
+                                    for r in sub_records))
+                            for j in xrange(1, len(fnames) + 1)],
+                        where=reduce_ids(table.id,
+                            [r[0] for r in sub_records])))
+
     @classmethod
     def write(cls, records, values, *args):
         DatabaseIntegrityError = backend.get('DatabaseIntegrityError')
         transaction = Transaction()
-        cursor = transaction.connection.cursor()
         pool = Pool()
         Translation = pool.get('ir.translation')
         Config = pool.get('ir.configuration')
-        Rule = pool.get('ir.rule')
 
         assert not len(args) % 2
         # Remove possible duplicates from all records
@@ -889,8 +1102,11 @@ class ModelSQL(ModelStorage):
 
         cls.__check_timestamp(all_ids)
 
-        fields_to_set = {}
+        # Group the consecutive actions which update the same columns of
+        # distinct records to update them with a single query
+        store_translation = Transaction().language == Config.get_language()
         actions = iter((records, values) + args)
+        vlist, batches = [], []
         for records, values in zip(actions, actions):
             ids = [r.id for r in records]
             values = values.copy()
@@ -900,55 +1116,42 @@ class ModelSQL(ModelStorage):
                     'write_uid', 'write_date', 'id'):
                 if key in values:
                     del values[key]
-
-            columns = [table.write_uid, table.write_date]
-            update_values = [transaction.user, CurrentTimestamp()]
-            store_translation = Transaction().language == Config.get_language()
-            for fname, value in values.iteritems():
-                field = cls._fields[fname]
-                if not hasattr(field, 'set'):
-                    if (not getattr(field, 'translate', False)
-                            or store_translation):
-                        columns.append(Column(table, fname))
-                        update_values.append(field.sql_format(value))
-
-            domain = Rule.domain_get(cls.__name__, mode='write')
-            tables = {None: (table, None)}
-            if domain:
-                tables, dom_exp = cls.search_domain(
-                    domain, active_test=False, tables=tables)
-            from_ = convert_from(None, tables)
-            for sub_ids in grouped_slice(ids):
-                sub_ids = list(sub_ids)
-                red_sql = reduce_ids(table.id, sub_ids)
-                where = red_sql
-                if domain:
-                    where &= dom_exp
-                cursor.execute(*from_.select(table.id, where=where))
-                rowcount = cursor.rowcount
-                if rowcount == -1 or rowcount is None:
-                    rowcount = len(cursor.fetchall())
-                if not rowcount == len({}.fromkeys(sub_ids)):
-                    if domain:
-                        cursor.execute(*table.select(table.id, where=red_sql))
-                        rowcount = cursor.rowcount
-                        if rowcount == -1 or rowcount is None:
-                            rowcount = len(cursor.fetchall())
-                        if rowcount == len({}.fromkeys(sub_ids)):
-                            cls.raise_user_error('access_error', cls.__name__)
-                    cls.raise_user_error('write_error', cls.__name__)
-                try:
-                    cursor.execute(*table.update(columns, update_values,
-                            where=red_sql))
-                except DatabaseIntegrityError, exception:
-                    transaction = Transaction()
-                    with Transaction().new_transaction(), \
-                            Transaction().set_context(_check_access=False):
+            vlist.append((ids, values))
+
+            fnames = tuple(sorted(fname for fname in values
+                    if not hasattr(cls._fields[fname], 'set')
+                    and (not getattr(cls._fields[fname], 'translate', False)
+                        or store_translation)))
+            update_values = [cls._fields[fname].sql_format(values[fname])
+                for fname in fnames]
+            if (batches and batches[-1][0] == fnames
+                    and batches[-1][3].isdisjoint(ids)):
+                batches[-1][1].append(values)
+                batches[-1][2].append((ids, update_values))
+                batches[-1][3].update(ids)
+            else:
+                batches.append((fnames, [values], [(ids, update_values)],
+                        set(ids)))
+
+        for fnames, batch_vlist, rows, _ in batches:
+            # The rules are checked against the updates of the previous
+            # batches like when each action was written in turn
+            cls.__check_write_rule(
+                list(chain.from_iterable(ids for ids, _ in rows)))
+            try:
+                cls.__update(fnames, rows)
+            except DatabaseIntegrityError, exception:
+                transaction = Transaction()
+                with Transaction().new_transaction(), \
+                        Transaction().set_context(_check_access=False):
+                    for values in batch_vlist:
                         cls.__raise_integrity_error(
                             exception, values, values.keys(),
                             transaction=transaction)
-                    raise
+                raise
 
+        fields_to_set = {}
+        for ids, values in vlist:
             for fname, value in values.iteritems():
                 field = cls._fields[fname]
                 if (getattr(field, 'translate', False)
@@ -72,7 +72,9 @@ class ModelStorage(Model):
                     'search': RPC(result=lambda r: map(int, r)),
                     'search_count': RPC(),
                     'search_read': RPC(),
+                    'search_read_stream': RPC(stream=True),
                     'export_data': RPC(instantiate=0),
+                    'export_data_stream': RPC(instantiate=0, stream=True),
                     'import_data': RPC(readonly=False),
                     })
         cls._constraints = []
@@ -390,6 +392,26 @@ class ModelStorage(Model):
         rows.sort(key=lambda r: index[r['id']])
         return rows
 
+    @classmethod
+    def search_read_stream(cls, domain, offset=0, limit=None, order=None,
+            fields_names=None):
+        '''
+        Like search_read but yield the rows read by chunks.
+        '''
+        records = cls.search(domain, offset=offset, limit=limit, order=order)
+
+        if not fields_names:
+            fields_names = cls._fields.keys()
+        if 'id' not in fields_names:
+            fields_names.append('id')
+        for sub_records in grouped_slice(records, cache_size()):
+            sub_records = list(sub_records)
+            rows = cls.read(map(int, sub_records), fields_names)
+            index = {r.id: i for i, r in enumerate(sub_records)}
+            rows.sort(key=lambda r: index[r['id']])
+            for row in rows:
+                yield row
+
     @classmethod
     def _search_domain_active(cls, domain, active_test=True):
         # reduce_domain return a new instance so we can safety modify domain
@@ -551,6 +573,18 @@ class ModelStorage(Model):
             data += cls.__export_row(record, fields_names)
         return data
 
+    @classmethod
+    def export_data_stream(cls, records, fields_names):
+        '''
+        Like export_data but yield the lines by chunks of records.
+        '''
+        fields_names = [x.split('/') for x in fields_names]
+        for sub_records in grouped_slice(records, cache_size()):
+            # Browse by chunk to release the cache of the exported records
+            for record in cls.browse(map(int, sub_records)):
+                for line in cls.__export_row(record, fields_names):
+                    yield line
+
     @classmethod
     def import_data(cls, fields_names, data):
         '''
@@ -76,6 +76,18 @@ def _inherit_apply(tree, inherit):
     return tree
 
 
+def _fields_view_get_tags(result):
+    "Return the models on which a fields_view_get result depends"
+    tags = {result['model']}
+    tags.update(result.get('children_definitions', {}))
+    for field in result['fields'].itervalues():
+        if field.get('relation'):
+            tags.add(field['relation'])
+        for view in field.get('views', {}).itervalues():
+            tags.update(_fields_view_get_tags(view))
+    return tags
+
+
 def on_change(func):
     @wraps(func)
     def wrapper(self, *args, **kwargs):
@@ -234,6 +246,7 @@ class ModelView(Model):
         if result:
             return result
         result = {'model': cls.__name__}
+        tags = {cls.__name__}
         pool = Pool()
         View = pool.get('ir.ui.view')
 
@@ -268,6 +281,7 @@ class ModelView(Model):
 
             # Check if view is not from an inherited model
             if view.model != cls.__name__:
+                tags.add(view.model)
                 Inherit = pool.get(view.model)
                 result['arch'] = Inherit.fields_view_get(
                         result['view_id'])['arch']
@@ -368,7 +382,8 @@ class ModelView(Model):
         else:
             result['children_definitions'] = {}
 
-        cls._fields_view_get_cache.set(key, result)
+        tags.update(_fields_view_get_tags(result))
+        cls._fields_view_get_cache.set(key, result, tags=tags)
         return result
 
     @classmethod
@@ -168,6 +168,9 @@ class Pool(object):
                     lang=lang)
             if restart:
                 self.init()
+            elif not update:
+                from trytond import cache_warmup
+                cache_warmup.start(self.database_name)
 
     def post_init(self, update):
         for hook in self._post_init_calls[self.database_name]:
@@ -3,6 +3,7 @@
 # this repository contains the full copyright notices and license terms.
 import logging
 import pydoc
+import sys
 
 from werkzeug.utils import redirect
 from werkzeug.exceptions import abort
@@ -10,14 +11,18 @@ from sql import Table
 
 from trytond import security
 from trytond import backend
+from trytond import timing
 from trytond.config import config
 from trytond import __version__
 from trytond.transaction import Transaction
 from trytond.cache import Cache
+from trytond import cache_warmup
+from trytond.session import get_store
 from trytond.exceptions import (
-    UserError, UserWarning, ConcurrencyException, LoginException)
+    UserError, UserWarning, ConcurrencyException, LoginException,
+    TrytonException)
 from trytond.tools import is_instance_method
-from trytond.wsgi import app
+from trytond.wsgi import app, format_traceback
 from trytond.perf_analyzer import PerfLog, profile
 from trytond.perf_analyzer import logger as perf_logger
 from trytond.sentry import sentry_wrap
@@ -40,6 +45,8 @@ def rpc(request, database_name):
         'system.methodHelp': help_method,
         'system.methodSignature': lambda *a: 'signatures not supported',
         }
+    if request.rpc_batch:
+        return _dispatch_batch(request, database_name)
     return methods.get(request.rpc_method, _dispatch)(
         request, database_name, *request.rpc_params)
 
@@ -122,8 +129,9 @@ def list_method(request, pool):
     return methods
 
 
-def get_object_method(request, pool):
-    method = request.rpc_method
+def get_object_method(request, pool, method=None):
+    if method is None:
+        method = request.rpc_method
     type, _ = method.split('.', 1)
     name = '.'.join(method.split('.')[1:-1])
     method = method.split('.')[-1]
@@ -137,19 +145,78 @@ def help_method(request, pool):
     return pydoc.getdoc(getattr(obj, method))
 
 
-@sentry_wrap  # hide tech exceptions and send then to sentry
-@app.auth_required
-@with_pool
-def _dispatch(request, pool, *args, **kwargs):
-    DatabaseOperationalError = backend.get('DatabaseOperationalError')
-
-    obj, method = get_object_method(request, pool)
+def _get_rpc(obj, method):
     if method in obj.__rpc__:
-        rpc = obj.__rpc__[method]
+        return obj.__rpc__[method]
     else:
         raise UserError('Calling method %s on %s is not allowed'
             % (method, obj))
 
+
+def _call(rpc_method, obj, method, rpc, args, kwargs):
+    "Call the method in the current transaction"
+    transaction = Transaction()
+    try:
+        PerfLog().on_enter(transaction.user,
+            transaction.context.get('session'), rpc_method, args, kwargs)
+    except:
+        perf_logger.exception('on_enter failed')
+    with timing.phase('convert'):
+        c_args, c_kwargs, transaction.context, transaction.timestamp \
+            = rpc.convert(obj, *args, **kwargs)
+    meth = getattr(obj, method)
+    try:
+        wrapped_meth = profile(meth)
+    except:
+        perf_logger.exception('profile failed')
+    else:
+        meth = wrapped_meth
+    with timing.phase('method'):
+        if (rpc.instantiate is None
+                or not is_instance_method(obj, method)):
+            return rpc.result(meth(*c_args, **c_kwargs))
+        else:
+            assert rpc.instantiate == 0
+            inst = c_args.pop(0)
+            if hasattr(inst, method):
+                return rpc.result(meth(inst, *c_args, **c_kwargs))
+            else:
+                return [rpc.result(meth(i, *c_args, **c_kwargs))
+                    for i in inst]
+
+
+def _log_error(log_message, log_args):
+    if isinstance(sys.exc_info()[1], (ConcurrencyException, UserError,
+                UserWarning, LoginException)):
+        logger.debug(log_message, *log_args, exc_info=True)
+    else:
+        logger.error(log_message, *log_args, exc_info=True)
+
+
+def _leave(result):
+    logger.debug('Result: %s', result)
+    try:
+        PerfLog().on_leave(result)
+    except:
+        perf_logger.exception('on_leave failed')
+
+
+def _reset_session(request, pool):
+    if request.authorization.type == 'session':
+        with timing.phase('session'):
+            get_store().reset(pool.database_name,
+                request.authorization.get('session'))
+
+
+def _execute(request, pool, rpc_method, args, kwargs, stream=False):
+    """Execute the RPC method in its own transaction
+    If stream is set, the result of the streaming methods is an iterator
+    which ends the transaction."""
+    DatabaseOperationalError = backend.get('DatabaseOperationalError')
+
+    obj, method = get_object_method(request, pool, rpc_method)
+    rpc = _get_rpc(obj, method)
+
     log_message = '%s.%s(*%s, **%s) from %s@%s/%s'
     log_args = (obj, method, args, kwargs,
         request.authorization.username, request.remote_addr, request.path)
@@ -160,63 +227,225 @@ def _dispatch(request, pool, *args, **kwargs):
     if request.authorization.type == 'session':
         session = request.authorization.get('session')
 
+    if rpc.stream and stream:
+        return _execute_stream(pool, obj, method, rpc, rpc_method, args,
+            kwargs, user, session, log_message, log_args)
+
     for count in range(config.getint('database', 'retry'), -1, -1):
         with Transaction().start(pool.database_name, user,
                 readonly=rpc.readonly,
                 context={'session': session}) as transaction:
-            Cache.clean(pool.database_name)
+            with timing.phase('cache_clean'):
+                Cache.clean(pool.database_name)
             try:
-                PerfLog().on_enter(user, session,
-                    request.rpc_method, args, kwargs)
-            except:
-                perf_logger.exception('on_enter failed')
-            try:
-                c_args, c_kwargs, transaction.context, transaction.timestamp \
-                    = rpc.convert(obj, *args, **kwargs)
-                meth = getattr(obj, method)
-                try:
-                    wrapped_meth = profile(meth)
-                except:
-                    perf_logger.exception('profile failed')
-                else:
-                    meth = wrapped_meth
-                if (rpc.instantiate is None
-                        or not is_instance_method(obj, method)):
-                    result = rpc.result(meth(*c_args, **c_kwargs))
-                else:
-                    assert rpc.instantiate == 0
-                    inst = c_args.pop(0)
-                    if hasattr(inst, method):
-                        result = rpc.result(meth(inst, *c_args, **c_kwargs))
-                    else:
-                        result = [rpc.result(meth(i, *c_args, **c_kwargs))
-                            for i in inst]
+                result = _call(rpc_method, obj, method, rpc, args, kwargs)
+                if rpc.stream:
+                    result = list(result)
             except DatabaseOperationalError:
                 if count and not rpc.readonly:
                     transaction.rollback()
                     continue
                 logger.error(log_message, *log_args, exc_info=True)
                 raise
-            except (ConcurrencyException, UserError, UserWarning,
-                    LoginException):
-                logger.debug(log_message, *log_args, exc_info=True)
-                raise
             except Exception:
-                logger.error(log_message, *log_args, exc_info=True)
+                _log_error(log_message, log_args)
                 raise
             # Need to commit to unlock SQLite database
-            transaction.commit()
-            Cache.resets(pool.database_name)
-        if request.authorization.type == 'session':
-            try:
-                with Transaction().start(pool.database_name, 0) as transaction:
-                    Session = pool.get('ir.session')
-                    Session.reset(request.authorization.get('session'))
-            except DatabaseOperationalError:
-                logger.debug('Reset session failed', exc_info=True)
-        logger.debug('Result: %s', result)
-        try:
-            PerfLog().on_leave(result)
-        except:
-            perf_logger.exception('on_leave failed')
+            with timing.phase('commit'):
+                transaction.commit()
+            with timing.phase('cache_resets'):
+                Cache.resets(pool.database_name)
+        cache_warmup.snapshot(pool.database_name)
         return result
+
+
+_end = object()
+
+
+def _execute_stream(pool, obj, method, rpc, rpc_method, args, kwargs, user,
+        session, log_message, log_args):
+    "Return an iterator over the result which keeps the transaction open"
+    transaction = Transaction().start(pool.database_name, user,
+        readonly=True, context={'session': session})
+    try:
+        with timing.phase('cache_clean'):
+            Cache.clean(pool.database_name)
+        iterator = iter(_call(rpc_method, obj, method, rpc, args, kwargs))
+        # Raise the errors of the start before sending the response
+        first = next(iterator, _end)
+    except Exception:
+        _log_error(log_message, log_args)
+        transaction.__exit__(*sys.exc_info())
+        raise
+
+    return ResultStream(transaction, first, iterator, log_message, log_args)
+
+
+class ResultStream(object):
+    '''
+    Iterator over the result of a streamed call.
+    The transaction is closed at the end of the iteration or by close even
+    if the iteration has not started.
+    '''
+
+    def __init__(self, transaction, first, iterator, log_message, log_args):
+        self._transaction = transaction
+        self._first = first
+        self._iterator = iterator
+        self._log_message = log_message
+        self._log_args = log_args
+        self._callbacks = []
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        if self._transaction is None:
+            raise StopIteration
+        if self._first is not _end:
+            value, self._first = self._first, _end
+            return value
+        try:
+            return next(self._iterator)
+        except StopIteration:
+            self.close()
+            raise
+        except Exception:
+            _log_error(self._log_message, self._log_args)
+            self._exit(*sys.exc_info())
+            raise
+    __next__ = next
+
+    def close(self):
+        transaction = self._transaction
+        self._exit(None, None, None)
+        if transaction is not None:
+            for callback in self._callbacks:
+                callback()
+
+    def call_on_close(self, func):
+        "Call func after the transaction is successfully closed"
+        self._callbacks.append(func)
+
+    def _exit(self, type, value, traceback):
+        transaction, self._transaction = self._transaction, None
+        if transaction is not None:
+            transaction.__exit__(type, value, traceback)
+
+
+# hide tech exceptions of the calls of a batch and send then to sentry
+_execute_wrapped = sentry_wrap(_execute)
+_call_wrapped = sentry_wrap(_call)
+
+
+@sentry_wrap  # hide tech exceptions and send then to sentry
+@app.auth_required
+@with_pool
+def _dispatch(request, pool, *args, **kwargs):
+    result = _execute(request, pool, request.rpc_method, args, kwargs,
+        stream=True)
+    if isinstance(result, ResultStream):
+        # The transaction of a streamed result is still open
+        result.call_on_close(lambda: _reset_session(request, pool))
+    else:
+        _reset_session(request, pool)
+    _leave(result)
+    return result
+
+
+def _batch_error(exception):
+    "Return the exception as the result of a call of a batch"
+    if not isinstance(exception, TrytonException):
+        exception.__format_traceback__ = format_traceback()
+    return exception
+
+
+def _batch_readonly(pool, rpc_method):
+    try:
+        obj, method = get_object_method(None, pool, rpc_method)
+        return _get_rpc(obj, method).readonly
+    except Exception:
+        return False
+
+
+@app.auth_required
+@with_pool
+def _dispatch_batch(request, pool):
+    """
+    Execute the calls of a batch and return the list of the results.
+    A failed call returns its exception.
+    Consecutive read-only calls share one transaction if
+    batch_shared_transaction is set.
+    """
+    calls = request.parsed_data
+    if len(calls) > config.getint('web', 'batch_limit'):
+        abort(413)
+    user = request.user_id
+    session = None
+    if request.authorization.type == 'session':
+        session = request.authorization.get('session')
+    shared = config.getboolean('web', 'batch_shared_transaction',
+        default=False)
+    results = []
+    i = 0
+    while i < len(calls):
+        j = i
+        if shared:
+            while (j < len(calls)
+                    and _batch_readonly(pool, calls[j]['method'])):
+                j += 1
+        if j - i > 1:
+            results.extend(_execute_shared(
+                    request, pool, user, session, calls[i:j]))
+            i = j
+            continue
+        call = calls[i]
+        try:
+            result = _execute_wrapped(request, pool, call['method'],
+                call['params'], {})
+        except Exception, e:
+            result = _batch_error(e)
+        else:
+            _leave(result)
+        results.append(result)
+        i += 1
+    if not all(isinstance(r, Exception) for r in results):
+        _reset_session(request, pool)
+    return results
+
+
+def _execute_shared(request, pool, user, session, calls):
+    "Execute the read-only calls in one transaction"
+    results = []
+    with Transaction().start(pool.database_name, user, readonly=True,
+            context={'session': session}) as transaction:
+        with timing.phase('cache_clean'):
+            Cache.clean(pool.database_name)
+        for call in calls:
+            rpc_method, args = call['method'], call['params']
+            log_message = '%s(*%s) from %s@%s/%s'
+            log_args = (rpc_method, args, request.authorization.username,
+                request.remote_addr, request.path)
+            logger.info(log_message, *log_args)
+            transaction.context = {'session': session}
+            transaction.timestamp = None
+            try:
+                obj, method = get_object_method(request, pool, rpc_method)
+                rpc = _get_rpc(obj, method)
+                result = _call_wrapped(
+                    rpc_method, obj, method, rpc, args, {})
+            except Exception, e:
+                _log_error(log_message, log_args)
+                results.append(_batch_error(e))
+                # Start from a clean state after a failure
+                transaction.rollback()
+                continue
+            _leave(result)
+            results.append(result)
+        # Need to commit to unlock SQLite database
+        with timing.phase('commit'):
+            transaction.commit()
+    with timing.phase('cache_resets'):
+        Cache.resets(pool.database_name)
+    cache_warmup.snapshot(pool.database_name)
+    return results
@@ -4,6 +4,10 @@ import datetime
 from decimal import Decimal
 import json
 import base64
+from json.encoder import encode_basestring_ascii as _esc
+from itertools import islice
+from threading import Lock
+from collections import Iterator
 
 from werkzeug.wrappers import Response, Headers
 from werkzeug.utils import cached_property
@@ -11,6 +15,7 @@ from werkzeug.exceptions import BadRequest, InternalServerError
 
 from trytond.protocols.wrappers import Request
 from trytond.exceptions import TrytonException
+from trytond.cache import LRUDict
 
 
 class JSONDecoder(object):
@@ -104,6 +109,137 @@ JSONEncoder.register(Decimal,
         })
 
 
+# Fields of the dictionaries of the serializers as JSON format and expression
+_FIELD_FORMATS = {
+    'year': ('%s', '{0}.year'),
+    'month': ('%s', '{0}.month'),
+    'day': ('%s', '{0}.day'),
+    'hour': ('%s', '{0}.hour'),
+    'minute': ('%s', '{0}.minute'),
+    'second': ('%s', '{0}.second'),
+    'microsecond': ('%s', '{0}.microsecond'),
+    'seconds': ('%r', '{0}.total_seconds()'),
+    'decimal': ('"%s"', '{0}'),
+    'base64': ('%s', "_esc(base64.encodestring({0}).decode('utf-8'))"),
+    }
+_SAMPLES = {
+    datetime.datetime: datetime.datetime(2000, 1, 1),
+    datetime.date: datetime.date(2000, 1, 1),
+    datetime.time: datetime.time(),
+    datetime.timedelta: datetime.timedelta(),
+    Decimal: Decimal(0),
+    bytearray: bytearray(),
+    }
+if bytes != str:
+    _SAMPLES[bytes] = bytes()
+_INF = float('inf')
+
+
+def _special_expression(klass):
+    "Return the expression of the JSON of {0} instance of klass"
+    sample = JSONEncoder.serializers[klass](_SAMPLES[klass])
+    formats, values = [], []
+    for key, value in sample.iteritems():
+        if key == '__class__':
+            formats.append(_esc(key) + ': ' + _esc(value).replace('%', '%%'))
+        else:
+            format_, value = _FIELD_FORMATS[key]
+            formats.append(_esc(key) + ': ' + format_)
+            values.append(value)
+    return '(%r %% (%s,))' % ('{' + ', '.join(formats) + '}',
+        ', '.join(values))
+
+
+class JSONRowsEncoder(object):
+    """
+    Encode like JSONEncoder but compile a function per shape of the lists of
+    dictionaries sharing the same keys (like the result of search_read).
+    """
+    expressions = {
+        type(None): "'null'",
+        bool: "('true' if {0} else 'false')",
+        # The row template formats the integers with %s like str
+        int: '{0}',
+        long: '{0}',
+        float: '(repr({0}) if -_INF < {0} < _INF else _encode({0}))',
+        str: '_esc({0})',
+        unicode: '_esc({0})',
+        }
+
+    def __init__(self, size_limit=128):
+        self.encoder = JSONEncoder()
+        self.expressions = self.expressions.copy()
+        for klass in _SAMPLES:
+            self.expressions[klass] = _special_expression(klass)
+        self._shapes = LRUDict(size_limit)
+        self._lock = Lock()
+
+    def encode(self, o):
+        type_ = type(o)
+        if type_ is list and len(o) > 1 and type(o[0]) is dict:
+            return self._encode_rows(o)
+        elif type_ is dict and all(type(k) in (str, unicode) for k in o):
+            return '{' + ', '.join(_esc(k) + ': ' + self.encode(v)
+                for k, v in o.iteritems()) + '}'
+        return self.encoder.encode(o)
+
+    def _encode_rows(self, rows):
+        keys = rows[0].keys()
+        if not all(type(k) in (str, unicode) for k in keys):
+            return self.encoder.encode(rows)
+        types = []
+        for key in keys:
+            # Use the type of the first value which is not None
+            for row in rows[:10]:
+                value = row.get(key) if type(row) is dict else None
+                if value is not None:
+                    break
+            types.append(type(value))
+        encode_row = self._compile(keys, tuple(types))
+        parts = []
+        append = parts.append
+        for row in rows:
+            if type(row) is dict and row.keys() == keys:
+                append(encode_row(row))
+            else:
+                append(self.encode(row))
+        return '[' + ', '.join(parts) + ']'
+
+    def _compile(self, keys, types):
+        shape = (tuple(keys), types)
+        with self._lock:
+            function = self._shapes.get(shape)
+        if function is not None:
+            return function
+        namespace = {
+            '_esc': _esc,
+            '_encode': self.encoder.encode,
+            '_INF': _INF,
+            'base64': base64,
+            }
+        names = ['v%d' % i for i in range(len(keys))]
+        expressions = []
+        for name, type_ in zip(names, types):
+            namespace['_t' + name] = type_
+            expression = self.expressions.get(type_)
+            if expression is None:
+                expressions.append('_encode(%s)' % name)
+            else:
+                expressions.append('(%s if type(%s) is _t%s else _encode(%s))'
+                    % (expression.replace('{0}', name), name, name, name))
+        template = '{' + ', '.join(_esc(k).replace('%', '%%') + ': %s'
+            for k in keys) + '}'
+        source = ('def encode_row(row):\n'
+            '    %s, = row.itervalues()\n'
+            '    return %r %% (%s,)\n' % (
+                ', '.join(names), template, ', '.join(expressions)))
+        exec source in namespace
+        function = namespace['encode_row']
+        with self._lock:
+            self._shapes[shape] = function
+        return function
+
+
 class JSONRequest(Request):
     parsed_content_type = 'json'
 
@@ -128,36 +264,91 @@ class JSONRequest(Request):
     def rpc_params(self):
         return self.parsed_data['params']
 
+    @cached_property
+    def rpc_batch(self):
+        data = self.parsed_data
+        if not isinstance(data, list):
+            return False
+        if not data or not all(isinstance(c, dict)
+                and isinstance(c.get('method'), basestring)
+                and isinstance(c.get('params'), list) for c in data):
+            raise BadRequest('Invalid JSON batch request')
+        return True
+
 
 class JSONProtocol:
     content_type = 'json'
+    mimetype = 'application/json'
 
     @classmethod
     def request(cls, environ):
         return JSONRequest(environ)
 
+    @staticmethod
+    def _response(call, data):
+        response = {'id': call.get('id', 0)}
+        if isinstance(data, TrytonException):
+            response['error'] = data.args
+        elif isinstance(data, Exception):
+            # report exception back to server
+            response['error'] = (str(data), data.__format_traceback__)
+        else:
+            response['result'] = data
+        return response
+
     @classmethod
     def response(cls, data, request):
         try:
             parsed_data = request.parsed_data
         except BadRequest:
             parsed_data = {}
+        headers = Headers()
+        if isinstance(data, Iterator):
+            if cls.stream_size and isinstance(parsed_data, dict):
+                headers.add('RPC-Method', parsed_data.get('method'))
+                return Response(cls.stream(parsed_data.get('id', 0), data),
+                    content_type=cls.mimetype, headers=headers)
+            data = list(data)
         if (isinstance(request, JSONRequest)
+                and isinstance(parsed_data, list)
+                and isinstance(data, list)):
+            response = [cls._response(c, d)
+                for c, d in zip(parsed_data, data)]
+            headers.add('RPC-Method', 'batch')
+        elif (isinstance(request, JSONRequest)
+                and isinstance(parsed_data, dict)
                 and set(parsed_data.keys()) == {'id', 'method', 'params'}):
-            response = {'id': parsed_data.get('id', 0)}
-            if isinstance(data, TrytonException):
-                response['error'] = data.args
-            elif isinstance(data, Exception):
-                # report exception back to server
-                response['error'] = (str(data), data.__format_traceback__)
-            else:
-                response['result'] = data
+            response = cls._response(parsed_data, data)
         else:
             if isinstance(data, Exception):
                 return InternalServerError(data)
             response = data
         # add RPC Method in HTTP headers (better logging)
-        headers = Headers()
-        headers.add('RPC-Method', parsed_data['method'])
-        return Response(json.dumps(response, cls=JSONEncoder),
-            content_type='application/json', headers=headers)
+        if isinstance(parsed_data, dict):
+            headers.add('RPC-Method', parsed_data.get('method'))
+        return Response(cls.dumps(response),
+            content_type=cls.mimetype, headers=headers)
+
+    encoder = JSONRowsEncoder()
+    # The number of values per chunk of the streamed results
+    stream_size = 1000
+
+    @classmethod
+    def dumps(cls, value):
+        return cls.encoder.encode(value)
+
+    @classmethod
+    def stream(cls, id_, values):
+        "Yield the chunks of the response of the values as a JSON array"
+        try:
+            yield '{"id": %s, "result": [' % cls.dumps(id_)
+            separator = ''
+            while True:
+                chunk = list(islice(values, cls.stream_size))
+                if not chunk:
+                    break
+                yield separator + cls.dumps(chunk)[1:-1]
+                separator = ', '
+            yield ']}'
+        finally:
+            values.close()
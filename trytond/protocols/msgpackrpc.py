@@ -0,0 +1,127 @@
+# This file is part of Tryton.  The COPYRIGHT file at the top level of
+# this repository contains the full copyright notices and license terms.
+import datetime
+from decimal import Decimal
+
+import msgpack
+from werkzeug.utils import cached_property
+from werkzeug.exceptions import BadRequest
+
+from trytond.protocols.jsonrpc import JSONRequest, JSONProtocol
+
+__all__ = ['MsgPackRequest', 'MsgPackProtocol', 'dumps', 'loads']
+
+# The ext types of the values which have no MessagePack type
+DECIMAL, DATE, DATETIME, TIME, TIMEDELTA, BYTES = range(1, 7)
+
+
+def _pack_tuple(value):
+    return msgpack.packb(value)
+
+
+def _unpack_tuple(data):
+    return msgpack.unpackb(data)
+
+
+def default(o):
+    if isinstance(o, Decimal):
+        return msgpack.ExtType(DECIMAL, str(o))
+    if isinstance(o, datetime.datetime):
+        return msgpack.ExtType(DATETIME, _pack_tuple((o.year, o.month, o.day,
+                    o.hour, o.minute, o.second, o.microsecond)))
+    if isinstance(o, datetime.date):
+        return msgpack.ExtType(DATE, _pack_tuple((o.year, o.month, o.day)))
+    if isinstance(o, datetime.time):
+        return msgpack.ExtType(TIME, _pack_tuple((o.hour, o.minute, o.second,
+                    o.microsecond)))
+    if isinstance(o, datetime.timedelta):
+        return msgpack.ExtType(TIMEDELTA, _pack_tuple(o.total_seconds()))
+    if isinstance(o, (bytearray, buffer)):
+        return msgpack.ExtType(BYTES, bytes(o))
+    if isinstance(o, (set, frozenset)):
+        return list(o)
+    raise TypeError('Can not serialize %r' % type(o))
+
+
+def ext_hook(code, data):
+    if code == DECIMAL:
+        return Decimal(data)
+    elif code == DATETIME:
+        return datetime.datetime(*_unpack_tuple(data))
+    elif code == DATE:
+        return datetime.date(*_unpack_tuple(data))
+    elif code == TIME:
+        return datetime.time(*_unpack_tuple(data))
+    elif code == TIMEDELTA:
+        return datetime.timedelta(seconds=_unpack_tuple(data))
+    elif code == BYTES:
+        return bytearray(data) if bytes == str else data
+    return msgpack.ExtType(code, data)
+
+
+_CONTAINERS = {dict, list, tuple, bytearray}
+
+
+def _has_binary(value):
+    type_ = type(value)
+    if type_ is bytearray:
+        return True
+    elif type_ is dict:
+        values = value.itervalues()
+    elif type_ is list or type_ is tuple:
+        values = value
+    else:
+        return False
+    return any(_has_binary(v) for v in values if type(v) in _CONTAINERS)
+
+
+def _binary(value):
+    "Return value with the bytearray as ext types"
+    if isinstance(value, bytearray):
+        return default(value)
+    elif isinstance(value, dict):
+        return dict((k, _binary(v)) for k, v in value.iteritems())
+    elif isinstance(value, (list, tuple)):
+        return [_binary(v) for v in value]
+    return value
+
+
+def dumps(value):
+    # Python 2 str are text like for JSON but the packer writes also natively
+    # the bytearray as text so they are converted first
+    if _has_binary(value):
+        value = _binary(value)
+    return msgpack.packb(value, use_bin_type=False, default=default)
+
+
+def loads(data):
+    return msgpack.unpackb(data, raw=False, ext_hook=ext_hook)
+
+
+class MsgPackRequest(JSONRequest):
+    parsed_content_type = 'msgpack'
+
+    @cached_property
+    def parsed_data(self):
+        if self.parsed_content_type in self.environ.get('CONTENT_TYPE', ''):
+            try:
+                return loads(self.decoded_data)
+            except Exception:
+                raise BadRequest('Unable to read MessagePack request')
+        else:
+            raise BadRequest('Not a MessagePack request')
+
+
+class MsgPackProtocol(JSONProtocol):
+    content_type = 'msgpack'
+    mimetype = 'application/msgpack'
+    # The length of the arrays is written before the values
+    stream_size = 0
+
+    @classmethod
+    def request(cls, environ):
+        return MsgPackRequest(environ)
+
+    @staticmethod
+    def dumps(value):
+        return dumps(value)
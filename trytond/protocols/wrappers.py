@@ -12,7 +12,7 @@ from werkzeug.http import wsgi_to_bytes, bytes_to_wsgi
 from werkzeug.datastructures import Authorization
 from werkzeug.exceptions import abort, HTTPException
 
-from trytond import security, backend
+from trytond import security, backend, cache_warmup
 from trytond.pool import Pool
 from trytond.transaction import Transaction
 from trytond.config import config
@@ -45,6 +45,10 @@ class Request(_Request):
     def rpc_params(self):
         return
 
+    @property
+    def rpc_batch(self):
+        return False
+
     @cached_property
     def authorization(self):
         authorization = super(Request, self).authorization
@@ -65,8 +69,7 @@ class Request(_Request):
             if not user_id:
                 abort(403)
         else:
-            user_id = security.login(
-                database_name, auth.username, auth, cache=False)
+            user_id = security.verify(database_name, auth.username, auth)
             if not user_id:
                 abort(401)
         return user_id
@@ -103,6 +106,7 @@ def with_pool(func):
         if database_name not in database_list:
             with Transaction().start(database_name, 0, readonly=True):
                 pool.init()
+        cache_warmup.wait(database_name)
         return func(request, pool, *args, **kwargs)
     return wrapper
 
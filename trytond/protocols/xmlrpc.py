@@ -3,6 +3,7 @@
 import xmlrpclib as client
 import datetime
 import logging
+from collections import Iterator
 
 # convert decimal to float before marshalling:
 from decimal import Decimal
@@ -167,6 +168,8 @@ class XMLProtocol:
 
     @classmethod
     def response(cls, data, request):
+        if isinstance(data, Iterator):
+            data = list(data)
         if isinstance(data, TrytonException):
             data = client.Fault(data.code, str(data))
         elif isinstance(data, Exception):
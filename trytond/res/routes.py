@@ -4,7 +4,12 @@ import logging
 import time
 import random
 
+from werkzeug.exceptions import abort
+
 from trytond.wsgi import app
+from trytond.cache import BaseCache
+from trytond.exceptions import RateLimitException
+from trytond.session import get_store
 from trytond.protocols.wrappers import with_pool, with_transaction
 
 logger = logging.getLogger(__name__)
@@ -12,11 +17,22 @@ logger = logging.getLogger(__name__)
 
 @app.route('/<database_name>/user/application/', methods=['POST', 'DELETE'])
 @with_pool
-@with_transaction(readonly=False)
 def user_application(request, pool):
+    if request.method == 'DELETE':
+        # Reject without a transaction nor a connection while throttled
+        login = request.parsed_data.get('user')
+        retry_after = get_store().login_retry_after(
+            pool.database_name, login or '')
+        if retry_after:
+            raise RateLimitException(retry_after)
+    return _user_application(request, pool)
+
+
+@with_transaction(readonly=False)
+def _user_application(request, pool):
     User = pool.get('res.user')
     UserApplication = pool.get('res.user.application')
-    LoginAttempt = pool.get('res.user.login.attempt')
+    store = get_store()
     data = request.parsed_data
     login = data.get('user')
 
@@ -46,7 +62,6 @@ def user_application(request, pool):
                     ]))
         return key
     elif request.method == 'DELETE':
-        time.sleep(2 ** LoginAttempt.count(login) - 1)
         applications = UserApplication.search([
                 ('user.login', '=', login),
                 ('key', '=', data.get('key')),
@@ -54,6 +69,20 @@ def user_application(request, pool):
                 ])
         if applications:
             UserApplication.delete(applications)
-            LoginAttempt.remove(login)
+            store.remove_login_failures(pool.database_name, login)
         else:
-            LoginAttempt.add(login)
+            store.add_login_failure(pool.database_name, login or '')
+
+
+@app.route('/<database_name>/cache/stats', methods=['GET'])
+@app.auth_required
+@with_pool
+@with_transaction()
+def cache_stats(request, pool):
+    User = pool.get('res.user')
+    ModelData = pool.get('ir.model.data')
+    user = User(request.user_id)
+    if ModelData.get_id('res', 'group_admin') not in [
+            g.id for g in user.groups]:
+        abort(403)
+    return BaseCache.all_stats(pool.database_name)
@@ -10,13 +10,9 @@ import datetime
 import logging
 import uuid
 from functools import wraps
-from itertools import groupby, ifilter
-from operator import attrgetter
 from ast import literal_eval
 
-from sql import Literal
 from sql.conditionals import Coalesce
-from sql.aggregate import Count
 from sql.operators import Concat
 
 try:
@@ -26,7 +22,6 @@ except ImportError:
 
 from ..model import ModelView, ModelSQL, Workflow, fields, Unique
 from ..wizard import Wizard, StateView, Button, StateTransition
-from ..tools import grouped_slice
 from .. import backend
 from ..transaction import Transaction
 from ..cache import Cache
@@ -35,6 +30,7 @@ from ..config import config
 from ..pyson import PYSONEncoder, Eval
 from ..rpc import RPC
 from ..exceptions import LoginException
+from .. import security
 
 __all__ = [
     'User', 'LoginAttempt', 'UserAction', 'UserGroup', 'Warning_',
@@ -77,9 +73,11 @@ class User(ModelSQL, ModelView):
     warnings = fields.One2Many('res.user.warning', 'user', 'Warnings')
     sessions = fields.Function(fields.Integer('Sessions'),
             'get_sessions')
-    _get_preferences_cache = Cache('res_user.get_preferences')
-    _get_groups_cache = Cache('res_user.get_groups')
-    _get_login_cache = Cache('res_user._get_login', context=False)
+    _get_preferences_cache = Cache('res_user.get_preferences',
+        snapshot=False)
+    _get_groups_cache = Cache('res_user.get_groups', snapshot=False)
+    _get_login_cache = Cache('res_user._get_login', context=False,
+        snapshot=False)
 
     @classmethod
     def __setup__(cls):
@@ -209,24 +207,10 @@ class User(ModelSQL, ModelView):
 
     @staticmethod
     def get_sessions(users, name):
-        Session = Pool().get('ir.session')
-        now = datetime.datetime.now()
-        timeout = datetime.timedelta(
-            seconds=config.getint('session', 'timeout'))
-        result = dict((u.id, 0) for u in users)
+        from trytond.session import get_store
         with Transaction().set_user(0):
-            for sub_ids in grouped_slice(users):
-                sessions = Session.search([
-                        ('create_uid', 'in', sub_ids),
-                        ], order=[('create_uid', 'ASC')])
-
-                def filter_(session):
-                    timestamp = session.write_date or session.create_date
-                    return abs(timestamp - now) < timeout
-                result.update(dict((i, len(list(g)))
-                        for i, g in groupby(ifilter(filter_, sessions),
-                            attrgetter('create_uid.id'))))
-        return result
+            return get_store().count(Transaction().database.name,
+                [u.id for u in users])
 
     @staticmethod
     def _convert_vals(vals):
@@ -257,9 +241,11 @@ class User(ModelSQL, ModelView):
     def write(cls, users, values, *args):
         actions = iter((users, values) + args)
         all_users = []
+        values_list = []
         args = []
         for users, values in zip(actions, actions):
             all_users += users
+            values_list.append(values)
             args.extend((users, cls._convert_vals(values)))
         super(User, cls).write(*args)
         # Clean cursor cache as it could be filled by domain_get
@@ -275,6 +261,10 @@ class User(ModelSQL, ModelView):
         cls._get_groups_cache.clear()
         # Restart the cache for _get_login
         cls._get_login_cache.clear()
+        # Forget the verified credentials
+        if any(set(v) & {'login', 'password', 'password_hash', 'active'}
+                for v in values_list):
+            security.clear_credentials()
         # Restart the cache for get_preferences
         cls._get_preferences_cache.clear()
         # Restart the cache of check
@@ -494,8 +484,9 @@ class User(ModelSQL, ModelView):
         '''
         Return user id if password matches
         '''
-        LoginAttempt = Pool().get('res.user.login.attempt')
-        time.sleep(2 ** LoginAttempt.count(login) - 1)
+        from trytond.session import get_store
+        store = get_store()
+        dbname = Transaction().database.name
         for method in config.get(
                 'session', 'authentications', default='password').split(','):
             try:
@@ -505,9 +496,9 @@ class User(ModelSQL, ModelView):
                 continue
             user_id = func(login, parameters)
             if user_id:
-                LoginAttempt.remove(login)
+                store.remove_login_failures(dbname, login)
                 return user_id
-        LoginAttempt.add(login)
+        store.add_login_failure(dbname, login)
 
     @classmethod
     def _login_password(cls, login, parameters):
@@ -623,14 +614,24 @@ class LoginAttempt(ModelSQL):
         cursor.execute(*table.delete(where=table.login == login))
 
     @classmethod
-    @_login_size
     def count(cls, login):
+        return cls.failures(login)[0]
+
+    @classmethod
+    @_login_size
+    def failures(cls, login):
+        "Return the number of failures and the time of the last one"
         cursor = Transaction().connection.cursor()
         table = cls.__table__()
-        cursor.execute(*table.select(Count(Literal(1)),
+        cursor.execute(*table.select(table.create_date,
                 where=(table.login == login)
                 & (table.create_date >= cls.delay())))
-        return cursor.fetchone()[0]
+        dates = [d for d, in cursor.fetchall()]
+        if not dates:
+            return 0, 0
+        # The creation dates are compared to now like in delay
+        elapsed = datetime.datetime.now() - max(dates)
+        return len(dates), time.time() - elapsed.total_seconds()
 
     del _login_size
 
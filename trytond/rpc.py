@@ -12,18 +12,22 @@ class RPC(object):
     instantiate: The position or the slice of the arguments to be instanciated
     result: The function to transform the result
     check_access: If access right must be checked
+    stream: The result is an iterator sent in chunks (only for readonly)
     '''
 
-    __slots__ = ('readonly', 'instantiate', 'result', 'check_access')
+    __slots__ = ('readonly', 'instantiate', 'result', 'check_access',
+        'stream')
 
     def __init__(self, readonly=True, instantiate=None, result=None,
-            check_access=True):
+            check_access=True, stream=False):
+        assert not stream or readonly, 'stream requires readonly'
         self.readonly = readonly
         self.instantiate = instantiate
         if result is None:
             result = lambda r: r
         self.result = result
         self.check_access = check_access
+        self.stream = stream
 
     def convert(self, obj, *args, **kwargs):
         args = list(args)
@@ -1,10 +1,64 @@
 # This file is part of Tryton.  The COPYRIGHT file at the top level of
 # this repository contains the full copyright notices and license terms.
+import hashlib
+import hmac
+import os
+import time
+
 from trytond.pool import Pool
 from trytond.config import config
 from trytond.transaction import Transaction
 from trytond import backend
-from trytond.exceptions import LoginException
+from trytond.exceptions import LoginException, RateLimitException
+from trytond.session import get_store
+from trytond.cache import MemoryCache
+
+
+class CredentialCache(MemoryCache):
+    """
+    Memory cache of the successful verifications of credentials.
+    The entries expire after ttl seconds and are never written to a snapshot.
+    """
+
+    def __init__(self, name, size_limit=1024):
+        super(CredentialCache, self).__init__(name, size_limit, context=False,
+            snapshot=False)
+        # The key of the digests exists only in the memory of the process
+        self._secret = os.urandom(32)
+
+    def digest(self, loginname, parameters):
+        "Return the keyed hash of the credentials"
+        return hmac.new(self._secret,
+            repr((loginname, sorted(parameters.items()))),
+            hashlib.sha256).digest()
+
+    def get_user(self, dbname, digest):
+        now = time.time()
+        with self._lock:
+            cache = self._cache.get(dbname)
+            try:
+                user_id, expire = cache.touch(digest)[0]
+            except (AttributeError, KeyError):
+                self._count('miss')
+                return
+            if expire < now:
+                del cache[digest]
+                self._count('miss')
+                return
+            self._count('hit')
+            return user_id
+
+    def set_user(self, dbname, digest, user_id, ttl):
+        with self._lock:
+            cache = self._cache.setdefault(dbname, self._new_lru())
+            cache[digest] = ((user_id, time.time() + ttl), None)
+            self._count('set')
+
+    def dump(self, dbname):
+        return []
+
+
+_credential_cache = CredentialCache('security.credentials')
 
 
 def _get_pool(dbname):
@@ -17,6 +71,10 @@ def _get_pool(dbname):
 
 def login(dbname, loginname, parameters, cache=True, language=None):
     DatabaseOperationalError = backend.get('DatabaseOperationalError')
+    # Reject without a transaction nor a connection while throttled
+    retry_after = get_store().login_retry_after(dbname, loginname)
+    if retry_after:
+        raise RateLimitException(retry_after)
     context = {'language': language}
     for count in range(config.getint('database', 'retry'), -1, -1):
         with Transaction().start(dbname, 0, context=context) as transaction:
@@ -36,49 +94,41 @@ def login(dbname, loginname, parameters, cache=True, language=None):
     if user_id:
         if not cache:
             return user_id
-        with Transaction().start(dbname, user_id):
-            Session = pool.get('ir.session')
-            session, = Session.create([{}])
-            return user_id, session.key
+        return user_id, get_store().new(dbname, user_id)
     return
 
 
+def verify(dbname, loginname, parameters):
+    """
+    Return the user id of the credentials
+    The successful verifications are remembered for credential_cache seconds.
+    """
+    ttl = config.getint('session', 'credential_cache')
+    if ttl:
+        digest = _credential_cache.digest(loginname, parameters)
+        user_id = _credential_cache.get_user(dbname, digest)
+        if user_id:
+            return user_id
+    user_id = login(dbname, loginname, parameters, cache=False)
+    if user_id and ttl:
+        _credential_cache.set_user(dbname, digest, user_id, ttl)
+    return user_id
+
+
+def clear_credentials():
+    "Forget the verified credentials of the database of the transaction"
+    _credential_cache.clear()
+
+
 def logout(dbname, user, session):
-    DatabaseOperationalError = backend.get('DatabaseOperationalError')
-    for count in range(config.getint('database', 'retry'), -1, -1):
-        with Transaction().start(dbname, 0):
-            pool = _get_pool(dbname)
-            Session = pool.get('ir.session')
-            try:
-                sessions = Session.search([
-                        ('key', '=', session),
-                        ])
-                if not sessions:
-                    return
-                session, = sessions
-                name = session.create_uid.login
-                Session.delete(sessions)
-            except DatabaseOperationalError:
-                if count:
-                    continue
-                raise
-        return name
+    if not get_store().remove(dbname, user, session):
+        return
+    with Transaction().start(dbname, 0, readonly=True):
+        pool = _get_pool(dbname)
+        User = pool.get('res.user')
+        return User(user).login
 
 
 def check(dbname, user, session):
-    DatabaseOperationalError = backend.get('DatabaseOperationalError')
-    for count in range(config.getint('database', 'retry'), -1, -1):
-        with Transaction().start(dbname, user) as transaction:
-            pool = _get_pool(dbname)
-            Session = pool.get('ir.session')
-            try:
-                if not Session.check(user, session):
-                    return
-                else:
-                    return user
-            except DatabaseOperationalError:
-                if count:
-                    continue
-                raise
-            finally:
-                transaction.commit()
+    if get_store().check(dbname, user, session):
+        return user
@@ -0,0 +1,294 @@
+# This file is part of Tryton.  The COPYRIGHT file at the top level of
+# this repository contains the full copyright notices and license terms.
+"""
+Stores of the user sessions.
+
+Every check of a session queries the store but the refreshes of its
+timestamp are coalesced by the process during ``refresh`` seconds. The
+expired sessions are removed by a sweep in the background.
+"""
+import logging
+import threading
+import time
+import uuid
+
+from trytond import backend
+from trytond.cache import LRUDict
+from trytond.config import config
+from trytond.tools import resolve
+from trytond.transaction import Transaction
+
+__all__ = ['SessionStore', 'DatabaseSessionStore', 'MemorySessionStore',
+    'get_store']
+
+logger = logging.getLogger(__name__)
+
+
+class SessionStore(object):
+    "Base class of the session stores"
+
+    def __init__(self, size_limit=10240):
+        self.timeout = config.getint('session', 'timeout')
+        self.refresh = config.getint('session', 'refresh')
+        self.sweep_interval = config.getint('session', 'sweep_interval')
+        self._lock = threading.Lock()
+        # (dbname, key) -> refreshed time
+        self._refreshed = LRUDict(size_limit)
+        self._sweep_times = {}
+
+    def _forget(self, dbname, key):
+        with self._lock:
+            self._refreshed.pop((dbname, key), None)
+
+    def new(self, dbname, user):
+        "Create a session for user and return its key"
+        key = uuid.uuid4().hex
+        self._new(dbname, user, key)
+        with self._lock:
+            self._refreshed[(dbname, key)] = time.time()
+        return key
+
+    def check(self, dbname, user, key):
+        "Return if key is a valid session of user"
+        self.sweep(dbname)
+        if not self._check(dbname, user, key):
+            self._forget(dbname, key)
+            return False
+        return True
+
+    def reset(self, dbname, key):
+        "Refresh the timestamp of the session at most once per refresh"
+        now = time.time()
+        with self._lock:
+            if now - self._refreshed.get((dbname, key), 0) < self.refresh:
+                return
+            self._refreshed.pop((dbname, key), None)
+            self._refreshed[(dbname, key)] = now
+        try:
+            self._reset(dbname, key)
+        except Exception:
+            logger.debug('Reset session failed', exc_info=True)
+
+    def remove(self, dbname, user, key):
+        "Remove the session and return if it existed"
+        self._forget(dbname, key)
+        return self._remove(dbname, user, key)
+
+    def count(self, dbname, users):
+        "Return the number of valid sessions per user"
+        return self._count(dbname, users)
+
+    def sweep(self, dbname):
+        "Remove the expired sessions in the background every sweep_interval"
+        now = time.time()
+        with self._lock:
+            if now - self._sweep_times.get(dbname, 0) < self.sweep_interval:
+                return
+            self._sweep_times[dbname] = now
+
+        def target():
+            try:
+                self._sweep(dbname)
+            except Exception:
+                logger.error('fail to sweep the sessions of "%s"', dbname,
+                    exc_info=True)
+        thread = threading.Thread(target=target)
+        thread.daemon = True
+        thread.start()
+
+    def login_failures(self, dbname, login):
+        "Return the number of failures and the time of the last one"
+        raise NotImplementedError
+
+    def add_login_failure(self, dbname, login):
+        raise NotImplementedError
+
+    def remove_login_failures(self, dbname, login):
+        raise NotImplementedError
+
+    def login_retry_after(self, dbname, login):
+        "Return the seconds to wait before the next login attempt"
+        failures, last = self.login_failures(dbname, login)
+        if not failures:
+            return 0
+        delay = min(2 ** failures - 1, self.timeout)
+        return max(last + delay - time.time(), 0)
+
+    def _new(self, dbname, user, key):
+        raise NotImplementedError
+
+    def _check(self, dbname, user, key):
+        raise NotImplementedError
+
+    def _reset(self, dbname, key):
+        raise NotImplementedError
+
+    def _remove(self, dbname, user, key):
+        raise NotImplementedError
+
+    def _count(self, dbname, users):
+        raise NotImplementedError
+
+    def _sweep(self, dbname):
+        pass
+
+
+class DatabaseSessionStore(SessionStore):
+    "Store the sessions in the ir.session table"
+
+    def _run(self, dbname, user, func, readonly=False, model='ir.session'):
+        from trytond.security import _get_pool
+        DatabaseOperationalError = backend.get('DatabaseOperationalError')
+        for count in range(config.getint('database', 'retry'), -1, -1):
+            with Transaction().start(dbname, user, readonly=readonly):
+                pool = _get_pool(dbname)
+                try:
+                    return func(pool.get(model))
+                except DatabaseOperationalError:
+                    if count:
+                        continue
+                    raise
+
+    def _new(self, dbname, user, key):
+        self._run(dbname, user, lambda Session: Session.create([{
+                        'key': key,
+                        }]))
+
+    def _check(self, dbname, user, key):
+        # Not readonly to not miss a session just created by another process
+        # on a lagging replica and as root to not keep the readonly
+        # transactions of the user on the primary after the commit
+        return self._run(dbname, 0, lambda Session: Session.check(user, key))
+
+    def _reset(self, dbname, key):
+        self._run(dbname, 0, lambda Session: Session.reset(key))
+
+    def _remove(self, dbname, user, key):
+        def remove(Session):
+            sessions = Session.search([
+                    ('key', '=', key),
+                    ])
+            Session.delete(sessions)
+            return bool(sessions)
+        return self._run(dbname, 0, remove)
+
+    def _count(self, dbname, users):
+        # Called inside the transaction of the database
+        from trytond.pool import Pool
+        Session = Pool().get('ir.session')
+        return Session.count(users)
+
+    def _sweep(self, dbname):
+        self._run(dbname, 0, lambda Session: Session.clean())
+
+    def _run_login_attempt(self, dbname, func):
+        # The failures are shared by the processes in the login attempt table
+        # and they are stored in the transaction of the login if any
+        transaction = Transaction()
+        if transaction.database and transaction.database.name == dbname:
+            from trytond.pool import Pool
+            return func(Pool().get('res.user.login.attempt'))
+        # Not readonly to not read the failures from a lagging replica
+        return self._run(dbname, 0, func, model='res.user.login.attempt')
+
+    def login_failures(self, dbname, login):
+        return self._run_login_attempt(dbname,
+            lambda LoginAttempt: LoginAttempt.failures(login))
+
+    def add_login_failure(self, dbname, login):
+        self._run_login_attempt(dbname,
+            lambda LoginAttempt: LoginAttempt.add(login))
+
+    def remove_login_failures(self, dbname, login):
+        self._run_login_attempt(dbname,
+            lambda LoginAttempt: LoginAttempt.remove(login))
+
+
+class MemorySessionStore(SessionStore):
+    """
+    Store the sessions in the memory of the process.
+    It must be used only with a single process.
+    """
+
+    def __init__(self, size_limit=10240):
+        super(MemorySessionStore, self).__init__(size_limit)
+        # dbname -> key -> [user, timestamp]
+        self._sessions = {}
+        # (dbname, login) -> (failures, last failure time)
+        self._failures = LRUDict(size_limit)
+
+    def _valid(self, timestamp):
+        return time.time() - timestamp < self.timeout
+
+    def _new(self, dbname, user, key):
+        with self._lock:
+            self._sessions.setdefault(dbname, {})[key] = [user, time.time()]
+
+    def _check(self, dbname, user, key):
+        session = self._sessions.get(dbname, {}).get(key)
+        return bool(session and session[0] == user
+            and self._valid(session[1]))
+
+    def _reset(self, dbname, key):
+        session = self._sessions.get(dbname, {}).get(key)
+        if session:
+            session[1] = time.time()
+
+    def _remove(self, dbname, user, key):
+        with self._lock:
+            return self._sessions.get(dbname, {}).pop(key, None) is not None
+
+    def _count(self, dbname, users):
+        result = dict((u, 0) for u in users)
+        with self._lock:
+            sessions = self._sessions.get(dbname, {}).values()
+        for user, timestamp in sessions:
+            if user in result and self._valid(timestamp):
+                result[user] += 1
+        return result
+
+    def _sweep(self, dbname):
+        with self._lock:
+            sessions = self._sessions.get(dbname, {})
+            for key, (_, timestamp) in sessions.items():
+                if not self._valid(timestamp):
+                    del sessions[key]
+
+    def _failures_key(self, dbname, login):
+        # The login attempts are limited to the size of the login field
+        return dbname, login[:512]
+
+    def login_failures(self, dbname, login):
+        with self._lock:
+            failures, last = self._failures.get(
+                self._failures_key(dbname, login), (0, 0))
+        if not self._valid(last):
+            return 0, 0
+        return failures, last
+
+    def add_login_failure(self, dbname, login):
+        failures, _ = self.login_failures(dbname, login)
+        key = self._failures_key(dbname, login)
+        with self._lock:
+            self._failures.pop(key, None)
+            self._failures[key] = (failures + 1, time.time())
+
+    def remove_login_failures(self, dbname, login):
+        with self._lock:
+            self._failures.pop(self._failures_key(dbname, login), None)
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    "Return the session store of the configuration"
+    global _store
+    with _store_lock:
+        if _store is None:
+            if config.get('session', 'store'):
+                _store = resolve(config.get('session', 'store'))()
+            else:
+                _store = DatabaseSessionStore()
+        return _store
@@ -0,0 +1,110 @@
+# This file is part of Tryton.  The COPYRIGHT file at the top level of
+# this repository contains the full copyright notices and license terms.
+import time
+from threading import Lock
+from urlparse import urlparse
+import redis
+
+from trytond.config import config
+from trytond.session import SessionStore
+
+__all__ = ['RedisSessionStore']
+
+
+class RedisSessionStore(SessionStore):
+    """
+    Store the sessions in Redis with the timeout as expiration.
+    The uri of the session section is used or the one of the cache section.
+    """
+    _client = None
+    _client_check_lock = Lock()
+
+    @classmethod
+    def ensure_client(cls):
+        with cls._client_check_lock:
+            if cls._client is None:
+                redis_uri = (config.get('session', 'uri')
+                    or config.get('cache', 'uri'))
+                assert redis_uri, 'redis uri not set'
+                url = urlparse(redis_uri)
+                assert url.scheme == 'redis', 'invalid redis url'
+                host = url.hostname
+                port = url.port
+                db = url.path.strip('/')
+                cls._client = redis.StrictRedis(host=host, port=port, db=db)
+
+    def __init__(self, size_limit=10240):
+        super(RedisSessionStore, self).__init__(size_limit)
+        self.ensure_client()
+
+    def _namespace(self, dbname):
+        # The hash tag keeps the keys of the database on the same node
+        return '{%s:session}' % dbname
+
+    def _key(self, dbname, key):
+        return self._namespace(dbname) + ':' + key
+
+    def _user_key(self, dbname, user):
+        return self._namespace(dbname) + '|%s' % user
+
+    def _new(self, dbname, user, key):
+        pipe = self._client.pipeline(transaction=False)
+        pipe.set(self._key(dbname, key), user, ex=self.timeout)
+        pipe.sadd(self._user_key(dbname, user), key)
+        pipe.execute()
+
+    def _check(self, dbname, user, key):
+        return self._client.get(self._key(dbname, key)) == str(user)
+
+    def _reset(self, dbname, key):
+        self._client.expire(self._key(dbname, key), self.timeout)
+
+    def _remove(self, dbname, user, key):
+        pipe = self._client.pipeline(transaction=False)
+        pipe.delete(self._key(dbname, key))
+        pipe.srem(self._user_key(dbname, user), key)
+        deleted, _ = pipe.execute()
+        return bool(deleted)
+
+    def _count(self, dbname, users):
+        pipe = self._client.pipeline(transaction=False)
+        for user in users:
+            pipe.smembers(self._user_key(dbname, user))
+        members = dict(zip(users, pipe.execute()))
+        result = {}
+        for user in users:
+            keys = list(members[user])
+            pipe = self._client.pipeline(transaction=False)
+            for key in keys:
+                pipe.exists(self._key(dbname, key))
+            exists = pipe.execute() if keys else []
+            expired = [k for k, e in zip(keys, exists) if not e]
+            if expired:
+                self._client.srem(self._user_key(dbname, user), *expired)
+            result[user] = len(keys) - len(expired)
+        return result
+
+    def _failures_key(self, dbname, login):
+        return self._namespace(dbname) + '#' + login[:512]
+
+    def login_failures(self, dbname, login):
+        failures, last = self._client.hmget(
+            self._failures_key(dbname, login), 'failures', 'last')
+        if not failures:
+            return 0, 0
+        return int(failures), float(last)
+
+    def add_login_failure(self, dbname, login):
+        key = self._failures_key(dbname, login)
+        pipe = self._client.pipeline(transaction=False)
+        pipe.hincrby(key, 'failures', 1)
+        pipe.hset(key, 'last', repr(time.time()))
+        pipe.expire(key, self.timeout)
+        pipe.execute()
+
+    def remove_login_failures(self, dbname, login):
+        self._client.delete(self._failures_key(dbname, login))
+
+    def sweep(self, dbname):
+        # The sessions expire in Redis
+        pass
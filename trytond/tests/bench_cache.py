@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+# This file is part of Tryton.  The COPYRIGHT file at the top level of
+# this repository contains the full copyright notices and license terms.
+"""
+Benchmark of the memory cache implementations.
+
+Usage: python -m trytond.tests.bench_cache [-n NUMBER]
+"""
+import argparse
+import timeit
+
+from trytond.transaction import Transaction
+from trytond.cache import SerializableMemoryCache, FrozenMemoryCache
+
+
+def fields_view_get_payload(nb_fields=80):
+    "Return a payload shaped like a form fields_view_get result"
+    arch = ''.join('<label name="field%d"/><field name="field%d"/>' % (i, i)
+        for i in range(nb_fields))
+    fields = {}
+    for i in range(nb_fields):
+        fields['field%d' % i] = {
+            'name': 'field%d' % i,
+            'string': u'Field %d' % i,
+            'type': 'many2one' if i % 3 else 'char',
+            'relation': 'party.party' if i % 3 else None,
+            'required': bool(i % 2),
+            'readonly': False,
+            'states': '{"invisible": {"__class__": "Not", "v": true}}',
+            'domain': '[]',
+            'context': '{}',
+            'depends': ['company', 'state'],
+            'on_change_with': ['field%d' % (i + 1)],
+            'selection': [('draft', u'Draft'), ('done', u'Done')],
+            'help': u'Help text of the field %d' % i,
+            }
+    return {
+        'model': 'account.invoice',
+        'type': 'form',
+        'view_id': 42,
+        'field_childs': None,
+        'arch': '<form>%s</form>' % arch,
+        'fields': fields,
+        }
+
+
+def translation_payloads(nb=1000):
+    "Return the keys and values of a translation cache"
+    return [(('account.invoice,description', 'model', 'fr', i),
+            u'Description traduite %d' % i) for i in range(nb)]
+
+
+def bench(cache_class, number):
+    name = 'bench.%s' % cache_class.__name__
+    fvg_cache = cache_class(name + '.fields_view_get')
+    translation_cache = cache_class(name + '.translation', size_limit=10240,
+        context=False)
+    fvg = fields_view_get_payload()
+    translations = translation_payloads()
+    for i in range(10):
+        fvg_cache.set(('account.invoice', i, 'form'), fvg)
+    for key, value in translations:
+        translation_cache.set(key, value)
+
+    def get_fvg():
+        for i in range(10):
+            fvg_cache.get(('account.invoice', i, 'form'))
+
+    def get_translations():
+        for key, _ in translations:
+            translation_cache.get(key)
+
+    return (
+        min(timeit.repeat(get_fvg, number=number, repeat=3)),
+        min(timeit.repeat(get_translations, number=number, repeat=3)),
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n', '--number', dest='number', type=int,
+        default=100, help='number of iterations')
+    options = parser.parse_args()
+    with Transaction().start(None, 0):
+        for cache_class in (SerializableMemoryCache, FrozenMemoryCache):
+            fvg, translation = bench(cache_class, options.number)
+            print('%-25s fields_view_get: %.4fs translation: %.4fs'
+                % (cache_class.__name__, fvg, translation))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+# This file is part of Tryton.  The COPYRIGHT file at the top level of
+# this repository contains the full copyright notices and license terms.
+"""
+Benchmark of the JSON encoders of the RPC responses.
+
+Usage: python -m trytond.tests.bench_json [-n NUMBER] [-r ROWS]
+"""
+import argparse
+import datetime
+import json
+import timeit
+from decimal import Decimal
+
+from trytond.protocols.jsonrpc import JSONEncoder, JSONRowsEncoder
+
+
+def search_read_payload(nb_rows=5000):
+    "Return a response shaped like a search_read result"
+    now = datetime.datetime.now()
+    today = datetime.date.today()
+    return {
+        'id': 1,
+        'result': [{
+                'id': i,
+                'rec_name': u'Invoice %d' % i,
+                'number': u'INV%06d' % i,
+                'state': 'posted',
+                'party': i % 100,
+                'party.rec_name': u'Party %d' % (i % 100),
+                'invoice_date': today,
+                'total_amount': Decimal('%d.%02d' % (i, i % 100)),
+                'tax_amount': Decimal('%d.00' % (i % 20)),
+                'paid': bool(i % 2),
+                'reference': None if i % 3 else u'REF%d' % i,
+                'create_date': now,
+                'write_date': now,
+                } for i in range(nb_rows)],
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n', '--number', dest='number', type=int,
+        default=10, help='number of iterations')
+    parser.add_argument('-r', '--rows', dest='rows', type=int,
+        default=5000, help='number of rows')
+    options = parser.parse_args()
+    payload = search_read_payload(options.rows)
+    rows_encoder = JSONRowsEncoder()
+    assert (rows_encoder.encode(payload)
+        == json.dumps(payload, cls=JSONEncoder))
+    for name, encode in [
+            ('JSONEncoder', lambda: json.dumps(payload, cls=JSONEncoder)),
+            ('JSONRowsEncoder', lambda: rows_encoder.encode(payload)),
+            ]:
+        duration = min(timeit.repeat(encode, number=options.number, repeat=3))
+        print('%-25s %d rows: %.4fs' % (name, options.rows,
+                duration / options.number))
+
+if __name__ == '__main__':
+    main()
@@ -1,9 +1,48 @@
 # This file is part of Tryton.  The COPYRIGHT file at the top level of
 # this repository contains the full copyright notices and license terms.
 
+import datetime
+import os
+import shutil
+import tempfile
 import unittest
+from mock import Mock, patch
 
-from trytond.cache import freeze
+from sql import Table
+
+from trytond.tests.test_tryton import activate_module, with_transaction, \
+    DB_NAME
+from trytond.transaction import Transaction
+from trytond.cache import freeze, deep_freeze, ImmutableDict, MemoryCache, \
+    SizedLRUDict, sizeof, FrozenMemoryCache, key_digest, key_tag, \
+    TaggedLRUDict
+from trytond import backend, cache_warmup
+from trytond.config import config
+from trytond.cache_redis import RedisCache, RedisNearCache
+from trytond.cache_serializer import pack
+
+clean_cache = MemoryCache('test.cache_clean')
+stats_eviction_cache = MemoryCache('test.cache_stats_eviction', size_limit=2)
+load_cache = FrozenMemoryCache('test.cache_load')
+
+
+class TestRedisCache(RedisCache):
+    _client = Mock(**{
+            'pipeline.return_value.execute.return_value': [[], set()],
+            'register_script.side_effect': lambda script: Mock(),
+            })
+
+
+redis_cache = TestRedisCache('test.redis_cache')
+
+
+class TestRedisNearCache(RedisNearCache):
+    _client = Mock(**{
+            'pipeline.return_value.execute.return_value': [[], set()],
+            })
+
+
+redis_near_cache = TestRedisNearCache('test.redis_near_cache')
 
 
 class CacheTestCase(unittest.TestCase):
@@ -31,10 +70,558 @@ class CacheTestCase(unittest.TestCase):
                                             ('string', 'test'),
                                             ]))]))]))
 
+    def testDeepFreeze(self):
+        "Test deep_freeze"
+        value = deep_freeze({
+                'list': [1, {'set': {2}}],
+                'string': 'test',
+                })
+        self.assertIsInstance(value, ImmutableDict)
+        self.assertEqual(value, {
+                'list': (1, {'set': frozenset([2])}),
+                'string': 'test',
+                })
+        self.assertIsInstance(value['list'][1], ImmutableDict)
+        with self.assertRaises(TypeError):
+            value['string'] = 'foo'
+        with self.assertRaises(TypeError):
+            value['list'][1].update({'foo': 'bar'})
+        copy = value.copy()
+        copy['string'] = 'foo'
+        self.assertEqual(value['string'], 'test')
+
+    def testDeepFreezeUnsupported(self):
+        "Test deep_freeze with unsupported type"
+        with self.assertRaises(TypeError):
+            deep_freeze([object()])
+
+    def testKeyDigest(self):
+        "Test key_digest does not depend on the order nor the string type"
+        self.assertEqual(
+            key_digest(('key', frozenset([('a', 1), ('b', u'x')]))),
+            key_digest((u'key', frozenset([(u'b', 'x'), (u'a', 1)]))))
+        self.assertNotEqual(key_digest(('key', 1)), key_digest(('key', 2)))
+
+    def testSizeof(self):
+        "Test sizeof includes the items"
+        value = ['x' * 100, {'key': 'y' * 100}]
+        self.assertGreater(sizeof(value), 200)
+        self.assertEqual(sizeof(value), sizeof(value))
+
+    def testSizedLRUDict(self):
+        "Test SizedLRUDict evicts to the memory limit"
+        lru = SizedLRUDict(10, memory_limit=sizeof('x' * 100) * 3)
+        for i in range(5):
+            lru[i] = 'x' * 100
+        self.assertLess(len(lru), 5)
+        self.assertIn(4, lru)
+        self.assertNotIn(0, lru)
+        self.assertLessEqual(lru.memory, lru.memory_limit)
+
+    def testSizedLRUDictMemory(self):
+        "Test SizedLRUDict memory accounting"
+        lru = SizedLRUDict(10)
+        lru['a'] = 'x' * 100
+        memory = lru.memory
+        lru['a'] = 'x' * 1000
+        self.assertGreater(lru.memory, memory)
+        self.assertEqual(lru.touch('a'), 'x' * 1000)
+        del lru['a']
+        self.assertEqual(lru.memory, 0)
+
+    def testTaggedLRUDict(self):
+        "Test TaggedLRUDict indexes the keys per tag"
+        lru = TaggedLRUDict(2)
+        lru['a'] = (1, frozenset(['foo', 'bar']))
+        lru['b'] = (2, frozenset(['foo']))
+        self.assertEqual(lru.tagged(['foo']), {'a', 'b'})
+        lru['a'] = (3, frozenset(['baz']))
+        self.assertEqual(lru.tagged(['foo', 'bar']), {'b'})
+        lru['c'] = (4, None)
+        self.assertEqual(lru.tagged(['foo', 'baz']), {'a'})
+        lru.clear()
+        self.assertEqual(lru.tagged(['baz']), set())
+        self.assertEqual(lru._tag_keys, {})
+
+
+class CacheCleanTestCase(unittest.TestCase):
+    "Test Cache clean"
+
+    @classmethod
+    def setUpClass(cls):
+        activate_module('tests')
+        cls.cache = clean_cache
+
+    @with_transaction()
+    def test_clean_generation(self):
+        "Test clean queries only when the generation changes"
+        transaction = Transaction()
+        dbname = transaction.database.name
+        MemoryCache.clean(dbname)
+        self.cache.set('key', 'value')
+
+        with patch.object(Transaction, 'new_transaction') as new_transaction:
+            MemoryCache.clean(dbname)
+            self.assertFalse(new_transaction.called)
+        self.assertEqual(self.cache.get('key'), 'value')
+
+        self.cache.clear()
+        MemoryCache.resets(dbname)
+        with patch.object(MemoryCache, 'clean_inst') as clean_inst:
+            MemoryCache.clean(dbname)
+            self.assertTrue(clean_inst.called)
+
+    @unittest.skipIf(backend.name() != 'sqlite', 'SQLite only')
+    def test_sqlite_cache_generation(self):
+        "Test the SQLite cache generation file does not grow"
+        path = tempfile.mkdtemp()
+        database_path = config.get('database', 'path')
+        config.set('database', 'path', path)
+        try:
+            database = backend.get('Database')('test_cache_generation')
+            generations = set()
+            for _ in range(10):
+                database.bump_cache_generation()
+                generations.add(database.cache_generation())
+            self.assertEqual(len(generations), 10)
+            self.assertEqual(os.path.getsize(
+                    os.path.join(path, 'test_cache_generation.cache')), 16)
+        finally:
+            config.set('database', 'path', database_path)
+            shutil.rmtree(path)
+
+    @with_transaction()
+    def test_clear_tags(self):
+        "Test clear_tags evicts only tagged entries"
+        self.cache.set('foo', 1, tags=['model.foo'])
+        self.cache.set('bar', 2, tags=['model.bar'])
+        self.cache.clear_tags(['model.foo'])
+        self.assertEqual(self.cache.get('foo'), None)
+        self.assertEqual(self.cache.get('bar'), 2)
+
+    @with_transaction()
+    def test_delete(self):
+        "Test delete evicts the key for every context"
+        self.cache.set('foo', 1)
+        self.cache.set('bar', 2)
+        with Transaction().set_context(language='fr'):
+            self.cache.set('foo', 3)
+            self.cache.delete('foo')
+            self.assertEqual(self.cache.get('foo'), None)
+        self.assertEqual(self.cache.get('foo'), None)
+        self.assertEqual(self.cache.get('bar'), 2)
+
+    @with_transaction()
+    def test_clean_tags(self):
+        "Test clean evicts entries of tags reset by other processes"
+        dbname = Transaction().database.name
+        self.cache.set('foo', 1, tags=['model.foo'])
+        self.cache.set('bar', 2, tags=['model.bar'])
+        self.cache.clean_inst(dbname, {
+                'test.cache_clean|model.foo': datetime.datetime.now(),
+                })
+        self.assertEqual(self.cache.get('foo'), None)
+        self.assertEqual(self.cache.get('bar'), 2)
+
+    @with_transaction()
+    def test_get_many(self):
+        "Test get_many returns only the cached keys"
+        self.cache.set('foo', 1)
+        self.cache.set('bar', None)
+        self.assertEqual(self.cache.get_many(['foo', 'bar', 'baz']),
+            {'foo': 1, 'bar': None})
+
+    @with_transaction()
+    def test_set_many(self):
+        "Test set_many with tags"
+        self.cache.set_many({'foo': 1, 'bar': 2},
+            tags=lambda key: ['model.' + key])
+        self.assertEqual(self.cache.get_many(['foo', 'bar']),
+            {'foo': 1, 'bar': 2})
+        self.cache.clear_tags(['model.foo'])
+        self.assertEqual(self.cache.get_many(['foo', 'bar']), {'bar': 2})
+
+    @with_transaction()
+    def test_resets_collapse_tags(self):
+        "Test the tag resets above the limit are collapsed"
+        transaction = Transaction()
+        dbname = transaction.database.name
+        table = Table('ir_cache')
+        cursor = transaction.connection.cursor()
+
+        def names():
+            cursor.execute(*table.select(table.name,
+                    where=table.name.like('test.cache_clean%')))
+            return {n for n, in cursor.fetchall()} - {'test.cache_clean'}
+
+        MemoryCache.resets(dbname)
+        limit = len(names()) + 2
+        with patch.object(MemoryCache, 'tag_resets_limit', limit):
+            for key in ['collapse 1', 'collapse 2']:
+                self.cache.delete(key)
+                MemoryCache.resets(dbname)
+            self.assertEqual(len(names()), limit)
+            self.cache.delete('collapse 3')
+            MemoryCache.resets(dbname)
+        self.assertEqual(names(), set())
+
+    @with_transaction()
+    def test_replica(self):
+        "Test a transaction on a lagging replica does not fill the cache"
+        transaction = Transaction()
+        now = datetime.datetime.now()
+        self.cache.clear()
+        with patch.object(MemoryCache, '_clean_timestamps', {
+                    transaction.database.name: {'test.cache_clean': now},
+                    }), \
+                patch.object(transaction, 'replica', True), \
+                patch.object(transaction, 'replica_cache_timestamps', {
+                        'test.cache_clean': now - datetime.timedelta(1),
+                        }):
+            self.assertEqual(self.cache.set('foo', 1), 1)
+            self.cache.set_many({'bar': 2})
+        self.assertEqual(self.cache.get_many(['foo', 'bar']), {})
+
+    @with_transaction()
+    def test_replica_fresh(self):
+        "Test a transaction on an up to date replica fills the cache"
+        transaction = Transaction()
+        dbname = transaction.database.name
+        self.cache.clear()
+        MemoryCache.resets(dbname)
+        with patch.object(MemoryCache, '_clean_generations', {}):
+            MemoryCache.clean(dbname)
+        with patch.object(transaction, 'replica', True):
+            self.cache.set('foo', 1)
+            self.cache.set_many({'bar': 2})
+            self.assertEqual(
+                self.cache.get_many(['foo', 'bar']), {'foo': 1, 'bar': 2})
+        self.assertIn('test.cache_clean', transaction.replica_cache_timestamps)
+
+    @with_transaction()
+    def test_memory_usage(self):
+        "Test memory_usage"
+        self.cache.clear()
+        self.assertEqual(self.cache.memory_usage(), 0)
+        self.cache.set('foo', 'x' * 1000)
+        self.assertGreater(self.cache.memory_usage(), 1000)
+        self.assertEqual(MemoryCache.memory_usages()[self.cache._name],
+            self.cache.memory_usage())
+
+    @with_transaction()
+    def test_process_memory_limit(self):
+        "Test the process memory limit evicts from the biggest cache"
+        self.cache.clear()
+        self.cache.set('foo', 'x' * 10000)
+        limit = sum(u or 0 for u in MemoryCache.memory_usages().itervalues())
+        with patch.object(config, 'getint', return_value=limit):
+            self.cache.set('bar', 'y' * 10000)
+        self.assertEqual(self.cache.get('foo'), None)
+        self.assertEqual(self.cache.get('bar'), 'y' * 10000)
+
+    @with_transaction()
+    def test_stats(self):
+        "Test stats counters"
+        dbname = Transaction().database.name
+        self.cache.clear()
+        MemoryCache.reset_stats()
+        self.cache.set('foo', 1)
+        self.cache.get('foo')
+        self.cache.get('bar')
+        self.cache.get_many(['foo', 'bar'])
+        self.cache.clear_tags(['model.foo'])
+        stats = MemoryCache.all_stats(dbname)[self.cache._name]
+        self.assertEqual(stats['hit'], 2)
+        self.assertEqual(stats['miss'], 2)
+        self.assertEqual(stats['set'], 1)
+        self.assertEqual(stats['clear'], 1)
+        self.assertEqual(stats['size'], 1)
+        self.assertEqual(stats['eviction'], 0)
+
+    @with_transaction()
+    def test_stats_eviction(self):
+        "Test stats count the evictions"
+        dbname = Transaction().database.name
+        cache = stats_eviction_cache
+        cache.clear()
+        MemoryCache.reset_stats()
+        for i in range(5):
+            cache.set(i, i)
+        stats = cache.stats(dbname)
+        self.assertEqual(stats['eviction'], 3)
+        self.assertEqual(stats['size'], 2)
+
+    @with_transaction()
+    def test_load(self):
+        "Test load skips the entries reset since the dump"
+        dbname = Transaction().database.name
+        now = datetime.datetime.now()
+        cache = load_cache
+        cache.clear()
+        cache.set('foo', {'a': [1]}, tags=['model.foo'])
+        cache.set('bar', 2, tags=['model.bar'])
+        entries = cache.dump(dbname)
+        cache.clear()
+        cache.load(dbname, entries, {}, {
+                'test.cache_load|model.foo': now,
+                })
+        self.assertEqual(cache.get('foo'), None)
+        self.assertEqual(cache.get('bar'), 2)
+
+        cache.load(dbname, entries, {}, {'test.cache_load': now})
+        self.assertEqual(cache.get('foo'), None)
+
+        cache.load(dbname, entries, {'test.cache_load': now},
+            {'test.cache_load': now})
+        self.assertEqual(cache.get('foo'), {'a': (1,)})
+        cache.clean_inst(dbname, {'test.cache_load': now})
+        self.assertEqual(cache.get('foo'), {'a': (1,)})
+
+    def test_snapshot(self):
+        "Test writing and loading a snapshot"
+        path = tempfile.mkdtemp()
+        config.set('cache', 'snapshot_path', path)
+        try:
+            with Transaction().start(DB_NAME, 1):
+                self.cache.clear()
+                self.cache.clean_inst(DB_NAME, cache_warmup._timestamps())
+                self.cache.set(('key', 1), {
+                        'value': datetime.date.today(),
+                        'list': [1, 2],
+                        })
+            cache_warmup.write_snapshot(DB_NAME)
+            self.assertTrue(
+                os.path.exists(os.path.join(path, DB_NAME + '.snapshot')))
+            with Transaction().start(DB_NAME, 1):
+                self.cache.clear()
+            cache_warmup.load_snapshot(DB_NAME)
+            with Transaction().start(DB_NAME, 1):
+                self.assertEqual(self.cache.get(('key', 1)), {
+                        'value': datetime.date.today(),
+                        'list': [1, 2],
+                        })
+        finally:
+            config.remove_option('cache', 'snapshot_path')
+            shutil.rmtree(path)
+
+    def test_snapshot_excluded(self):
+        "Test the caches without snapshot are not stored"
+        cache = MemoryCache('test.cache_no_snapshot', snapshot=False)
+        self.assertNotIn(cache, cache_warmup._instances())
+        self.assertIn(self.cache, cache_warmup._instances())
+
+    @with_transaction()
+    def test_resets_without_clear(self):
+        "Test resets does not start a transaction without clear"
+        dbname = Transaction().database.name
+        MemoryCache.resets(dbname)
+        with patch.object(Transaction, 'new_transaction') as new_transaction:
+            MemoryCache.resets(dbname)
+            self.assertFalse(new_transaction.called)
+
+
+class RedisCacheTestCase(unittest.TestCase):
+    "Test RedisCache"
+
+    @classmethod
+    def setUpClass(cls):
+        activate_module('tests')
+        cls.cache = redis_cache
+
+    def setUp(self):
+        self.client = self.cache._client
+        self.client.reset_mock()
+        self.cache._set_script.reset_mock()
+        self.cache._delete_script.reset_mock()
+        self.client.mget.side_effect = lambda keys: [None] * len(keys)
+        self.client.get.return_value = None
+
+    def test_set_pipelined(self):
+        "Test the writes are sent in one pipeline at commit"
+        with Transaction().start(DB_NAME, 1) as transaction:
+            self.cache.set('foo', 1, tags=['model.foo'])
+            self.cache.set_many({'bar': 2, 'baz': 3})
+            self.assertEqual(self.cache.get('foo'), 1)
+            self.assertFalse(self.client.mget.called)
+            self.assertFalse(self.client.pipeline.called)
+            transaction.commit()
+        self.assertEqual(self.client.pipeline.call_count, 1)
+        self.assertEqual(self.cache._set_script.call_count, 3)
+        keys = self.cache._set_script.call_args[1]['keys']
+        self.assertTrue(all(k.startswith('{%s:test.redis_cache}' % DB_NAME)
+                for k in keys))
+
+    def test_set_tags(self):
+        "Test the tags are stored by the script which evicts"
+        with Transaction().start(DB_NAME, 1) as transaction:
+            self.cache.set('foo', 1, tags=['model.foo'])
+            transaction.commit()
+        call = self.cache._set_script.call_args[1]
+        self.assertEqual(call['keys'][2], '{%s:test.redis_cache}|' % DB_NAME)
+        self.assertEqual(call['args'][5:], ['model.foo'])
+
+    def test_set_generation(self):
+        "Test the writes are conditioned by the generation first read"
+        self.client.mget.side_effect = (
+            lambda keys: [None] * (len(keys) - 1) + ['2'])
+        with Transaction().start(DB_NAME, 1) as transaction:
+            self.assertEqual(self.cache.get('foo'), None)
+            self.cache.set('foo', 1)
+            transaction.commit()
+        keys = self.client.mget.call_args[0][0]
+        self.assertEqual(keys[-1], '{%s:test.redis_cache}#' % DB_NAME)
+        self.assertFalse(self.client.get.called)
+        call = self.cache._set_script.call_args[1]
+        self.assertEqual(call['keys'][3], '{%s:test.redis_cache}#' % DB_NAME)
+        self.assertEqual(call['args'][4], '2')
+
+    def test_delete_key_tag(self):
+        "Test delete of a context cache clears the tag of the key"
+        with Transaction().start(DB_NAME, 1):
+            with patch.object(self.cache, 'clear_tags') as clear_tags:
+                self.cache.delete('foo')
+        clear_tags.assert_called_once_with([key_tag('foo')])
+
+    def test_clear_tags_evict(self):
+        "Test clear_tags removes the entries from their tags"
+        self.client.pipeline.return_value.execute.side_effect = [
+            [{'entry1'}, {'entry2'}], None]
+        with Transaction().start(DB_NAME, 1):
+            self.cache.clear_tags(['model.foo', 'model.bar'])
+        self.client.pipeline.return_value.execute.side_effect = None
+        args = self.cache._delete_script.call_args[1]['args']
+        self.assertEqual(sorted(args), ['entry1', 'entry2'])
+
+    def test_rollback(self):
+        "Test the writes are discarded on rollback"
+        with Transaction().start(DB_NAME, 1) as transaction:
+            self.cache.set('foo', 1)
+            transaction.rollback()
+        self.assertFalse(self.client.pipeline.called)
+
+    def test_replica(self):
+        "Test a transaction on a lagging replica does not fill the cache"
+        with Transaction().start(DB_NAME, 1) as transaction:
+            with patch.object(transaction, 'replica', True), \
+                    patch.object(
+                        transaction, 'replica_cache_timestamps', {}), \
+                    patch.object(RedisCache, '_clean_timestamps', {
+                            DB_NAME: {
+                                'test.redis_cache': datetime.datetime.now(),
+                                },
+                            }):
+                self.cache.set('foo', 1)
+                self.cache.set_many({'bar': 2})
+            self.assertEqual(self.cache.get('foo'), None)
+            transaction.commit()
+        self.assertFalse(self.cache._set_script.called)
+
+    def test_clear_tags_pending(self):
+        "Test clear_tags discards the pending writes"
+        with Transaction().start(DB_NAME, 1) as transaction:
+            self.cache.set('foo', 1, tags=['model.foo'])
+            self.cache.set('bar', 2, tags=['model.bar'])
+            self.cache.clear_tags(['model.foo'])
+            self.assertEqual(self.cache.get('foo'), None)
+            self.assertEqual(self.cache.get('bar'), 2)
+            self.client.reset_mock()
+            transaction.commit()
+        self.assertEqual(self.cache._set_script.call_count, 1)
+
+
+class RedisNearCacheTestCase(unittest.TestCase):
+    "Test RedisNearCache"
+
+    @classmethod
+    def setUpClass(cls):
+        activate_module('tests')
+        cls.cache = redis_near_cache
+
+    def setUp(self):
+        self.client = self.cache._client
+        self.client.reset_mock()
+        self.client.mget.side_effect = (
+            lambda keys: [pack({'value': 1})] * len(keys))
+        self.cache.clear_near()
+
+    @with_transaction()
+    def test_near_hit(self):
+        "Test near cache hit does not call redis"
+        with patch('trytond.iwc.is_started', return_value=True):
+            self.assertEqual(self.cache.get('key'), {'value': 1})
+            self.assertEqual(self.cache.get('key'), {'value': 1})
+        self.assertEqual(self.client.mget.call_count, 1)
+
+    @with_transaction()
+    def test_near_clear(self):
+        "Test clear_near drops local entries"
+        with patch('trytond.iwc.is_started', return_value=True):
+            self.cache.get('key')
+            self.cache.clear_near()
+            self.cache.get('key')
+        self.assertEqual(self.client.mget.call_count, 2)
+
+    @with_transaction()
+    def test_near_bypass(self):
+        "Test near cache is bypassed without listener"
+        with patch('trytond.iwc.is_started', return_value=False):
+            self.cache.get('key')
+            self.cache.get('key')
+        self.assertEqual(self.client.mget.call_count, 2)
+
+    @with_transaction()
+    def test_near_stats(self):
+        "Test near hits are counted as hits"
+        self.cache.reset_stats()
+        self.client.zcard.return_value = 1
+        with patch('trytond.iwc.is_started', return_value=True):
+            self.cache.get('key')
+            self.cache.get('key')
+        stats = self.cache.stats(Transaction().database.name)
+        self.assertEqual(stats['hit'], 2)
+        self.assertEqual(stats['near_hit'], 1)
+        self.assertEqual(stats['size'], 1)
+
+    @with_transaction()
+    def test_near_get_many(self):
+        "Test get_many fetches only the near cache misses"
+        self.client.mget.side_effect = [
+            [pack({'value': 1}), None], [pack(2), None]]
+        with patch('trytond.iwc.is_started', return_value=True):
+            self.cache.get('key')
+            self.assertEqual(self.cache.get_many(['key', 'foo', 'bar']),
+                {'key': {'value': 1}, 'foo': 2})
+            self.assertEqual(self.cache.get('foo'), 2)
+        self.assertEqual(self.client.mget.call_count, 2)
+        self.assertEqual(len(self.client.mget.call_args[0][0]), 2)
+
+    def test_near_set_rollback(self):
+        "Test set does not fill the near cache on rollback"
+        with patch('trytond.iwc.is_started', return_value=True):
+            with Transaction().start(DB_NAME, 1) as transaction:
+                self.cache.set('key', 2)
+                self.assertEqual(
+                    self.cache._near_cache(transaction.database.name), {})
+                transaction.rollback()
+            with Transaction().start(DB_NAME, 1):
+                self.assertEqual(self.cache.get('key'), {'value': 1})
+        self.assertEqual(self.client.mget.call_count, 1)
+
+    def test_near_set_commit(self):
+        "Test set fills the near cache on commit"
+        with patch('trytond.iwc.is_started', return_value=True):
+            with Transaction().start(DB_NAME, 1) as transaction:
+                self.cache.set('key', 2)
+                transaction.commit()
+            with Transaction().start(DB_NAME, 1):
+                self.assertEqual(self.cache.get('key'), 2)
+        self.assertFalse(self.client.mget.called)
+
 
 def suite():
     func = unittest.TestLoader().loadTestsFromTestCase
     suite = unittest.TestSuite()
-    for testcase in (CacheTestCase,):
+    for testcase in (CacheTestCase, CacheCleanTestCase,
+            RedisCacheTestCase, RedisNearCacheTestCase):
         suite.addTests(func(testcase))
     return suite
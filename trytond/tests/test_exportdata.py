@@ -334,6 +334,25 @@ class ExportDataTestCase(unittest.TestCase):
                     'one2many/name']),
             [[export1.id, 'Target 1'], ['', 'Target 2'], [export2.id, '']])
 
+    @with_transaction()
+    def test_one2many_stream(self):
+        'Test export_data_stream one2many'
+        pool = Pool()
+        ExportData = pool.get('test.export_data')
+        ExportDataTarget = pool.get('test.export_data.target')
+
+        export1, export2 = ExportData.create([{}, {}])
+        ExportDataTarget.create([{
+                    'name': 'Target %s' % i,
+                    'one2many': export1.id,
+                    } for i in range(2)])
+
+        self.assertEqual(
+            list(ExportData.export_data_stream([export1, export2],
+                    ['id', 'one2many/name'])),
+            ExportData.export_data([export1, export2],
+                ['id', 'one2many/name']))
+
     @with_transaction()
     def test_reference(self):
         'Test export_data reference'
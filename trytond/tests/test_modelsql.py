@@ -2,6 +2,8 @@
 # This file is part of Tryton.  The COPYRIGHT file at the top level of this
 # repository contains the full copyright notices and license terms.
 
+import os
+import tempfile
 import unittest
 import time
 
@@ -48,6 +50,196 @@ class ModelSQLTestCase(unittest.TestCase):
                 self.fail('UserError should be caught')
             transaction.rollback()
 
+    @unittest.skipIf(backend.name() == 'sqlite',
+        'SQLite does not set "NOT NULL" constraint')
+    @with_transaction()
+    def test_required_field_missing_batch(self):
+        "Test error message when a required field is missing in a batch"
+        pool = Pool()
+        Modelsql = pool.get('test.modelsql')
+
+        with self.assertRaises(UserError):
+            Modelsql.create([
+                    {'integer': 1, 'desc': 'foo'},
+                    {'integer': 2, 'desc': None},
+                    ])
+
+    @with_transaction()
+    def test_create_order(self):
+        "Test create keeps the order of the records"
+        pool = Pool()
+        Model = pool.get('test.export_data')
+
+        records = Model.create([
+                {'char': 'a'},
+                {'char': 'b', 'integer': 1},
+                {'char': 'c', 'integer': 2},
+                {'char': 'd'},
+                ])
+
+        self.assertEqual(
+            [r.id for r in records], sorted(r.id for r in records))
+        self.assertEqual(
+            [(r.char, r.integer) for r in Model.browse(map(int, records))],
+            [('a', None), ('b', 1), ('c', 2), ('d', None)])
+
+    @with_transaction()
+    def test_write_batch(self):
+        "Test write with different values per record"
+        pool = Pool()
+        Model = pool.get('test.export_data')
+
+        records = Model.create([{'char': c} for c in 'abcd'])
+        Model.write(
+            [records[0]], {'char': 'w', 'integer': 1},
+            [records[1]], {'char': 'x', 'integer': 2},
+            [records[2]], {'integer': 3},
+            [records[0]], {'integer': 4})
+
+        self.assertEqual(
+            [(r.char, r.integer) for r in Model.browse(map(int, records))],
+            [('w', 4), ('x', 2), ('c', 3), ('d', None)])
+
+    @with_transaction()
+    def test_write_batch_missing(self):
+        "Test write with different values on a deleted record"
+        pool = Pool()
+        Model = pool.get('test.export_data')
+
+        records = Model.create([{'char': c} for c in 'ab'])
+        Model.delete([records[1]])
+
+        with self.assertRaises(UserError):
+            Model.write(
+                [records[0]], {'char': 'x'},
+                [records[1]], {'char': 'y'})
+
+    @with_transaction()
+    def test_write_batch_rule(self):
+        "Test write checks the rule after the previous values"
+        pool = Pool()
+        Model = pool.get('test.export_data')
+        Rule = pool.get('ir.rule')
+
+        def domain_get(model_name, mode='read'):
+            if model_name == Model.__name__ and mode == 'write':
+                return [('integer', '!=', 0)]
+            return []
+        record, = Model.create([{'integer': 1}])
+
+        with patch.object(Rule, 'domain_get', side_effect=domain_get):
+            with self.assertRaises(UserError):
+                Model.write(
+                    [record], {'integer': 0},
+                    [record], {'char': 'foo'})
+
+    @unittest.skipIf(backend.name() == 'sqlite',
+        'SQLite does not set "NOT NULL" constraint')
+    @with_transaction()
+    def test_write_required_field_missing_batch(self):
+        "Test error message when a required field is missing in a write batch"
+        pool = Pool()
+        Modelsql = pool.get('test.modelsql')
+
+        records = Modelsql.create([
+                {'integer': 1, 'desc': 'foo'},
+                {'integer': 2, 'desc': 'bar'},
+                ])
+        with self.assertRaises(UserError):
+            Modelsql.write(
+                [records[0]], {'desc': 'baz'},
+                [records[1]], {'desc': None})
+
+    @with_transaction()
+    def test_bulk_load(self):
+        "Test bulk_load"
+        pool = Pool()
+        Model = pool.get('test.export_data')
+        Target = pool.get('test.export_data.target')
+        target, = Target.create([{'name': 'Target'}])
+
+        count = Model.bulk_load(
+            ((u'Test %s' % i, i, target.id) for i in range(10)),
+            ['char', 'integer', 'many2one'])
+
+        self.assertEqual(count, 10)
+        records = Model.search([], order=[('id', 'ASC')])
+        self.assertEqual(
+            [(r.char, r.integer, r.many2one) for r in records],
+            [(u'Test %s' % i, i, target) for i in range(10)])
+        self.assertTrue(all(r.create_uid and r.create_date for r in records))
+
+        # The ids continue after the loaded records
+        record, = Model.create([{}])
+        self.assertGreater(record.id, records[-1].id)
+
+    @unittest.skipUnless(backend.name() == 'sqlite',
+        'The write lock is specific to sqlite')
+    def test_nextids_lock(self):
+        "Test nextids locks the table until the end of the transaction"
+        import sqlite3
+        Database = backend.get('Database')
+        fd, path = tempfile.mkstemp()
+        os.close(fd)
+        self.addCleanup(os.remove, path)
+        connection = sqlite3.connect(path, timeout=0)
+        connection.execute(
+            'CREATE TABLE test (id INTEGER PRIMARY KEY AUTOINCREMENT)')
+        connection.isolation_level = 'IMMEDIATE'
+        other = sqlite3.connect(path, timeout=0)
+        other.isolation_level = 'IMMEDIATE'
+
+        ids = Database().nextids(connection, 'test', 2)
+
+        self.assertEqual(list(ids), [1, 2])
+        with self.assertRaises(sqlite3.OperationalError):
+            other.execute('INSERT INTO test DEFAULT VALUES')
+        connection.commit()
+        other.execute('INSERT INTO test DEFAULT VALUES')
+        other.commit()
+        connection.close()
+        other.close()
+
+    @with_transaction()
+    def test_bulk_load_history(self):
+        "Test bulk_load fills the history"
+        pool = Pool()
+        History = pool.get('test.history')
+        table = History.__table_history__()
+        cursor = Transaction().connection.cursor()
+
+        History.bulk_load([(i,) for i in range(3)], ['value'])
+
+        cursor.execute(*table.select(table.value, order_by=table.value))
+        self.assertEqual(cursor.fetchall(), [(0,), (1,), (2,)])
+
+    @with_transaction()
+    def test_bulk_load_translated_default(self):
+        "Test bulk_load stores the translation of the defaults"
+        pool = Pool()
+        Model = pool.get('test.char_translate')
+        Translation = pool.get('ir.translation')
+
+        with patch.object(Model, 'default_get', return_value={'char': 'foo'}):
+            Model.bulk_load([(), ()], [])
+
+        records = Model.search([])
+        translations = Translation.search([
+                ('name', '=', 'test.char_translate,char'),
+                ('res_id', 'in', [r.id for r in records]),
+                ])
+        self.assertEqual(len(translations), 2)
+        self.assertEqual({t.value for t in translations}, {'foo'})
+
+    @with_transaction()
+    def test_bulk_load_set_field(self):
+        "Test bulk_load refuses the fields with a setter"
+        pool = Pool()
+        Model = pool.get('test.modelsql.field_set')
+
+        with self.assertRaises(NotImplementedError):
+            Model.bulk_load([(1,)], ['field'])
+
     @with_transaction()
     def test_check_timestamp(self):
         'Test check timestamp'
@@ -36,6 +36,20 @@ class ModelStorageTestCase(unittest.TestCase):
         self.assertTrue(
             all(x['name'] >= y['name'] for x, y in zip(rows, rows[1:])))
 
+    @with_transaction()
+    def test_search_read_stream(self):
+        "Test search_read_stream"
+        pool = Pool()
+        ModelStorage = pool.get('test.modelstorage')
+        ModelStorage.create([{'name': 'Test %s' % i} for i in range(10)])
+
+        rows = ModelStorage.search_read_stream(
+            [], order=[('name', 'DESC')], fields_names=['name'])
+
+        self.assertNotIsInstance(rows, list)
+        self.assertEqual(list(rows), ModelStorage.search_read(
+                [], order=[('name', 'DESC')], fields_names=['name']))
+
     @with_transaction()
     def test_search_count(self):
         "Test search_count"
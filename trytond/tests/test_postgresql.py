@@ -0,0 +1,266 @@
+# This file is part of Tryton.  The COPYRIGHT file at the top level of
+# this repository contains the full copyright notices and license terms.
+import datetime
+import threading
+import time
+import unittest
+from decimal import Decimal
+
+from mock import Mock, patch
+
+from trytond import backend
+from trytond.tests.test_tryton import DB_NAME, USER, activate_module
+from trytond.transaction import Transaction
+
+try:
+    import psycopg2
+except ImportError:
+    psycopg2 = None
+
+
+def connect(dsn):
+    connection = Mock(closed=0)
+    connection.get_transaction_status.return_value = 0
+    return connection
+
+
+@unittest.skipIf(psycopg2 is None, 'psycopg2 is not installed')
+class ConnectionPoolTestCase(unittest.TestCase):
+    "Test the PostgreSQL connection pool"
+
+    def pool(self, minconn=0, maxconn=2, **kwargs):
+        from trytond.backend.postgresql.database import ConnectionPool
+        return ConnectionPool(minconn, maxconn, '', connect=connect, **kwargs)
+
+    def test_reuse(self):
+        "Test the released connection is reused"
+        pool = self.pool()
+
+        connection = pool.getconn()
+        pool.putconn(connection)
+
+        self.assertIs(pool.getconn(), connection)
+        self.assertEqual(pool.stats()['size'], 1)
+
+    def test_timeout(self):
+        "Test timeout when the pool is exhausted"
+        from psycopg2.pool import PoolError
+        pool = self.pool(maxconn=1)
+        pool.getconn()
+
+        with self.assertRaises(PoolError):
+            pool.getconn(timeout=0.01)
+        self.assertEqual(pool.stats()['timeouts'], 1)
+
+    def test_fifo(self):
+        "Test the waiters are served in order"
+        pool = self.pool(maxconn=1)
+        connection = pool.getconn()
+        order = []
+
+        def target(i):
+            pool.putconn(pool.getconn(timeout=5))
+            order.append(i)
+        threads = []
+        for i in range(3):
+            thread = threading.Thread(target=target, args=(i,))
+            thread.start()
+            threads.append(thread)
+            while pool.stats()['waiters'] <= i:
+                time.sleep(0.001)
+        pool.putconn(connection)
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(order, [0, 1, 2])
+        self.assertEqual(pool.stats()['waits'], 3)
+
+    def test_lifetime(self):
+        "Test the connections are replaced after their lifetime"
+        pool = self.pool(lifetime=0.01)
+        connection = pool.getconn()
+        time.sleep(0.01)
+        pool.putconn(connection)
+
+        connection.close.assert_called_once_with()
+        self.assertEqual(pool.stats()['size'], 0)
+
+    def test_idle(self):
+        "Test the idle connections above minconn are closed"
+        pool = self.pool(minconn=1, idle=0.01)
+        connections = [pool.getconn(), pool.getconn()]
+        pool.putconn(connections[0])
+        time.sleep(0.01)
+        pool.putconn(connections[1])
+
+        self.assertEqual(pool.stats()['size'], 1)
+        connections[0].close.assert_called_once_with()
+
+    def test_check(self):
+        "Test the broken connections are replaced at checkout"
+        pool = self.pool(check=0)
+        connection = pool.getconn()
+        pool.putconn(connection)
+        connection.closed = 1
+
+        self.assertIsNot(pool.getconn(), connection)
+
+    def test_check_error(self):
+        "Test the connections failing the check are replaced at checkout"
+        pool = self.pool(maxconn=1, check=0)
+        connection = pool.getconn()
+        pool.putconn(connection)
+        connection.cursor.side_effect = ValueError
+
+        self.assertIsNot(pool.getconn(), connection)
+        connection.close.assert_called_once_with()
+        self.assertEqual(pool.stats()['size'], 1)
+
+    def test_connect_error(self):
+        "Test a failed connection releases its place"
+        pool = self.pool(maxconn=1)
+        with patch.object(pool, '_connect', side_effect=ValueError):
+            with self.assertRaises(ValueError):
+                pool.getconn()
+
+        self.assertEqual(pool.stats()['size'], 0)
+        pool.getconn(timeout=0)
+
+    def test_session_error(self):
+        "Test the connection is closed when its session can not be set"
+        from trytond.backend.postgresql.database import Database
+        with patch.dict(Database._databases):
+            database = Database('test_session_error')
+        pool = self.pool(maxconn=1)
+        with patch.object(Database, 'dsn', return_value=''), \
+                patch.object(Database, 'replica_uris', return_value=[]), \
+                patch.object(database, '_pool', return_value=pool):
+            database.connect()
+        connection = pool.getconn()
+        connection.characteristics = None
+        connection.set_session.side_effect = ValueError
+        pool.putconn(connection)
+
+        with self.assertRaises(ValueError):
+            database.get_connection()
+        connection.close.assert_called_once_with()
+        self.assertEqual(pool.stats()['size'], 0)
+
+
+@unittest.skipUnless(backend.name() == 'postgresql',
+    'The connection is specific to postgresql')
+class ConnectionTestCase(unittest.TestCase):
+    "Test the PostgreSQL connection"
+
+    @classmethod
+    def setUpClass(cls):
+        activate_module('tests')
+
+    def test_characteristics(self):
+        "Test the characteristics of the session are remembered"
+        from trytond.backend.postgresql.database import TimingCursor
+        with Transaction().start(DB_NAME, USER, readonly=True) as transaction:
+            connection = transaction.connection
+            self.assertEqual(connection.characteristics, (False, True))
+            self.assertIsInstance(connection.cursor(), TimingCursor)
+
+        with Transaction().start(DB_NAME, USER) as transaction:
+            connection = transaction.connection
+            self.assertEqual(connection.characteristics, (False, False))
+
+
+@unittest.skipIf(psycopg2 is None, 'psycopg2 is not installed')
+class CopyFormatTestCase(unittest.TestCase):
+    "Test the text format of COPY"
+
+    def copy_format(self, value):
+        from trytond.backend.postgresql.database import copy_format
+        return copy_format(value)
+
+    def test_values(self):
+        "Test the format of the values"
+        for value, result in [
+                (None, '\\N'),
+                (True, 't'),
+                (False, 'f'),
+                (42, '42'),
+                (Decimal('1.50'), '1.50'),
+                (0.5, '0.5'),
+                (datetime.date(2020, 1, 2), '2020-01-02'),
+                (datetime.timedelta(1, 2, 3),
+                    '1 days 2 seconds 3 microseconds'),
+                (u'caf\xe9', 'caf\xc3\xa9'),
+                ]:
+            self.assertEqual(self.copy_format(value), result)
+
+    def test_escape(self):
+        "Test the special characters of text are escaped"
+        self.assertEqual(self.copy_format('a\\b\tc\nd\re'),
+            'a\\\\b\\tc\\nd\\re')
+
+    def test_binary(self):
+        "Test the binaries are hex-encoded"
+        from psycopg2.extensions import Binary
+        for value in ['\x00\xff', '\\x41', bytearray('\x00\xff')]:
+            self.assertEqual(self.copy_format(Binary(value)),
+                '\\\\x' + bytes(value).encode('hex'))
+        self.assertEqual(self.copy_format(bytearray('\x00')), '\\\\x00')
+
+
+@unittest.skipIf(psycopg2 is None, 'psycopg2 is not installed')
+class CacheListenerTestCase(unittest.TestCase):
+    "Test the listener of the cache resets"
+
+    def setUp(self):
+        from trytond.backend.postgresql.database import Database
+        with patch.dict(Database._databases):
+            self.database = Database('test_cache_listener')
+        for patcher in [
+                patch.object(Database, 'dsn', return_value=''),
+                patch.object(Database, 'cache_check_interval', 10 ** 9),
+                patch('select.select', return_value=([], [], [])),
+                ]:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        listener = self.database._cache_listener
+        if listener is not None:
+            listener.connection.closed = 1
+            listener.join()
+
+    def test_notify(self):
+        "Test the generation changes with a received notification"
+        connection = Mock(closed=0, notifies=[])
+        with patch('trytond.backend.postgresql.database.connect',
+                return_value=connection):
+            generation = self.database.cache_generation()
+            self.assertEqual(self.database.cache_generation(), generation)
+
+            connection.notifies.append('ir_cache')
+            self.assertNotEqual(self.database.cache_generation(), generation)
+            self.assertEqual(connection.notifies, [])
+
+    def test_restart(self):
+        "Test a dead listener is restarted with a new generation"
+        connections = [Mock(closed=0, notifies=[]) for _ in range(2)]
+        with patch('trytond.backend.postgresql.database.connect',
+                side_effect=connections) as connect:
+            generation = self.database.cache_generation()
+            listener = self.database._cache_listener
+            connections[0].closed = 1
+            listener.join()
+
+            self.assertNotEqual(self.database.cache_generation(), generation)
+            self.assertEqual(connect.call_count, 2)
+            self.assertIsNot(self.database._cache_listener, listener)
+            self.assertTrue(self.database._cache_listener.is_alive())
+
+
+def suite():
+    func = unittest.TestLoader().loadTestsFromTestCase
+    suite = unittest.TestSuite()
+    for testcase in (ConnectionPoolTestCase, ConnectionTestCase,
+            CopyFormatTestCase, CacheListenerTestCase):
+        suite.addTests(func(testcase))
+    return suite
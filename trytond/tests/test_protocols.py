@@ -6,8 +6,14 @@ import json
 import datetime
 from decimal import Decimal
 
-from trytond.protocols.jsonrpc import JSONEncoder, JSONDecoder, JSONRequest
+from werkzeug.exceptions import BadRequest
+
+from trytond.exceptions import UserError
+from trytond.protocols.jsonrpc import (JSONEncoder, JSONDecoder, JSONRequest,
+    JSONProtocol, JSONRowsEncoder)
 from trytond.protocols.xmlrpc import client, XMLRequest
+from trytond.protocols.msgpackrpc import (MsgPackRequest, MsgPackProtocol,
+    dumps, loads)
 
 
 class JSONTestCase(unittest.TestCase):
@@ -22,6 +28,47 @@ class JSONTestCase(unittest.TestCase):
             {'method': 'method', 'params': ['foo', 'bar']})
         self.assertEqual(req.rpc_method, 'method')
         self.assertEqual(req.rpc_params, ['foo', 'bar'])
+        self.assertFalse(req.rpc_batch)
+
+    def test_json_batch_request(self):
+        'Test JSON batch request'
+        req = JSONRequest.from_values(
+            data=b'[{"id": 1, "method": "foo", "params": []}, '
+            b'{"id": 2, "method": "bar", "params": [1]}]',
+            content_type='text/json',
+            )
+        self.assertTrue(req.rpc_batch)
+
+    def test_json_invalid_batch_request(self):
+        'Test JSON invalid batch request'
+        for data in [b'[]', b'[{"id": 1, "method": "foo"}]', b'[1]']:
+            req = JSONRequest.from_values(
+                data=data, content_type='text/json')
+            with self.assertRaises(BadRequest):
+                req.rpc_batch
+
+    def test_json_batch_response(self):
+        'Test JSON batch response'
+        req = JSONRequest.from_values(
+            data=b'[{"id": 1, "method": "foo", "params": []}, '
+            b'{"id": 2, "method": "bar", "params": [1]}]',
+            content_type='text/json',
+            )
+        error = Exception('error')
+        error.__format_traceback__ = 'traceback'
+        response = JSONProtocol.response([42, error], req)
+        self.assertEqual(json.loads(response.data), [
+                {'id': 1, 'result': 42},
+                {'id': 2, 'error': ['error', 'traceback']},
+                ])
+        self.assertEqual(response.headers['RPC-Method'], 'batch')
+
+        response = JSONProtocol.response(
+            [UserError('user'), None], req)
+        self.assertEqual(json.loads(response.data), [
+                {'id': 1, 'error': ['UserError', ['user', '']]},
+                {'id': 2, 'result': None},
+                ])
 
     def dumps_loads(self, value):
         self.assertEqual(json.loads(
@@ -49,6 +96,91 @@ class JSONTestCase(unittest.TestCase):
         'Test Decimal'
         self.dumps_loads(Decimal('3.141592653589793'))
 
+    def test_rows_encoder(self):
+        'Test rows encoder output is the same as JSONEncoder'
+        encoder = JSONRowsEncoder()
+        rows = [{
+                'id': i,
+                'name': u'Name %d \xe9 "%%s"' % i,
+                'code': b'code',
+                'active': bool(i % 2),
+                'amount': Decimal('%d.5' % i) if i % 3 else None,
+                'float': float('nan') if i == 4 else 1.1 * i,
+                'long': 2 ** 70,
+                'date': datetime.date(2000, 1, i + 1),
+                'datetime': datetime.datetime(2000, 1, 1, 12, i),
+                'time': datetime.time(12, i),
+                'timedelta': datetime.timedelta(days=i, seconds=0.5),
+                'binary': bytearray(b'foo' * 30) if i % 2 else None,
+                'lines': [1, {'amount': Decimal(i)}],
+                } for i in range(10)]
+        rows[5] = {'other': 1}
+        for value in [
+                rows,
+                {'id': 1, 'result': rows},
+                {'id': 1, 'error': ('foo', 'bar')},
+                [], [{}], [{1: 2}, {1: 3}], {1: 2}, [1, 2], 'foo',
+                ]:
+            self.assertEqual(encoder.encode(value),
+                json.dumps(value, cls=JSONEncoder))
+
+
+class MsgPackTestCase(unittest.TestCase):
+    'Test MessagePack'
+
+    def test_msgpack_request(self):
+        req = MsgPackRequest.from_values(
+            data=dumps({'method': 'method', 'params': ['foo', 'bar']}),
+            content_type='application/msgpack',
+            )
+        self.assertEqual(req.parsed_data,
+            {'method': 'method', 'params': ['foo', 'bar']})
+        self.assertEqual(req.rpc_method, 'method')
+        self.assertEqual(req.rpc_params, ['foo', 'bar'])
+
+    def test_msgpack_response(self):
+        req = MsgPackRequest.from_values(
+            data=dumps({'id': 1, 'method': 'method', 'params': []}),
+            content_type='application/msgpack',
+            )
+        response = MsgPackProtocol.response(Decimal('1.5'), req)
+        self.assertEqual(response.mimetype, 'application/msgpack')
+        self.assertEqual(loads(response.data),
+            {'id': 1, 'result': Decimal('1.5')})
+
+    def dumps_loads(self, value):
+        self.assertEqual(loads(dumps(value)), value)
+
+    def test_datetime(self):
+        'Test datetime'
+        self.dumps_loads(datetime.datetime.now())
+
+    def test_date(self):
+        'Test date'
+        self.dumps_loads(datetime.date.today())
+
+    def test_time(self):
+        'Test time'
+        self.dumps_loads(datetime.datetime.now().time())
+
+    def test_timedelta(self):
+        'Test timedelta'
+        self.dumps_loads(datetime.timedelta(days=1, seconds=2))
+
+    def test_bytes(self):
+        'Test bytes'
+        self.dumps_loads(bytearray(b'\xff\x00'))
+        self.dumps_loads({'data': [bytearray(b'foo')]})
+
+    def test_text(self):
+        'Test text'
+        self.assertEqual(loads(dumps(b'foo')), u'foo')
+        self.dumps_loads(u'\xe9')
+
+    def test_decimal(self):
+        'Test Decimal'
+        self.dumps_loads(Decimal('3.141592653589793'))
+
 
 class XMLTestCase(unittest.TestCase):
     'Test XML'
@@ -92,5 +224,7 @@ class XMLTestCase(unittest.TestCase):
 def suite():
     suite_ = unittest.TestSuite()
     suite_.addTests(unittest.TestLoader().loadTestsFromTestCase(JSONTestCase))
+    suite_.addTests(unittest.TestLoader().loadTestsFromTestCase(
+            MsgPackTestCase))
     suite_.addTests(unittest.TestLoader().loadTestsFromTestCase(XMLTestCase))
     return suite_
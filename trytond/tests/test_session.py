@@ -0,0 +1,168 @@
+# This file is part of Tryton.  The COPYRIGHT file at the top level of
+# this repository contains the full copyright notices and license terms.
+import unittest
+from mock import patch
+
+from trytond.tests.test_tryton import activate_module, DB_NAME
+from trytond.pool import Pool
+from trytond.transaction import Transaction
+from trytond.session import MemorySessionStore, DatabaseSessionStore
+
+
+class MemorySessionStoreTestCase(unittest.TestCase):
+    "Test MemorySessionStore"
+
+    def setUp(self):
+        self.store = MemorySessionStore()
+
+    def test_check(self):
+        "Test check"
+        key = self.store.new('db', 1)
+
+        self.assertTrue(self.store.check('db', 1, key))
+        self.assertFalse(self.store.check('db', 2, key))
+        self.assertFalse(self.store.check('db', 1, 'foo'))
+        self.assertFalse(self.store.check('other', 1, key))
+
+    def test_check_expired(self):
+        "Test check expired session"
+        key = self.store.new('db', 1)
+        self.store.refresh = 0
+        self.store._sessions['db'][key][1] -= self.store.timeout
+
+        self.assertFalse(self.store.check('db', 1, key))
+
+    def test_reset_coalesced(self):
+        "Test reset is coalesced during refresh"
+        key = self.store.new('db', 1)
+
+        with patch.object(self.store, '_reset') as reset:
+            self.store.reset('db', key)
+            self.assertFalse(reset.called)
+
+            self.store.refresh = 0
+            self.store.reset('db', key)
+            reset.assert_called_once_with('db', key)
+
+    def test_check_revoked(self):
+        "Test check sees at once a session removed by another process"
+        key = self.store.new('db', 1)
+        self.assertTrue(self.store.check('db', 1, key))
+
+        self.store._remove('db', 1, key)
+        self.assertFalse(self.store.check('db', 1, key))
+
+    def test_remove(self):
+        "Test remove"
+        key = self.store.new('db', 1)
+
+        self.assertTrue(self.store.remove('db', 1, key))
+        self.assertFalse(self.store.check('db', 1, key))
+        self.assertFalse(self.store.remove('db', 1, key))
+
+    def test_count_sweep(self):
+        "Test count and sweep"
+        key1 = self.store.new('db', 1)
+        self.store.new('db', 1)
+        self.store.new('db', 2)
+        self.store._sessions['db'][key1][1] -= self.store.timeout
+
+        self.assertEqual(self.store.count('db', [1, 2, 3]),
+            {1: 1, 2: 1, 3: 0})
+
+        self.store._sweep('db')
+        self.assertNotIn(key1, self.store._sessions['db'])
+
+    def test_login_failures(self):
+        "Test login failures"
+        self.assertEqual(self.store.login_retry_after('db', 'foo'), 0)
+
+        self.store.add_login_failure('db', 'foo')
+        self.store.add_login_failure('db', 'foo')
+        self.assertEqual(self.store.login_failures('db', 'foo')[0], 2)
+        self.assertGreater(self.store.login_retry_after('db', 'foo'), 2)
+        self.assertEqual(self.store.login_retry_after('other', 'foo'), 0)
+
+        self.store.remove_login_failures('db', 'foo')
+        self.assertEqual(self.store.login_retry_after('db', 'foo'), 0)
+
+    def test_login_failures_expired(self):
+        "Test login failures expired"
+        self.store.add_login_failure('db', 'foo')
+        self.store.timeout = 0
+
+        self.assertEqual(self.store.login_failures('db', 'foo'), (0, 0))
+
+
+class DatabaseSessionStoreTestCase(unittest.TestCase):
+    "Test DatabaseSessionStore"
+
+    @classmethod
+    def setUpClass(cls):
+        activate_module('res')
+
+    def setUp(self):
+        self.store = DatabaseSessionStore()
+        self.store.refresh = 0
+        # The sweep thread does not share the in-memory database
+        self.store.sweep_interval = float('inf')
+
+    def test_check(self):
+        "Test check"
+        key = self.store.new(DB_NAME, 0)
+
+        self.assertTrue(self.store.check(DB_NAME, 0, key))
+        self.assertFalse(self.store.check(DB_NAME, 1, key))
+        self.assertFalse(self.store.check(DB_NAME, 0, 'foo'))
+
+        self.assertTrue(self.store.remove(DB_NAME, 0, key))
+        self.assertFalse(self.store.check(DB_NAME, 0, key))
+
+    def test_check_primary(self):
+        "Test check does not read the session on a replica"
+        key = self.store.new(DB_NAME, 0)
+
+        with patch.object(self.store, '_run', wraps=self.store._run) as run:
+            self.assertTrue(self.store.check(DB_NAME, 0, key))
+        self.assertFalse(run.call_args[1].get('readonly'))
+        self.store.remove(DB_NAME, 0, key)
+
+    def test_login_failures(self):
+        "Test login failures are shared by the stores"
+        self.store.add_login_failure(DB_NAME, 'foo')
+        self.store.add_login_failure(DB_NAME, 'foo')
+
+        other = DatabaseSessionStore()
+        self.assertEqual(other.login_failures(DB_NAME, 'foo')[0], 2)
+        self.assertGreater(other.login_retry_after(DB_NAME, 'foo'), 2)
+        with Transaction().start(DB_NAME, 0):
+            LoginAttempt = Pool().get('res.user.login.attempt')
+            self.assertEqual(LoginAttempt.count('foo'), 2)
+
+        other.remove_login_failures(DB_NAME, 'foo')
+        self.assertEqual(self.store.login_retry_after(DB_NAME, 'foo'), 0)
+
+    def test_count_clean(self):
+        "Test count and clean"
+        key = self.store.new(DB_NAME, 0)
+        self.store.new(DB_NAME, 0)
+
+        with Transaction().start(DB_NAME, 0):
+            Session = Pool().get('ir.session')
+            self.assertEqual(Session.count([0]), {0: 2})
+
+            session, = Session.search([('key', '=', key)])
+            with patch.object(Session, '_expired',
+                    return_value=session.create_date):
+                Session.clean()
+                self.assertEqual(Session.count([0]), {0: 1})
+            Session.delete(Session.search([]))
+
+
+def suite():
+    suite_ = unittest.TestSuite()
+    suite_.addTests(unittest.TestLoader().loadTestsFromTestCase(
+            MemorySessionStoreTestCase))
+    suite_.addTests(unittest.TestLoader().loadTestsFromTestCase(
+            DatabaseSessionStoreTestCase))
+    return suite_
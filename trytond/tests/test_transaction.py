@@ -1,7 +1,9 @@
 # This file is part of Tryton.  The COPYRIGHT file at the top level of
 # this repository contains the full copyright notices and license terms.
 import unittest
-from mock import Mock
+from mock import Mock, patch
+
+from trytond import backend
 from trytond.tests.test_tryton import DB_NAME, USER, CONTEXT, activate_module
 from trytond.transaction import Transaction
 
@@ -66,6 +68,25 @@ class TransactionTestCase(unittest.TestCase):
             with Transaction().set_user(2):
                 self.assertEqual(transaction.user, 2)
 
+    def test_context_key(self):
+        'Test context_key'
+        with Transaction().start(DB_NAME, USER, context={'language': 'en'}) \
+                as transaction:
+            key = transaction.context_key()
+            self.assertIs(transaction.context_key(), key)
+            self.assertEqual(key, frozenset([('language', 'en')]))
+
+            with transaction.set_context(foo='bar'):
+                self.assertEqual(transaction.context_key(), frozenset([
+                            ('language', 'en'), ('foo', 'bar')]))
+                self.assertEqual(
+                    transaction.context_key(frozenset(['language'])),
+                    frozenset([('language', 'en')]))
+            self.assertEqual(transaction.context_key(), key)
+
+            with transaction.reset_context():
+                self.assertEqual(transaction.context_key(), frozenset())
+
     def test_stacked_transactions(self):
         'Test that transactions are stacked / unstacked correctly'
         with Transaction().start(DB_NAME, USER, context=CONTEXT) \
@@ -121,6 +142,38 @@ class TransactionTestCase(unittest.TestCase):
         dm.tpc_abort.assert_called_once_with(transaction)
         dm.tpc_finish.assert_not_called()
 
+    def test_replica(self):
+        "Test readonly transactions after a commit stay on the primary"
+        Database = backend.get('Database')
+        Transaction._commits.clear()
+
+        def replica():
+            with patch.object(Database, 'get_connection',
+                    autospec=True,
+                    side_effect=Database.get_connection) as get_connection:
+                empty_transaction(DB_NAME, USER, readonly=True)
+            return get_connection.call_args[1]['replica']
+
+        self.assertTrue(replica())
+
+        with Transaction().start(DB_NAME, USER, context=CONTEXT):
+            pass
+        self.assertFalse(replica())
+
+        with patch.object(Transaction, '_commits', {}):
+            self.assertTrue(replica())
+
+    def test_replica_flag(self):
+        "Test the transactions on a replica are flagged"
+        Database = backend.get('Database')
+
+        with patch.object(Database, 'is_replica', return_value=True):
+            with Transaction().start(DB_NAME, USER, readonly=True) \
+                    as transaction:
+                self.assertTrue(transaction.replica)
+        with Transaction().start(DB_NAME, USER, readonly=True) as transaction:
+            self.assertFalse(transaction.replica)
+
 
 def suite():
     return unittest.TestLoader().loadTestsFromTestCase(TransactionTestCase)
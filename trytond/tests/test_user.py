@@ -2,8 +2,14 @@
 # repository contains the full copyright notices and license terms.
 
 import unittest
-from trytond.tests.test_tryton import activate_module, with_transaction
+from mock import patch
+
+from trytond.tests.test_tryton import activate_module, with_transaction, \
+    DB_NAME
 from trytond.pool import Pool
+from trytond.transaction import Transaction
+from trytond import security
+from trytond.exceptions import RateLimitException
 from trytond.res.user import bcrypt
 from trytond.config import config
 
@@ -79,6 +85,44 @@ class UserTestCase(unittest.TestCase):
         user = self.create_user('user', '12345')
         self.assertIsNone(user.password_hash)
 
+    def test_verify_cache(self):
+        'Test verified credentials cache'
+        with Transaction().start(DB_NAME, 0) as transaction:
+            user = self.create_user('cached', '12345')
+            transaction.commit()
+        parameters = {'password': '12345'}
+
+        with patch('trytond.security.login', wraps=security.login) as login:
+            self.assertEqual(
+                security.verify(DB_NAME, 'cached', parameters), user.id)
+            self.assertEqual(
+                security.verify(DB_NAME, 'cached', parameters), user.id)
+            self.assertEqual(login.call_count, 1)
+
+            with Transaction().start(DB_NAME, 0) as transaction:
+                User = Pool().get('res.user')
+                User.write([User(user.id)], {
+                        'password': 'changed',
+                        })
+                transaction.commit()
+            self.assertFalse(security.verify(DB_NAME, 'cached', parameters))
+            self.assertEqual(login.call_count, 2)
+
+    def test_login_throttle(self):
+        'Test login throttled after failure'
+        with Transaction().start(DB_NAME, 0) as transaction:
+            self.create_user('throttled', '12345')
+            transaction.commit()
+
+        self.assertFalse(security.login(DB_NAME, 'throttled', {
+                    'password': 'wrong',
+                    }, cache=False))
+        with self.assertRaises(RateLimitException) as cm:
+            security.login(DB_NAME, 'throttled', {
+                    'password': '12345',
+                    }, cache=False)
+        self.assertGreater(cm.exception.retry_after, 0)
+
 
 def suite():
     return unittest.TestLoader().loadTestsFromTestCase(UserTestCase)
@@ -0,0 +1,189 @@
+# This file is part of Tryton.  The COPYRIGHT file at the top level of
+# this repository contains the full copyright notices and license terms.
+import gzip
+import unittest
+import zlib
+from io import BytesIO
+
+from mock import MagicMock, patch
+from werkzeug.test import Client
+from werkzeug.wrappers import BaseResponse
+
+from trytond import timing
+from trytond.config import config
+from trytond.protocols.dispatcher import ResultStream
+from trytond.wsgi import TrytondWSGI
+
+
+class WSGICompressionTestCase(unittest.TestCase):
+    "Test WSGI response compression"
+
+    def setUp(self):
+        self.app = TrytondWSGI()
+        self.data = b'foo' * 1000
+
+        @self.app.route('/')
+        def index(request):
+            return self.data
+        self.client = Client(self.app, BaseResponse)
+
+    def test_gzip(self):
+        "Test gzip compression"
+        response = self.client.get('/', headers={
+                'Accept-Encoding': 'gzip, deflate',
+                })
+
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response.headers['Vary'])
+        self.assertLess(len(response.data), len(self.data))
+        self.assertEqual(
+            gzip.GzipFile(fileobj=BytesIO(response.data)).read(), self.data)
+
+    def test_deflate(self):
+        "Test deflate compression"
+        response = self.client.get('/', headers={
+                'Accept-Encoding': 'deflate',
+                })
+
+        self.assertEqual(response.headers['Content-Encoding'], 'deflate')
+        self.assertEqual(zlib.decompress(response.data), self.data)
+
+    def test_not_accepted(self):
+        "Test no compression without Accept-Encoding"
+        response = self.client.get('/')
+
+        self.assertNotIn('Content-Encoding', response.headers)
+        self.assertEqual(response.data, self.data)
+
+    def test_threshold(self):
+        "Test no compression below the threshold"
+        self.data = b'foo'
+        response = self.client.get('/', headers={
+                'Accept-Encoding': 'gzip',
+                })
+
+        self.assertNotIn('Content-Encoding', response.headers)
+        self.assertEqual(response.data, self.data)
+
+    def test_disabled(self):
+        "Test compression disabled"
+        level = config.get('web', 'compression_level')
+        config.set('web', 'compression_level', '0')
+        self.addCleanup(config.set, 'web', 'compression_level', level)
+        response = self.client.get('/', headers={
+                'Accept-Encoding': 'gzip',
+                })
+
+        self.assertNotIn('Content-Encoding', response.headers)
+
+
+class WSGITimingTestCase(unittest.TestCase):
+    "Test WSGI Server-Timing"
+
+    def setUp(self):
+        self.app = TrytondWSGI()
+
+        @self.app.route('/')
+        def index(request):
+            with timing.phase('method'):
+                pass
+            return b'foo'
+        self.client = Client(self.app, BaseResponse)
+
+    def test_header(self):
+        "Test Server-Timing header"
+        config.set('web', 'server_timing', 'True')
+        self.addCleanup(config.set, 'web', 'server_timing', 'False')
+        response = self.client.get('/')
+
+        metrics = [m.split(';')[0]
+            for m in response.headers['Server-Timing'].split(', ')]
+        self.assertEqual(metrics, ['method', 'encode', 'db', 'total'])
+        self.assertIn('db;dur=0.0;desc="0 queries"',
+            response.headers['Server-Timing'])
+
+    def test_disabled(self):
+        "Test Server-Timing disabled by default"
+        response = self.client.get('/')
+
+        self.assertNotIn('Server-Timing', response.headers)
+
+    def test_query(self):
+        "Test queries recorded only between start and stop"
+        query = timing.query(lambda: None)
+
+        query()
+        timing.start()
+        query()
+        query()
+        name, _, count = timing.stop()[-2]
+
+        self.assertEqual((name, count), ('db', 2))
+
+
+class WSGIStreamTestCase(unittest.TestCase):
+    "Test WSGI streamed result"
+
+    def setUp(self):
+        self.app = TrytondWSGI()
+        self.transaction = MagicMock()
+
+        @self.app.route('/')
+        def index(request):
+            return ResultStream(
+                self.transaction, b'foo', iter([b'bar']), '', ())
+        self.client = Client(self.app, BaseResponse)
+
+    def test_iterate(self):
+        "Test the transaction is closed at the end of the stream"
+        response = self.client.get('/')
+
+        self.assertEqual(response.data, b'foobar')
+        self.transaction.__exit__.assert_called_once_with(None, None, None)
+
+    def test_close_unstarted(self):
+        "Test the transaction is closed when the stream is not iterated"
+        stream = ResultStream(self.transaction, b'foo', iter([]), '', ())
+        stream.close()
+        stream.close()
+
+        self.transaction.__exit__.assert_called_once_with(None, None, None)
+        self.assertEqual(list(stream), [])
+
+    def test_call_on_close(self):
+        "Test the callbacks are called only after a successful stream"
+        callback = MagicMock()
+        stream = ResultStream(self.transaction, b'foo', iter([]), '', ())
+        stream.call_on_close(callback)
+        self.assertEqual(list(stream), [b'foo'])
+        stream.close()
+        callback.assert_called_once_with()
+
+        callback.reset_mock()
+        stream = ResultStream(
+            self.transaction, b'foo', iter(MagicMock(side_effect=ValueError),
+                None), '', ())
+        stream.call_on_close(callback)
+        next(stream)
+        with patch('trytond.protocols.dispatcher._log_error'), \
+                self.assertRaises(ValueError):
+            next(stream)
+        stream.close()
+        self.assertFalse(callback.called)
+
+    def test_response_error(self):
+        "Test the transaction is closed when the response fails"
+        with patch.object(self.app, 'server_timing', side_effect=ValueError):
+            with self.assertRaises(ValueError):
+                self.client.get('/')
+
+        self.transaction.__exit__.assert_called_once_with(None, None, None)
+
+
+def suite():
+    func = unittest.TestLoader().loadTestsFromTestCase
+    suite = unittest.TestSuite()
+    for testcase in (WSGICompressionTestCase, WSGITimingTestCase,
+            WSGIStreamTestCase):
+        suite.addTests(func(testcase))
+    return suite
@@ -0,0 +1,101 @@
+# This file is part of Tryton.  The COPYRIGHT file at the top level of
+# this repository contains the full copyright notices and license terms.
+"""
+Timings of the phases of a request.
+
+The timings are recorded per thread between start and stop. The phases with
+the same name are added up and the queries are counted by the cursors.
+"""
+import logging
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from functools import wraps
+from threading import local
+
+__all__ = ['start', 'stop', 'phase', 'query', 'header', 'log']
+
+logger = logging.getLogger(__name__)
+
+
+class _Local(local):
+
+    def __init__(self):
+        self.start = None
+        self.phases = None
+        self.queries = 0
+        self.queries_time = 0.
+
+
+_local = _Local()
+
+
+def start():
+    "Start to record the timings of the current thread"
+    _local.start = time.time()
+    _local.phases = OrderedDict()
+    _local.queries = 0
+    _local.queries_time = 0.
+
+
+def stop():
+    """
+    Stop the recording and return the list of (name, duration, count)
+    with the durations in milliseconds and the count of the queries.
+    """
+    if _local.start is None:
+        return []
+    timings = [(n, d * 1000, None) for n, d in _local.phases.iteritems()]
+    timings.append(('db', _local.queries_time * 1000, _local.queries))
+    timings.append(('total', (time.time() - _local.start) * 1000, None))
+    _local.start = None
+    _local.phases = None
+    return timings
+
+
+@contextmanager
+def phase(name):
+    "Add the duration of the block to the phase"
+    begin = time.time()
+    try:
+        yield
+    finally:
+        if _local.start is not None:
+            phases = _local.phases
+            phases[name] = phases.get(name, 0) + time.time() - begin
+
+
+def query(func):
+    "Decorate the execute method of a cursor to record the queries"
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        if _local.start is None:
+            return func(*args, **kwargs)
+        begin = time.time()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _local.queries += 1
+            _local.queries_time += time.time() - begin
+    return wrapper
+
+
+def header(timings):
+    "Return the value of the Server-Timing header"
+    metrics = []
+    for name, duration, count in timings:
+        metric = '%s;dur=%.1f' % (name, duration)
+        if count is not None:
+            metric += ';desc="%s queries"' % count
+        metrics.append(metric)
+    return ', '.join(metrics)
+
+
+def log(method, status, timings):
+    "Log the timings of the request as key=value pairs"
+    items = ['rpc_method=%s' % method, 'status=%s' % status]
+    for name, duration, count in timings:
+        items.append('%s=%.1f' % (name, duration))
+        if count is not None:
+            items.append('%s_count=%s' % (name, count))
+    logger.info(' '.join(items))
@@ -1,6 +1,7 @@
 # This file is part of Tryton.  The COPYRIGHT file at the top level of
 # this repository contains the full copyright notices and license terms.
 import logging
+import time
 from threading import local
 from sql import Flavor
 
@@ -39,12 +40,17 @@ class Transaction(object):
     '''
 
     _local = _Local()
+    # (database name, user) -> time of the last commit
+    _commits = {}
 
     cache_keys = {'language', 'fuzzy_translation', '_datetime',
         '_datetime_exclude'}
 
     database = None
     readonly = False
+    replica = False
+    # The timestamps of ir_cache read on the replica
+    replica_cache_timestamps = None
     connection = None
     close = None
     user = None
@@ -53,6 +59,8 @@ class Transaction(object):
     delete_records = None
     delete = None  # TODO check to merge with delete_records
     timestamp = None
+    _context_keys = None
+    _context_keys_context = None
 
     def __new__(cls, new=False):
         transactions = cls._local.transactions
@@ -72,6 +80,27 @@ class Transaction(object):
         return self.cache.setdefault((self.user, keys),
             LRUDict(config.getint('cache', 'model')))
 
+    def context_key(self, keys=None):
+        '''
+        Return a hashable fingerprint of the context restricted to keys.
+        It is memoized until the context is replaced by set_context,
+        reset_context or set_user.
+        '''
+        context = self.context
+        if self._context_keys_context is not context:
+            self._context_keys = {}
+            self._context_keys_context = context
+        try:
+            return self._context_keys[keys]
+        except KeyError:
+            from trytond.cache import freeze
+            if keys is None:
+                value = freeze(context)
+            else:
+                value = freeze({k: context[k] for k in keys if k in context})
+            self._context_keys[keys] = value
+            return value
+
     def start(self, database_name, user, readonly=False, context=None,
             close=False, autocommit=False):
         '''
@@ -90,8 +119,17 @@ class Transaction(object):
         self.user = user
         self.database = database
         self.readonly = readonly
+        # The readonly transactions of a user who has just committed are
+        # kept on the primary until the replicas have caught up
+        replica = readonly and (time.time()
+            - self._commits.get((database.name, user), 0)
+            >= config.getint('database', 'replica_delay'))
         self.connection = database.get_connection(readonly=readonly,
-            autocommit=autocommit)
+            autocommit=autocommit, replica=replica)
+        # The values read from a lagging replica must not fill shared caches
+        # unless it has replayed the resets of the caches
+        self.replica = database.is_replica(self.connection)
+        self.replica_cache_timestamps = None
         self.close = close
         self.context = context or {}
         self.create_records = {}
@@ -121,6 +159,8 @@ class Transaction(object):
                 finally:
                     self.database = None
                     self.readonly = False
+                    self.replica = False
+                    self.replica_cache_timestamps = None
                     self.connection = None
                     self.close = None
                     self.user = None
@@ -130,6 +170,8 @@ class Transaction(object):
                     self.delete = None
                     self.timestamp = None
                     self._datamanagers = []
+                    self._context_keys = None
+                    self._context_keys_context = None
         finally:
             current_instance = transactions.pop()
         assert current_instance is self, transactions
@@ -183,6 +225,8 @@ class Transaction(object):
                 for datamanager in self._datamanagers:
                     datamanager.tpc_vote(self)
             self.connection.commit()
+            if not self.readonly:
+                self._commits[(self.database.name, self.user)] = time.time()
         except:
             self.rollback()
             raise
@@ -1,29 +1,58 @@
 # This file is part of Tryton.  The COPYRIGHT file at the top level of
 # this repository contains the full copyright notices and license terms.
 import logging
+import math
 import sys
 import traceback
+import zlib
+from collections import Iterator
 
 from werkzeug.wrappers import Response
 from werkzeug.routing import Map, Rule
-from werkzeug.exceptions import abort, HTTPException, InternalServerError
+from werkzeug.exceptions import abort, HTTPException, InternalServerError, \
+    TooManyRequests as _TooManyRequests
 
 import wrapt
 
+from trytond import timing
 from trytond.protocols.wrappers import Request
 from trytond.protocols.jsonrpc import JSONProtocol
 from trytond.protocols.xmlrpc import XMLProtocol
+from trytond.protocols.msgpackrpc import MsgPackProtocol
+from trytond.config import config
+from trytond.exceptions import RateLimitException
 
 __all__ = ['TrytondWSGI', 'app']
 
 logger = logging.getLogger(__name__)
 
 
+class TooManyRequests(_TooManyRequests):
+    "Too many requests with the delay to retry in the header"
+
+    def __init__(self, retry_after):
+        super(TooManyRequests, self).__init__()
+        self.retry_after = int(math.ceil(retry_after))
+
+    def get_headers(self, environ=None):
+        headers = super(TooManyRequests, self).get_headers(environ)
+        headers.append(('Retry-After', str(self.retry_after)))
+        return headers
+
+
+def format_traceback():
+    "Return the traceback of the current exception without the sys.path"
+    tb_s = ''.join(traceback.format_exception(*sys.exc_info()))
+    for path in sys.path:
+        tb_s = tb_s.replace(path, '')
+    return tb_s
+
+
 class TrytondWSGI(object):
 
     def __init__(self):
         self.url_map = Map([])
-        self.protocols = [JSONProtocol, XMLProtocol]
+        self.protocols = [JSONProtocol, XMLProtocol, MsgPackProtocol]
         self.error_handlers = []
 
     def route(self, string, methods=None):
@@ -35,7 +64,9 @@ class TrytondWSGI(object):
     @wrapt.decorator
     def auth_required(self, wrapped, instance, args, kwargs):
         request = args[0]
-        if request.user_id:
+        with timing.phase('auth'):
+            user_id = request.user_id
+        if user_id:
             return wrapped(*args, **kwargs)
         else:
             abort(303)
@@ -47,11 +78,10 @@ class TrytondWSGI(object):
             return endpoint(request, **request.view_args)
         except HTTPException, e:
             return e
+        except RateLimitException, e:
+            return TooManyRequests(e.retry_after)
         except Exception, e:
-            tb_s = ''.join(traceback.format_exception(*sys.exc_info()))
-            for path in sys.path:
-                tb_s = tb_s.replace(path, '')
-            e.__format_traceback__ = tb_s
+            e.__format_traceback__ = format_traceback()
             response = e
             for error_handler in self.error_handlers:
                 rv = error_handler(e)
@@ -60,6 +90,7 @@ class TrytondWSGI(object):
             return response
 
     def wsgi_app(self, environ, start_response):
+        timing.start()
         for cls in self.protocols:
             if cls.content_type in environ.get('CONTENT_TYPE', ''):
                 request = cls.request(environ)
@@ -67,6 +98,28 @@ class TrytondWSGI(object):
         else:
             request = Request(environ)
         data = self.dispatch_request(request)
+        # A streamed result keeps its transaction open until it is closed
+        close = None
+        if isinstance(data, Iterator):
+            close = getattr(data, 'close', None)
+        try:
+            with timing.phase('encode'):
+                response = self.make_response(request, data)
+            if isinstance(response, Response):
+                response = self.compress(request, response)
+            self.server_timing(request, response)
+            if close and isinstance(response, Response):
+                response.call_on_close(close)
+                close = None
+        finally:
+            if close:
+                close()
+        # TODO custom process response
+        return response(environ, start_response)
+
+    def make_response(self, request, data):
+        "Return the response of the data in the protocol of the request"
+        environ = request.environ
         if not isinstance(data, (Response, HTTPException)):
             for cls in self.protocols:
                 for mimetype in request.accept_mimetypes:
@@ -88,8 +141,63 @@ class TrytondWSGI(object):
                         response = Response(data)
         else:
             response = data
-        # TODO custom process response
-        return response(environ, start_response)
+        return response
+
+    def server_timing(self, request, response):
+        "Send the timings of the request in the Server-Timing header"
+        timings = timing.stop()
+        if not timings:
+            return
+        if (isinstance(response, Response)
+                and config.getboolean('web', 'server_timing')):
+            response.headers['Server-Timing'] = timing.header(timings)
+        if config.getboolean('web', 'timing_log'):
+            try:
+                method = 'batch' if request.rpc_batch else request.rpc_method
+            except Exception:
+                method = None
+            if isinstance(response, Response):
+                status = response.status_code
+            else:
+                status = response.code
+            timing.log(method or request.path, status, timings)
+
+    def compress(self, request, response):
+        "Compress the response with the encoding accepted by the request"
+        level = config.getint('web', 'compression_level')
+        if (not level
+                or response.status_code < 200
+                or response.status_code in {204, 304}
+                or 'Content-Encoding' in response.headers):
+            return response
+        for encoding in ('gzip', 'deflate'):
+            if request.accept_encodings[encoding]:
+                break
+        else:
+            return response
+        if not response.is_streamed:
+            length = response.calculate_content_length()
+            if length < config.getint('web', 'compression_threshold'):
+                return response
+        # gzip has a header and deflate is the zlib format
+        wbits = zlib.MAX_WBITS | (16 if encoding == 'gzip' else 0)
+
+        def generate(chunks):
+            compressor = zlib.compressobj(level, zlib.DEFLATED, wbits)
+            try:
+                for chunk in chunks:
+                    data = compressor.compress(chunk)
+                    if data:
+                        yield data
+                yield compressor.flush()
+            finally:
+                if hasattr(chunks, 'close'):
+                    chunks.close()
+        response.response = generate(response.iter_encoded())
+        response.headers['Content-Encoding'] = encoding
+        response.headers.pop('Content-Length', None)
+        response.vary.add('Accept-Encoding')
+        return response
 
     def __call__(self, environ, start_response):
         return self.wsgi_app(environ, start_response)